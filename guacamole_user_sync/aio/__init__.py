@@ -0,0 +1,24 @@
+"""Run LDAP and PostgreSQL operations concurrently on an event loop."""
+
+from typing import TYPE_CHECKING
+
+from guacamole_user_sync.lazy_import import lazy_attributes
+
+if TYPE_CHECKING:
+    from .async_ldap_client import AsyncLDAPClient
+    from .async_postgresql_client import AsyncPostgreSQLClient
+
+__all__ = [
+    "AsyncLDAPClient",
+    "AsyncPostgreSQLClient",
+]
+
+# Submodules are imported on first use, as only asynchronous synchronisation
+# needs asyncio and the SQLAlchemy asyncio extension
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "AsyncLDAPClient": "async_ldap_client",
+        "AsyncPostgreSQLClient": "async_postgresql_client",
+    },
+)
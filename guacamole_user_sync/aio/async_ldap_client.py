@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Sequence
+
+from guacamole_user_sync.ldap.entry_parser import GROUP_ATTRIBUTES, USER_ATTRIBUTES
+from guacamole_user_sync.models import LDAPGroup, LDAPQuery, LDAPUser
+from guacamole_user_sync.sources import DirectorySource
+
+
+class AsyncLDAPClient:
+    """Asynchronous wrapper around an LDAPClient or another directory source.
+
+    ldap3 has no asyncio support, so each search runs in a worker thread. Searches
+    still share the client's server selection, connection handling and cache.
+    """
+
+    def __init__(self, client: DirectorySource) -> None:
+        self.client = client
+
+    async def search_groups(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = GROUP_ATTRIBUTES,
+    ) -> list[LDAPGroup]:
+        return await asyncio.to_thread(
+            self.client.search_groups,
+            query,
+            attributes=attributes,
+        )
+
+    async def search_users(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = USER_ATTRIBUTES,
+    ) -> list[LDAPUser]:
+        return await asyncio.to_thread(
+            self.client.search_users,
+            query,
+            attributes=attributes,
+        )
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections.abc import Callable, Collection
+from typing import TypeVar
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from guacamole_user_sync.models import (
+    LDAPGroup,
+    LDAPUser,
+    PostgreSQLError,
+    SyncPhase,
+)
+from guacamole_user_sync.postgresql import PostgreSQLClient, SchemaVersion
+
+logger = logging.getLogger("guacamole_user_sync")
+
+T = TypeVar("T")
+
+
+class AsyncPostgreSQLClient:
+    """Asynchronous wrapper around a PostgreSQLClient.
+
+    Operations run on an async engine using psycopg's async driver. Each one uses
+    its own session and connection, so independent operations can overlap on one
+    event loop while sharing the synchronous client's update logic.
+    """
+
+    def __init__(self, client: PostgreSQLClient) -> None:
+        self.client = client
+        self._engine: AsyncEngine | None = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if not self._engine:
+            self._engine = create_async_engine(
+                self.client.backend.connection_details.url,
+                echo=False,
+                **self.client.backend.pool_options.engine_options,
+            )
+        return self._engine
+
+    async def acquire_leadership(self) -> bool:
+        return await asyncio.to_thread(self.client.acquire_leadership)
+
+    async def dispose(self) -> None:
+        """Close every pooled connection."""
+        if self._engine:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def ensure_schema(self, schema_version: SchemaVersion) -> None:
+        await self.run(lambda client: client.ensure_schema(schema_version))
+
+    async def run(self, operation: Callable[[PostgreSQLClient], T]) -> T:
+        """Run a synchronous client operation in its own async session."""
+        try:
+            async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                return await session.run_sync(
+                    lambda sync_session: operation(self.client.bind(sync_session)),
+                )
+        except SQLAlchemyError as exc:
+            msg = "Unable to run PostgreSQL operation."
+            raise PostgreSQLError(msg) from exc
+
+    async def update(
+        self,
+        *,
+        groups: list[LDAPGroup],
+        users: list[LDAPUser],
+        phases: Collection[SyncPhase] = tuple(SyncPhase),
+    ) -> int:
+        """Update the relevant tables to match lists of LDAP users and groups.
+
+        Groups and users are updated concurrently. Memberships and permissions depend
+        on both, so they are updated afterwards, followed by any purge of disabled
+        users.
+        """
+
+        async def update_phase(phase: SyncPhase) -> int:
+            return await self.run(
+                lambda client: client.update(
+                    groups=groups,
+                    users=users,
+                    phases={phase},
+                ),
+            )
+
+        n_changes = sum(
+            await asyncio.gather(
+                *(
+                    update_phase(phase)
+                    for phase in (SyncPhase.GROUPS, SyncPhase.USERS)
+                    if phase in phases
+                ),
+            ),
+        )
+        if SyncPhase.MEMBERSHIPS in phases:
+            n_changes += await update_phase(SyncPhase.MEMBERSHIPS)
+        if SyncPhase.PURGE in phases:
+            n_changes += await self.run(
+                lambda client: client.purge_disabled_users(),
+            )
+        return n_changes
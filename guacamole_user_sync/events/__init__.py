@@ -0,0 +1,11 @@
+"""Report the changes applied by each synchronisation."""
+
+from .event_emitter import EventEmitter
+from .event_sinks import EventSink, JSONLinesSink, UnixSocketSink
+
+__all__ = [
+    "EventEmitter",
+    "EventSink",
+    "JSONLinesSink",
+    "UnixSocketSink",
+]
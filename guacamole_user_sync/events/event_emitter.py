@@ -0,0 +1,105 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Iterable
+
+from guacamole_user_sync.models import ChangeEvent
+
+from .event_sinks import EventSink
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class EventEmitter:
+    """Deliver change events to a sink in batches from a background thread.
+
+    Events wait in a queue holding at most max_queued of them. When it is full,
+    each call to emit blocks for up to put_timeout seconds in total, so that a
+    synchronisation slows to the pace of the sink, and then drops the rest of its
+    events with a warning rather than stall.
+    A batch is delivered once it has batch_size events or its first event has
+    waited for flush_interval seconds.
+    """
+
+    def __init__(
+        self,
+        sink: EventSink,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queued: int = 10000,
+        put_timeout: float = 30.0,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.n_dropped = 0
+        self.put_timeout = put_timeout
+        self.queue: queue.Queue[ChangeEvent | None] = queue.Queue(max_queued)
+        self.sink = sink
+        self.thread = threading.Thread(
+            target=self.run,
+            name="guacamole-user-sync-events",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def close(self) -> None:
+        """Deliver any queued events, then stop the thread and close the sink."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.sink.close()
+
+    def deliver(self, batch: list[ChangeEvent]) -> None:
+        try:
+            self.sink.write(batch)
+        except OSError:
+            logger.warning("Unable to deliver %s change event(s).", len(batch))
+
+    def emit(self, events: Iterable[ChangeEvent]) -> None:
+        """Queue events for delivery, waiting while the queue is full."""
+        deadline = time.monotonic() + self.put_timeout
+        n_dropped = 0
+        for event in events:
+            try:
+                if (remaining := deadline - time.monotonic()) > 0:
+                    self.queue.put(event, timeout=remaining)
+                else:
+                    self.queue.put_nowait(event)
+            except queue.Full:
+                n_dropped += 1
+        if n_dropped:
+            self.n_dropped += n_dropped
+            logger.warning(
+                "Change event queue is full, dropped %s event(s), %s so far.",
+                n_dropped,
+                self.n_dropped,
+            )
+
+    def flush(self) -> None:
+        """Wait until every queued event has been delivered."""
+        self.queue.join()
+
+    def run(self) -> None:
+        while (event := self.queue.get()) is not None:
+            batch = [event]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get(
+                        timeout=max(deadline - time.monotonic(), 0),
+                    )
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            self.deliver(batch)
+            for _ in range(len(batch) + stopping):
+                self.queue.task_done()
+            if stopping:
+                return
+        self.queue.task_done()
@@ -0,0 +1,85 @@
+import json
+import socket
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Protocol
+
+from guacamole_user_sync.models import ChangeEvent
+
+
+def json_lines(events: Sequence[ChangeEvent]) -> bytes:
+    """Serialise events as compact JSON lines."""
+    return "".join(
+        json.dumps(event.as_dict(), separators=(",", ":")) + "\n" for event in events
+    ).encode("utf-8")
+
+
+class EventSink(Protocol):
+    """Somewhere that batches of change events can be delivered.
+
+    Sinks are only called from one thread at a time, and may raise OSError if an
+    event batch cannot be delivered.
+    """
+
+    def close(self) -> None: ...
+
+    def write(self, events: Sequence[ChangeEvent]) -> None: ...
+
+
+class JSONLinesSink:
+    """Append change events to a file as JSON lines."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def close(self) -> None:
+        pass
+
+    def write(self, events: Sequence[ChangeEvent]) -> None:
+        # Each batch is appended with a single write so that lines never interleave
+        with self.path.open("ab") as f_events:
+            f_events.write(json_lines(events))
+
+
+class UnixSocketSink:
+    """Send change events as JSON lines to a listening Unix stream socket.
+
+    The connection is opened on the first batch and reopened once if it fails, for
+    example because the consumer restarted. A consumer that stops reading for
+    `timeout` seconds is treated as failed too.
+    """
+
+    def __init__(self, path: Path, *, timeout: float = 10.0) -> None:
+        self.path = path
+        self.socket: socket.socket | None = None
+        self.timeout = timeout
+
+    def close(self) -> None:
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def connect(self) -> socket.socket:
+        if not self.socket:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(str(self.path))
+            except OSError:
+                connection.close()
+                raise
+            self.socket = connection
+        return self.socket
+
+    def write(self, events: Sequence[ChangeEvent]) -> None:
+        payload = json_lines(events)
+        try:
+            self.connect().sendall(payload)
+        except OSError:
+            # Includes TimeoutError, after which part of a line may have been sent
+            self.close()
+            try:
+                self.connect().sendall(payload)
+            except OSError:
+                self.close()
+                raise
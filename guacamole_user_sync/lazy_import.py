@@ -0,0 +1,27 @@
+import sys
+from collections.abc import Callable, Mapping
+from typing import Any
+
+
+def lazy_attributes(
+    package: str,
+    submodules: Mapping[str, str],
+) -> Callable[[str], Any]:
+    """Return a module __getattr__ that imports each exported name on first use.
+
+    `submodules` maps every exported name to the submodule that defines it, so that
+    importing a package does not import its dependencies until they are needed.
+    """
+    namespace = sys.modules[package].__dict__
+
+    def __getattr__(name: str) -> Any:  # noqa: ANN401, N807
+        if name not in submodules:
+            msg = f"module {package!r} has no attribute {name!r}"
+            raise AttributeError(msg)
+        # Unlike importlib.import_module, __import__ is reported by -X importtime
+        module = __import__(f"{package}.{submodules[name]}", fromlist=[name])
+        value = getattr(module, name)
+        namespace[name] = value
+        return value
+
+    return __getattr__
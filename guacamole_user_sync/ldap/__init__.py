@@ -1,7 +1,32 @@
 """Interact with the LDAP server."""
 
-from .ldap_client import LDAPClient
+from typing import TYPE_CHECKING
+
+from guacamole_user_sync.lazy_import import lazy_attributes
+
+if TYPE_CHECKING:
+    from .entry_parser import InterningSource, LDAPEntryParser
+    from .ldap_client import LDAPClient
+    from .search_cache import LDAPSearchCache
+    from .server_selector import LDAPServerSelector
 
 __all__ = [
+    "InterningSource",
     "LDAPClient",
+    "LDAPEntryParser",
+    "LDAPSearchCache",
+    "LDAPServerSelector",
 ]
+
+# Submodules are imported on first use, so that ldap3 is only imported when an
+# LDAP server is used
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "InterningSource": "entry_parser",
+        "LDAPClient": "ldap_client",
+        "LDAPEntryParser": "entry_parser",
+        "LDAPSearchCache": "search_cache",
+        "LDAPServerSelector": "server_selector",
+    },
+)
@@ -0,0 +1,64 @@
+import logging
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from types import TracebackType
+
+from ldap3 import Connection
+from ldap3.core.exceptions import LDAPException
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class LDAPConnectionPool:
+    """Share LDAP connections between the threads working on a single search."""
+
+    def __init__(self, connect: Callable[[], Connection]) -> None:
+        self._connect = connect
+        self._idle: list[Connection] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "LDAPConnectionPool":
+        """Use the pool for the duration of a search."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close idle connections at the end of a search."""
+        self.clear()
+
+    def clear(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.close(connection)
+
+    @staticmethod
+    def close(connection: Connection) -> None:
+        try:
+            connection.unbind()
+        except LDAPException:
+            logger.debug("Ignoring error while closing LDAP connection.")
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """Borrow a connection, opening a new one if none are idle.
+
+        Connections that raise an exception are closed instead of being returned.
+        """
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = self._connect()
+        try:
+            yield connection
+        except BaseException:
+            self.close(connection)
+            raise
+        with self._lock:
+            self._idle.append(connection)
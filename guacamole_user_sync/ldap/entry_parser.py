@@ -0,0 +1,180 @@
+import logging
+import sys
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from guacamole_user_sync.models import InternTable, LDAPGroup, LDAPQuery, LDAPUser
+
+logger = logging.getLogger("guacamole_user_sync")
+
+# Attributes requested in addition to the name of each group or user
+GROUP_ATTRIBUTES = ("memberOf", "memberUid")
+USER_ATTRIBUTES = ("displayName", "mail", "memberOf", "o", "title", "uid")
+
+
+class InterningSource:
+    """Intern the strings of the groups and users read from a directory source."""
+
+    def __init__(self, *, intern_table: InternTable | None = None) -> None:
+        self.intern_table = intern_table
+
+    def intern(self, value: str) -> str:
+        """Intern a string, using the shared intern table if there is one."""
+        if self.intern_table is not None:
+            return self.intern_table.intern(value)
+        return sys.intern(value)
+
+    def intern_all(self, values: Iterable[str]) -> Sequence[str]:
+        """Intern a sequence of strings, as an array of IDs if there is a table."""
+        if self.intern_table is not None:
+            return self.intern_table.array(values)
+        return [sys.intern(value) for value in values]
+
+    @contextmanager
+    def reuse_results(self) -> Iterator[None]:
+        """Reuse the results of identical searches until the context exits.
+
+        Results are not reused unless a subclass caches them.
+        """
+        yield
+
+
+class LDAPEntryParser(InterningSource, ABC):
+    """Convert raw LDAP entries into groups and users.
+
+    Each entry is a dictionary with its "dn" and "raw_attributes", as found in an
+    ldap3 connection response. Subclasses provide the entries matching a query by
+    implementing search.
+    """
+
+    @staticmethod
+    def decode_values(entry: dict[str, Any], attribute: str) -> list[str]:
+        """Decode the raw values of an attribute."""
+        return [
+            value.decode("utf-8")
+            for value in entry["raw_attributes"].get(attribute, [])
+        ]
+
+    @classmethod
+    def first_value(cls, entry: dict[str, Any], attribute: str) -> str:
+        """Decode the first raw value of an attribute, or return an empty string."""
+        return next(iter(cls.decode_values(entry, attribute)), "")
+
+    def interned_values(self, entry: dict[str, Any], attribute: str) -> Sequence[str]:
+        """Decode the raw values of an attribute into interned strings.
+
+        With a shared intern table the values are stored as an array of integer IDs.
+        """
+        return self.intern_all(self.decode_values(entry, attribute))
+
+    def mapped_values(
+        self,
+        entry: dict[str, Any],
+        query: LDAPQuery,
+    ) -> dict[str, str]:
+        """Return the Guacamole attributes mapped from an entry's LDAP attributes.
+
+        Every mapped attribute is included, with an empty string if it is missing.
+        """
+        return {
+            self.intern(name): self.first_value(entry, ldap_attribute)
+            for ldap_attribute, name in query.attribute_map
+        }
+
+    @abstractmethod
+    def search(
+        self,
+        query: LDAPQuery,
+        attributes: list[str] | None = None,
+    ) -> Iterable[dict[str, Any]]:
+        """Return the raw entries matching a query, with the given attributes."""
+
+    def search_groups(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = GROUP_ATTRIBUTES,
+    ) -> list[LDAPGroup]:
+        """Search for groups, requesting only their name and the given attributes.
+
+        Attributes that are not requested are left empty. Attributes in the query's
+        attribute map are always requested.
+        """
+        return self.parse_groups(
+            self.search(query, [query.id_attr, *attributes, *query.mapped_attributes]),
+            query,
+        )
+
+    def search_users(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = USER_ATTRIBUTES,
+    ) -> list[LDAPUser]:
+        """Search for users, requesting only their name and the given attributes.
+
+        Attributes that are not requested are left empty. Attributes in the query's
+        attribute map are always requested.
+        """
+        return self.parse_users(
+            self.search(query, [query.id_attr, *attributes, *query.mapped_attributes]),
+            query,
+        )
+
+    def parse_groups(
+        self,
+        entries: Iterable[dict[str, Any]],
+        query: LDAPQuery,
+    ) -> list[LDAPGroup]:
+        output = []
+        for entry in entries:
+            if not (name := self.first_value(entry, query.id_attr)):
+                logger.debug(
+                    "Skipping LDAP group %s with no %s",
+                    entry["dn"],
+                    query.id_attr,
+                )
+                continue
+            output.append(
+                LDAPGroup(
+                    member_of=self.interned_values(entry, "memberOf"),
+                    member_uid=self.interned_values(entry, "memberUid"),
+                    name=self.intern(name),
+                    attributes=self.mapped_values(entry, query),
+                ),
+            )
+            logger.debug("Found LDAP group %s", output[-1])
+        logger.debug("Loaded %s LDAP groups", len(output))
+        return output
+
+    def parse_users(
+        self,
+        entries: Iterable[dict[str, Any]],
+        query: LDAPQuery,
+    ) -> list[LDAPUser]:
+        output = []
+        for entry in entries:
+            if not (name := self.first_value(entry, query.id_attr)):
+                logger.debug(
+                    "Skipping LDAP user %s with no %s",
+                    entry["dn"],
+                    query.id_attr,
+                )
+                continue
+            output.append(
+                LDAPUser(
+                    display_name=self.first_value(entry, "displayName"),
+                    member_of=self.interned_values(entry, "memberOf"),
+                    name=self.intern(name),
+                    uid=self.intern(self.first_value(entry, "uid")),
+                    email_address=self.first_value(entry, "mail"),
+                    organization=self.intern(self.first_value(entry, "o")),
+                    organizational_role=self.intern(self.first_value(entry, "title")),
+                    attributes=self.mapped_values(entry, query),
+                ),
+            )
+            logger.debug("Found LDAP user %s", output[-1])
+        logger.debug("Loaded %s LDAP users", len(output))
+        return output
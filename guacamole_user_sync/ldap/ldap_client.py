@@ -1,60 +1,93 @@
 import logging
-from typing import cast
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, cast
 
-from ldap3 import ALL, ALL_ATTRIBUTES, Connection, Server
-from ldap3.abstract.entry import Entry
+from ldap3 import ALL_ATTRIBUTES, BASE, NONE, Connection, Server
 from ldap3.core.exceptions import (
     LDAPBindError,
+    LDAPCommunicationError,
     LDAPException,
-    LDAPSessionTerminatedByServerError,
     LDAPSocketOpenError,
 )
 
 from guacamole_user_sync.models import (
+    InternTable,
     LDAPError,
-    LDAPGroup,
     LDAPQuery,
-    LDAPUser,
 )
 
+from .connection_pool import LDAPConnectionPool
+from .entry_parser import LDAPEntryParser
+from .search_cache import LDAPSearchCache
+from .server_selector import LDAPServerSelector
+from .sort_control import server_side_sort_confirmed, server_side_sort_control
+
 logger = logging.getLogger("guacamole_user_sync")
 
+# Tag used by Active Directory when a multi-valued attribute is returned in ranges
+RANGE_TAG = ";range="
+
 
-class LDAPClient:
+class LDAPClient(LDAPEntryParser):
     """Client for connecting to an LDAP server."""
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
-        hostname: str,
+        hostname: str | Sequence[str],
         *,
         auto_bind: bool = True,
         bind_dn: str | None = None,
         bind_password: str | None = None,
+        cache: LDAPSearchCache | None = None,
+        check_interval: float = 60,
+        intern_table: InternTable | None = None,
+        range_workers: int = 4,
+        shard_workers: int = 4,
+        watermark_attr: str | None = None,
     ) -> None:
         self.auto_bind = auto_bind
         self.bind_dn = bind_dn
         self.bind_password = bind_password
-        self.server = Server(hostname, get_info=ALL)
-
-    @staticmethod
-    def as_list(ldap_entry: str | list[str] | None) -> list[str]:
-        if isinstance(ldap_entry, list):
-            return ldap_entry
-        if ldap_entry is None:
-            return []
-        if isinstance(ldap_entry, str):
-            return [ldap_entry]
-        msg = f"Unexpected input {ldap_entry} of type {type(ldap_entry)}"
-        raise ValueError(msg)
+        super().__init__(intern_table=intern_table)
+        self.cache = LDAPSearchCache() if cache is None else cache
+        self.range_workers = range_workers
+        self.shard_workers = shard_workers
+        self.watermark_attr = watermark_attr
+        # Results are parsed from raw attributes so the server schema is not needed
+        hostnames = [hostname] if isinstance(hostname, str) else hostname
+        self.selector = LDAPServerSelector(
+            [Server(name, get_info=NONE) for name in hostnames],
+            check_interval=check_interval,
+        )
+
+    @property
+    def server(self) -> Server:
+        return self.selector.preferred
 
     def connect(self) -> Connection:
-        logger.info("Initialising connection to LDAP host at %s", self.server.host)
+        """Connect to the preferred server, failing over to the others in turn."""
+        servers = self.selector.ordered()
+        for server in servers:
+            try:
+                return self.connect_to(server)
+            except LDAPError:
+                if server is servers[-1]:
+                    raise
+                self.selector.mark_failed(server)
+        msg = "No LDAP servers are configured."
+        raise LDAPError(msg)
+
+    def connect_to(self, server: Server) -> Connection:
+        logger.info("Initialising connection to LDAP host at %s", server.host)
         try:
             return Connection(
-                self.server,
+                server,
                 user=self.bind_dn,
                 password=self.bind_password,
                 auto_bind=self.auto_bind,
+                auto_range=False,
             )
         except LDAPSocketOpenError as exc:
             msg = "Server could not be reached."
@@ -69,51 +102,258 @@ class LDAPClient:
             logger.error(msg)  # noqa: TRY400
             raise LDAPError(msg) from exc
 
-    def search_groups(self, query: LDAPQuery) -> list[LDAPGroup]:
-        output = []
-        for entry in self.search(query):
-            output.append(
-                LDAPGroup(
-                    member_of=self.as_list(entry.memberOf.value),
-                    member_uid=self.as_list(entry.memberUid.value),
-                    name=getattr(entry, query.id_attr).value,
-                ),
-            )
-            logger.debug("Found LDAP group %s", output[-1])
-        logger.debug("Loaded %s LDAP groups", len(output))
-        return output
-
-    def search_users(self, query: LDAPQuery) -> list[LDAPUser]:
-        output = []
-        for entry in self.search(query):
-            output.append(
-                LDAPUser(
-                    display_name=entry.displayName.value,
-                    member_of=self.as_list(entry.memberOf.value),
-                    name=getattr(entry, query.id_attr).value,
-                    uid=entry.uid.value,
+    def fetch_attribute_ranges(
+        self,
+        response: list[dict[str, Any]],
+        pool: LDAPConnectionPool | None = None,
+    ) -> None:
+        """Complete any ranged attributes in a search response in place.
+
+        Ranges for different entries are fetched concurrently, each worker borrowing
+        a connection from the pool, and the values of each range are appended to a
+        single list per attribute.
+        """
+        ranged = [
+            (entry, attr_name)
+            for entry in response
+            if entry.get("type") == "searchResEntry"
+            for attr_name in entry["attributes"]
+            if RANGE_TAG in attr_name
+        ]
+        if not ranged:
+            return
+        logger.debug("Fetching remaining ranges for %s attribute(s)", len(ranged))
+        connection_pool = pool or LDAPConnectionPool(self.connect)
+
+        def fetch(item: tuple[dict[str, Any], str]) -> None:
+            with connection_pool.connection() as connection:
+                self._fetch_remaining_ranges(connection, *item)
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(self.range_workers, len(ranged)),
+            ) as executor:
+                list(executor.map(fetch, ranged))
+        finally:
+            if not pool:
+                connection_pool.clear()
+        # Replace each ranged attribute with its merged values
+        for entry, attr_name in ranged:
+            attr_type = attr_name.partition(RANGE_TAG)[0]
+            for key in ("attributes", "raw_attributes"):
+                entry[key][attr_type] = entry[key].pop(attr_name)
+
+    def _fetch_remaining_ranges(
+        self,
+        connection: Connection,
+        entry: dict[str, Any],
+        attr_name: str,
+    ) -> None:
+        attr_type, _, span = attr_name.partition(RANGE_TAG)
+        values: list[Any] = entry["attributes"][attr_name]
+        raw_values: list[bytes] = entry["raw_attributes"][attr_name]
+        high = span.partition("-")[2]
+        while high != "*":
+            try:
+                connection.search(
+                    entry["dn"],
+                    "(objectClass=*)",
+                    search_scope=BASE,
+                    attributes=[f"{attr_type}{RANGE_TAG}{int(high) + 1}-*"],
+                )
+            except LDAPException as exc:
+                msg = f"Unable to fetch ranged attribute {attr_type} for {entry['dn']}."
+                logger.error(msg)  # noqa: TRY400
+                raise LDAPError(msg) from exc
+            chunk = next(
+                (
+                    (name, result)
+                    for result in connection.response or []
+                    for name in result["attributes"]
+                    if RANGE_TAG in name
                 ),
+                None,
             )
-            logger.debug("Found LDAP user %s", output[-1])
-        logger.debug("Loaded %s LDAP users", len(output))
-        return output
+            if not chunk:
+                break
+            name, result = chunk
+            values.extend(result["attributes"][name])
+            raw_values.extend(result["raw_attributes"][name])
+            high = name.partition(RANGE_TAG)[2].partition("-")[2]
+        logger.debug(
+            "Loaded %s values for %s of %s",
+            len(values),
+            attr_type,
+            entry["dn"],
+        )
+
+    def read_watermark(self) -> str | None:
+        """Read the watermark attribute from the root DSE of the preferred server.
+
+        Active Directory increments highestCommittedUSN on every change, so a new
+        value means that cached results may be out of date.
+        """
+        if not self.watermark_attr:
+            return None
+        try:
+            with (
+                LDAPConnectionPool(self.connect) as pool,
+                pool.connection() as connection,
+            ):
+                connection.search(
+                    "",
+                    "(objectClass=*)",
+                    attributes=[self.watermark_attr],
+                    search_scope=BASE,
+                )
+                response = cast(list[dict[str, Any]], connection.response)
+        except (LDAPError, LDAPException):
+            logger.warning("Unable to read LDAP %s.", self.watermark_attr)
+            return None
+        if not response:
+            return None
+        return self.first_value(response[0], self.watermark_attr) or None
+
+    @contextmanager
+    def reuse_results(self) -> Iterator[None]:
+        """Reuse the results of identical searches until the context exits."""
+        with self.cache.cycle():
+            yield
+
+    def search(
+        self,
+        query: LDAPQuery,
+        attributes: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Search the LDAP server, reusing cached results where possible.
+
+        Results are cached for the query's cache TTL and reused by any query with the
+        same base DNs, filter, attributes and server-side sorting.
+        """
+        if self.watermark_attr:
+            self.cache.check_watermark(self.read_watermark)
+        key = (
+            tuple(query.base_dns),
+            query.filter,
+            query.filter_partitions,
+            tuple(attributes or ()),
+            query.server_side_sort,
+        )
+        return self.cache.get(
+            key,
+            lambda: self.search_server(query, attributes),
+            ttl=query.cache_ttl,
+        )
 
-    def search(self, query: LDAPQuery) -> list[Entry]:
+    def search_server(
+        self,
+        query: LDAPQuery,
+        attributes: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Search the LDAP server, returning the raw response for each entry.
+
+        Results are read directly from the connection response, so ldap3 never
+        builds its Entry objects for them. Shards of the query are searched
+        concurrently and their results are de-duplicated by DN.
+        """
         logger.info("Querying LDAP host with:")
         logger.info("... base DN: %s", query.base_dn)
+        for base_dn in query.extra_base_dns:
+            logger.info("... additional base DN: %s", base_dn)
         logger.info("... filter: %s", query.filter)
-        try:
-            connection = self.connect()
-            connection.search(query.base_dn, query.filter, attributes=ALL_ATTRIBUTES)
-        except LDAPSessionTerminatedByServerError as exc:
-            msg = "Server terminated LDAP request."
-            logger.error(msg)  # noqa: TRY400
-            raise LDAPError(msg) from exc
-        except LDAPException as exc:
-            msg = f"Unexpected LDAP exception of type {type(exc)}."
-            logger.error(msg)  # noqa: TRY400
-            raise LDAPError(msg) from exc
-        else:
-            results = cast(list[Entry], connection.entries)
-            logger.debug("Server returned %s results.", len(results))
-            return results
+        shards = query.shards()
+        controls = (
+            [server_side_sort_control([query.id_attr])]
+            if query.server_side_sort
+            else None
+        )
+        with LDAPConnectionPool(self.connect) as pool:
+            if len(shards) == 1:
+                base_dn, search_filter = shards[0]
+                responses = [
+                    self.search_shard(
+                        pool,
+                        base_dn,
+                        search_filter,
+                        attributes,
+                        controls=controls,
+                    ),
+                ]
+            else:
+                logger.debug("Searching %s shards concurrently.", len(shards))
+                with ThreadPoolExecutor(
+                    max_workers=min(self.shard_workers, len(shards)),
+                ) as executor:
+                    responses = list(
+                        executor.map(
+                            lambda shard: self.search_shard(
+                                pool,
+                                shard[0],
+                                shard[1],
+                                attributes,
+                                controls=controls,
+                            ),
+                            shards,
+                        ),
+                    )
+        results = responses[0]
+        if len(responses) > 1:
+            seen_dns: set[str] = set()
+            results = []
+            for response in responses:
+                for entry in response:
+                    if (dn := entry["dn"].lower()) not in seen_dns:
+                        seen_dns.add(dn)
+                        results.append(entry)
+        logger.debug("Server returned %s results.", len(results))
+        return results
+
+    def search_shard(
+        self,
+        pool: LDAPConnectionPool,
+        base_dn: str,
+        search_filter: str,
+        attributes: list[str] | None,
+        *,
+        controls: list[Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        # Each shard can fail over to another server without repeating the others
+        attempts = len(self.selector.servers)
+        for attempt in range(1, attempts + 1):
+            try:
+                with pool.connection() as connection:
+                    connection.search(
+                        base_dn,
+                        search_filter,
+                        attributes=attributes or ALL_ATTRIBUTES,
+                        controls=controls,
+                    )
+                    # Read the response before another shard can borrow the connection
+                    response = cast(list[dict[str, Any]], connection.response or [])
+                    sorted_by_server = server_side_sort_confirmed(connection.result)
+            except LDAPCommunicationError as exc:
+                if attempt < attempts:
+                    self.selector.mark_failed(connection.server)
+                    pool.clear()
+                    logger.warning("Retrying LDAP search on another server.")
+                    continue
+                msg = "Server terminated LDAP request."
+                logger.error(msg)  # noqa: TRY400
+                raise LDAPError(msg) from exc
+            except LDAPException as exc:
+                msg = f"Unexpected LDAP exception of type {type(exc)}."
+                logger.error(msg)  # noqa: TRY400
+                raise LDAPError(msg) from exc
+            else:
+                break
+        if controls and not sorted_by_server:
+            logger.warning("LDAP server did not sort the results from %s.", base_dn)
+        self.fetch_attribute_ranges(response, pool)
+        results = [entry for entry in response if entry["type"] == "searchResEntry"]
+        logger.debug(
+            "Shard %s %s returned %s results.",
+            base_dn,
+            search_filter,
+            len(results),
+        )
+        return results
@@ -0,0 +1,159 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger("guacamole_user_sync")
+
+SearchResult = list[dict[str, Any]]
+
+
+@dataclass
+class CacheEntry:
+    """Cached result of one LDAP search."""
+
+    expires_at: float
+    generation: int
+    result: Future[SearchResult]
+
+
+class LDAPSearchCache:
+    """Size-bounded LRU cache of LDAP search results.
+
+    Each entry expires after the TTL it was stored with. Within a cycle every result
+    is reused, whatever its TTL, so that identical searches made during one
+    synchronisation only reach the server once. Concurrent identical searches wait
+    for the first one to finish. Results that cannot be reused are not kept, so
+    with no TTL nothing stays cached between cycles.
+    """
+
+    def __init__(
+        self,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        max_entries: int = 128,
+        watermark_interval: float = 30,
+    ) -> None:
+        self.clock = clock
+        self.cycles = 0
+        self.entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.misses = 0
+        self.watermark: object = None
+        self.watermark_checked = -math.inf
+        self.watermark_interval = watermark_interval
+
+    def __len__(self) -> int:
+        """Return the number of cached results."""
+        return len(self.entries)
+
+    def check_watermark(self, read_watermark: Callable[[], object]) -> None:
+        """Invalidate every entry if the directory watermark has changed.
+
+        The watermark is read at most once per watermark interval. An unreadable
+        watermark is treated as a change.
+        """
+        with self.lock:
+            now = self.clock()
+            if now - self.watermark_checked < self.watermark_interval:
+                return
+            self.watermark_checked = now
+        watermark = read_watermark()
+        with self.lock:
+            if watermark is None or watermark != self.watermark:
+                if self.entries:
+                    logger.info(
+                        "LDAP watermark changed from %s to %s, invalidating %s cached"
+                        " result(s).",
+                        self.watermark,
+                        watermark,
+                        len(self.entries),
+                    )
+                self.entries.clear()
+            self.watermark = watermark
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        """Reuse every result stored until the last open cycle exits."""
+        with self.lock:
+            if not self.cycles:
+                self.generation += 1
+            self.cycles += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.cycles -= 1
+                if not self.cycles:
+                    self.generation += 1
+                    self.remove_expired(self.clock())
+
+    def get(
+        self,
+        key: Hashable,
+        search: Callable[[], SearchResult],
+        *,
+        ttl: float = 0,
+    ) -> SearchResult:
+        """Return a cached result, calling search to fill the cache if needed."""
+        with self.lock:
+            now = self.clock()
+            self.remove_expired(now)
+            if (entry := self.entries.get(key)) and self.is_valid(entry, now):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                owner = False
+            elif ttl <= 0 and not self.cycles:
+                # The result could never be reused, so do not keep it
+                self.misses += 1
+                entry = None
+            else:
+                entry = CacheEntry(now + ttl, self.generation, Future())
+                self.entries[key] = entry
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                self.misses += 1
+                owner = True
+        if entry is None:
+            return search()
+        if not owner:
+            logger.debug("Using cached LDAP search results.")
+            return entry.result.result()
+        try:
+            result = search()
+        except BaseException as exc:
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    del self.entries[key]
+            entry.result.set_exception(exc)
+            raise
+        entry.result.set_result(result)
+        return result
+
+    def invalidate(self) -> None:
+        """Remove every cached result."""
+        with self.lock:
+            self.entries.clear()
+
+    def remove_expired(self, now: float) -> None:
+        """Remove every entry that can no longer be reused. Hold the lock to call."""
+        for key in [
+            key for key, entry in self.entries.items() if not self.is_valid(entry, now)
+        ]:
+            del self.entries[key]
+
+    def is_valid(self, entry: CacheEntry, now: float) -> bool:
+        return (
+            not entry.result.done()
+            or now < entry.expires_at
+            or (self.cycles > 0 and entry.generation == self.generation)
+        )
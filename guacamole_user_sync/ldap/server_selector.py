@@ -0,0 +1,82 @@
+import logging
+import math
+import socket
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from ldap3 import Server
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class LDAPServerSelector:
+    """Select between LDAP servers, preferring the fastest healthy one."""
+
+    def __init__(
+        self,
+        servers: Sequence[Server],
+        *,
+        check_interval: float = 60,
+        check_timeout: float = 5,
+    ) -> None:
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.latencies: dict[str, float] = {}
+        self.servers = list(servers)
+        self._last_check: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def preferred(self) -> Server:
+        """The server that would currently be tried first."""
+        return self.ordered(check=False)[0]
+
+    def check(self) -> None:
+        """Measure the latency of every server, marking unreachable ones."""
+        with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+            latencies = list(executor.map(self.measure, self.servers))
+        with self._lock:
+            for server, latency in zip(self.servers, latencies, strict=True):
+                self.latencies[server.name] = latency
+                logger.debug("LDAP server %s has latency %.3fs", server.name, latency)
+            self._last_check = time.monotonic()
+
+    def mark_failed(self, server: Server) -> None:
+        """Avoid a server until it passes its next health check."""
+        logger.warning("Marking LDAP server %s as unavailable", server.name)
+        with self._lock:
+            self.latencies[server.name] = math.inf
+
+    def measure(self, server: Server) -> float:
+        """Return the time taken to open a socket to a server."""
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(
+                (server.host, server.port),
+                timeout=self.check_timeout,
+            ):
+                pass
+        except OSError:
+            return math.inf
+        return time.perf_counter() - start
+
+    def ordered(self, *, check: bool = True) -> list[Server]:
+        """Return servers with the fastest healthy ones first.
+
+        Unreachable servers are kept at the end so that they are still tried if
+        every other server fails.
+        """
+        if len(self.servers) == 1:
+            return self.servers
+        if check and (
+            self._last_check is None
+            or time.monotonic() - self._last_check > self.check_interval
+        ):
+            self.check()
+        with self._lock:
+            return sorted(
+                self.servers,
+                key=lambda server: self.latencies.get(server.name, math.inf),
+            )
@@ -0,0 +1,83 @@
+from collections.abc import Sequence
+from typing import Any
+
+from ldap3.protocol.controls import build_control
+from pyasn1.codec.ber import decoder
+from pyasn1.error import PyAsn1Error
+from pyasn1.type.namedtype import (
+    DefaultedNamedType,
+    NamedType,
+    NamedTypes,
+    OptionalNamedType,
+)
+from pyasn1.type.tag import Tag, tagClassContext, tagFormatSimple
+from pyasn1.type.univ import Boolean, Enumerated, OctetString, SequenceOf
+from pyasn1.type.univ import Sequence as Asn1Sequence
+
+# Server-side sort request and response controls from RFC 2891
+SORT_REQUEST_OID = "1.2.840.113556.1.4.473"
+SORT_RESPONSE_OID = "1.2.840.113556.1.4.474"
+
+
+class SortKey(Asn1Sequence):  # type: ignore[misc]
+    """One key of a server-side sort request, as defined in RFC 2891."""
+
+    componentType = NamedTypes(  # noqa: N815
+        NamedType("attributeType", OctetString()),
+        DefaultedNamedType(
+            "reverseOrder",
+            Boolean(value=False).subtype(
+                implicitTag=Tag(tagClassContext, tagFormatSimple, 1),
+            ),
+        ),
+    )
+
+
+class SortKeyList(SequenceOf):  # type: ignore[misc]
+    """The value of a server-side sort request control."""
+
+    componentType = SortKey()  # noqa: N815
+
+
+class SortResult(Asn1Sequence):  # type: ignore[misc]
+    """The value of a server-side sort response, as defined in RFC 2891."""
+
+    componentType = NamedTypes(  # noqa: N815
+        NamedType("sortResult", Enumerated()),
+        OptionalNamedType(
+            "attributeType",
+            OctetString().subtype(
+                implicitTag=Tag(tagClassContext, tagFormatSimple, 0),
+            ),
+        ),
+    )
+
+
+def server_side_sort_confirmed(result: dict[str, Any] | None) -> bool:
+    """Whether the result of a search reports that the server sorted its entries."""
+    control = ((result or {}).get("controls") or {}).get(SORT_RESPONSE_OID)
+    if not control:
+        return False
+    try:
+        value, _ = decoder.decode(control["value"], asn1Spec=SortResult())
+    except PyAsn1Error:
+        return False
+    return int(value["sortResult"]) == 0
+
+
+def server_side_sort_control(
+    attributes: Sequence[str],
+    *,
+    criticality: bool = False,
+) -> Any:  # noqa: ANN401
+    """Build a control asking the server to sort results on the given attributes.
+
+    The control is not critical by default, so servers that do not support it
+    return unsorted results rather than an error.
+    """
+    sort_keys = SortKeyList()
+    for position, attribute in enumerate(attributes):
+        sort_key = SortKey()
+        sort_key.setComponentByName("attributeType", attribute)
+        sort_keys.setComponentByPosition(position, sort_key)
+    return build_control(SORT_REQUEST_OID, criticality, sort_keys)
@@ -1,15 +1,25 @@
 """Models used for LDAP and PostgreSQL interactions."""
 
+from .change_event import ChangeEvent
 from .exceptions import LDAPError, PostgreSQLError
-from .guacamole import GuacamoleUserDetails
+from .guacamole import GuacamoleUserDetails, column_digest
+from .intern_table import InternedArray, InternTable
 from .ldap_objects import LDAPGroup, LDAPUser
 from .ldap_query import LDAPQuery
+from .permission_rule import PermissionRule
+from .sync_phase import SyncPhase
 
 __all__ = [
+    "ChangeEvent",
     "GuacamoleUserDetails",
+    "InternTable",
+    "InternedArray",
     "LDAPError",
     "LDAPGroup",
     "LDAPQuery",
     "LDAPUser",
+    "PermissionRule",
     "PostgreSQLError",
+    "SyncPhase",
+    "column_digest",
 ]
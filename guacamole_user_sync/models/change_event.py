@@ -0,0 +1,25 @@
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+
+def utc_now() -> str:
+    return datetime.now(tz=UTC).isoformat()
+
+
+@dataclass(frozen=True, slots=True)
+class ChangeEvent:
+    """A change that a synchronisation has applied to the Guacamole database.
+
+    Membership events name the user and the group they joined or left.
+    """
+
+    action: str
+    entity_type: str
+    name: str
+    group: str = ""
+    tenant: str = ""
+    timestamp: str = field(default_factory=utc_now)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if value}
@@ -1,6 +1,15 @@
+import hashlib
+import json
+from collections.abc import Mapping
 from dataclasses import dataclass
 
 
+def column_digest(columns: Mapping[str, object]) -> str:
+    """Hash column values so that a row can be compared with its LDAP source."""
+    serialised = json.dumps(columns, sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+
 @dataclass
 class GuacamoleUserDetails:
     """A Guacamole user with required attributes only."""
@@ -8,3 +17,20 @@ class GuacamoleUserDetails:
     entity_id: int
     full_name: str
     name: str
+    email_address: str | None = None
+    organization: str | None = None
+    organizational_role: str | None = None
+
+    @property
+    def columns(self) -> dict[str, str | None]:
+        """Values of the guacamole_user columns that are synchronised from LDAP."""
+        return {
+            "email_address": self.email_address,
+            "full_name": self.full_name,
+            "organization": self.organization,
+            "organizational_role": self.organizational_role,
+        }
+
+    @property
+    def digest(self) -> str:
+        return column_digest(self.columns)
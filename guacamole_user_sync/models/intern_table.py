@@ -0,0 +1,98 @@
+import threading
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from typing import overload
+
+
+class InternTable:
+    """A shared table of strings, each identified by an integer ID.
+
+    Strings can be added from several threads at once, such as the searches of
+    tenants that share an LDAP client.
+    """
+
+    __slots__ = ("_ids", "_lock", "_values")
+
+    def __init__(self) -> None:
+        self._ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._values: list[str] = []
+
+    def __getitem__(self, value_id: int) -> str:
+        """Return the string with a given ID."""
+        return self._values[value_id]
+
+    def __len__(self) -> int:
+        """Return the number of strings in the table."""
+        return len(self._values)
+
+    def add(self, value: str) -> int:
+        """Return the ID of a string, adding it to the table if necessary."""
+        if (value_id := self._ids.get(value)) is None:
+            with self._lock:
+                if (value_id := self._ids.get(value)) is None:
+                    # Store the string before its ID so that any ID read is valid
+                    self._values.append(value)
+                    value_id = self._ids[value] = len(self._values) - 1
+        return value_id
+
+    def array(self, values: Iterable[str]) -> "InternedArray":
+        """Store a sequence of strings as an array of IDs into this table."""
+        return InternedArray(self, array("I", map(self.add, values)))
+
+    def intern(self, value: str) -> str:
+        """Return the canonical copy of a string held by this table."""
+        return self._values[self.add(value)]
+
+
+class InternedArray(Sequence[str]):
+    """A sequence of strings stored as integer IDs into a shared InternTable."""
+
+    __slots__ = ("_ids", "_table")
+
+    def __init__(self, table: InternTable, ids: "array[int]") -> None:
+        self._ids = ids
+        self._table = table
+
+    def __eq__(self, other: object) -> bool:
+        """Compare with another sequence of strings."""
+        if isinstance(other, InternedArray) and other._table is self._table:
+            return self._ids == other._ids
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(
+                value == other_value
+                for value, other_value in zip(self, other, strict=True)
+            )
+        return NotImplemented
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "InternedArray": ...
+
+    def __getitem__(self, index: int | slice) -> "str | InternedArray":
+        """Return the string or strings at an index or slice."""
+        if isinstance(index, slice):
+            return InternedArray(self._table, self._ids[index])
+        return self._table[self._ids[index]]
+
+    def __hash__(self) -> int:
+        """Hash the strings in this sequence."""
+        return hash(tuple(self))
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the strings in this sequence."""
+        return map(self._table.__getitem__, self._ids)
+
+    def __len__(self) -> int:
+        """Return the number of strings in this sequence."""
+        return len(self._ids)
+
+    def __repr__(self) -> str:
+        """Represent this sequence as a list of strings."""
+        return f"{type(self).__name__}({list(self)!r})"
+
+    @property
+    def ids(self) -> "array[int]":
+        return self._ids
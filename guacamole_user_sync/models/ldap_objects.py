@@ -1,20 +1,26 @@
-from dataclasses import dataclass
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LDAPGroup:
     """An LDAP group with required attributes only."""
 
-    member_of: list[str]
-    member_uid: list[str]
+    member_of: Sequence[str]
+    member_uid: Sequence[str]
     name: str
+    attributes: Mapping[str, str] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LDAPUser:
     """An LDAP user with required attributes only."""
 
     display_name: str
-    member_of: list[str]
+    member_of: Sequence[str]
     name: str
     uid: str
+    email_address: str = ""
+    organization: str = ""
+    organizational_role: str = ""
+    attributes: Mapping[str, str] = field(default_factory=dict)
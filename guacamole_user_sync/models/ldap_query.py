@@ -1,10 +1,51 @@
+import string
 from dataclasses import dataclass
 
 
 @dataclass
 class LDAPQuery:
-    """An LDAP query with attributes."""
+    """An LDAP query with attributes.
+
+    The query is split into one shard for each combination of base DN and filter
+    partition, and the shards are searched concurrently. Results are cached for
+    cache_ttl seconds. Each (LDAP attribute, Guacamole attribute) pair in
+    attribute_map is copied into the attributes of every result. If
+    server_side_sort is set, the server is asked to sort results on id_attr.
+    """
 
     base_dn: str
     filter: str
     id_attr: str
+    extra_base_dns: tuple[str, ...] = ()
+    filter_partitions: tuple[str, ...] = ()
+    cache_ttl: float = 0
+    attribute_map: tuple[tuple[str, str], ...] = ()
+    server_side_sort: bool = False
+
+    @property
+    def base_dns(self) -> list[str]:
+        return [self.base_dn, *self.extra_base_dns]
+
+    @property
+    def mapped_attributes(self) -> list[str]:
+        return [ldap_attribute for ldap_attribute, _ in self.attribute_map]
+
+    @staticmethod
+    def initial_partitions(
+        attribute: str,
+        initials: str = string.ascii_lowercase + string.digits,
+    ) -> tuple[str, ...]:
+        """Partition on the first character of an attribute.
+
+        The final partition matches every value that does not start with one of the
+        given initials, so that the partitions together cover the whole directory.
+        """
+        prefixes = tuple(f"({attribute}={initial}*)" for initial in initials)
+        return (*prefixes, f"(!(|{''.join(prefixes)}))")
+
+    def shards(self) -> list[tuple[str, str]]:
+        """Return the (base DN, filter) pair for each shard of this query."""
+        filters = [
+            f"(&{self.filter}{partition})" for partition in self.filter_partitions
+        ] or [self.filter]
+        return [(base_dn, filter_) for base_dn in self.base_dns for filter_ in filters]
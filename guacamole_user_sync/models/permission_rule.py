@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+
+# Permissions that can be granted on a connection or connection group
+OBJECT_PERMISSIONS = ("ADMINISTER", "DELETE", "READ", "UPDATE")
+
+
+@dataclass(frozen=True)
+class PermissionRule:
+    """Grant permissions on a named connection or connection group.
+
+    The permissions go to the LDAP group called `group`, or to every LDAP user
+    whose mapped Guacamole attribute `attribute` is equal to `value`.
+    """
+
+    connection: str | None = None
+    connection_group: str | None = None
+    group: str | None = None
+    attribute: str | None = None
+    value: str | None = None
+    permissions: tuple[str, ...] = ("READ",)
+
+    def __post_init__(self) -> None:
+        """Check that the rule names exactly one target and one grantee."""
+        if (self.connection is None) == (self.connection_group is None):
+            msg = "A permission rule needs one of connection or connection_group"
+            raise ValueError(msg)
+        if (self.group is None) == (self.attribute is None):
+            msg = "A permission rule needs one of group or attribute"
+            raise ValueError(msg)
+        if self.attribute is not None and self.value is None:
+            msg = f"A permission rule for attribute {self.attribute} needs a value"
+            raise ValueError(msg)
+        # Accept any sequence, such as a TOML array, but store a tuple
+        object.__setattr__(self, "permissions", tuple(self.permissions))
+        if unknown := set(self.permissions) - set(OBJECT_PERMISSIONS):
+            msg = f"Unknown permission(s) {', '.join(sorted(unknown))}"
+            raise ValueError(msg)
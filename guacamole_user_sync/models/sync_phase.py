@@ -0,0 +1,10 @@
+from enum import StrEnum
+
+
+class SyncPhase(StrEnum):
+    """Part of the Guacamole database that is synchronised separately."""
+
+    GROUPS = "groups"
+    MEMBERSHIPS = "memberships"
+    PURGE = "purge"
+    USERS = "users"
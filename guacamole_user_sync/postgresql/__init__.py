@@ -1,12 +1,49 @@
 """Interact with the PostgreSQL server."""
 
-from .postgresql_backend import PostgreSQLBackend, PostgreSQLConnectionDetails
-from .postgresql_client import PostgreSQLClient
-from .sql import SchemaVersion
+from typing import TYPE_CHECKING
+
+from guacamole_user_sync.lazy_import import lazy_attributes
+
+if TYPE_CHECKING:
+    from .advisory_lock import PostgreSQLAdvisoryLock
+    from .pool_options import PostgreSQLPoolOptions
+    from .postgresql_backend import PostgreSQLBackend, PostgreSQLConnectionDetails
+    from .postgresql_client import PostgreSQLClient
+    from .retention_options import PostgreSQLRetentionOptions
+    from .schema_version import SchemaVersion
+    from .write_options import PostgreSQLWriteOptions
+    from .write_plan import PlannedWrite, WritePlan
+    from .write_scheduler import PostgreSQLWriteScheduler
 
 __all__ = [
+    "PlannedWrite",
+    "PostgreSQLAdvisoryLock",
     "PostgreSQLBackend",
     "PostgreSQLClient",
     "PostgreSQLConnectionDetails",
+    "PostgreSQLPoolOptions",
+    "PostgreSQLRetentionOptions",
+    "PostgreSQLWriteOptions",
+    "PostgreSQLWriteScheduler",
     "SchemaVersion",
+    "WritePlan",
 ]
+
+# Submodules are imported on first use, so that options can be read without
+# importing SQLAlchemy and psycopg
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "PlannedWrite": "write_plan",
+        "PostgreSQLAdvisoryLock": "advisory_lock",
+        "PostgreSQLBackend": "postgresql_backend",
+        "PostgreSQLClient": "postgresql_client",
+        "PostgreSQLConnectionDetails": "postgresql_backend",
+        "PostgreSQLPoolOptions": "pool_options",
+        "PostgreSQLRetentionOptions": "retention_options",
+        "PostgreSQLWriteOptions": "write_options",
+        "PostgreSQLWriteScheduler": "write_scheduler",
+        "SchemaVersion": "schema_version",
+        "WritePlan": "write_plan",
+    },
+)
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+
+from sqlalchemy import Connection, Engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class PostgreSQLAdvisoryLock:
+    """A PostgreSQL session-level advisory lock used to elect a single leader.
+
+    The lock is held on a dedicated connection for as long as this process stays
+    the leader. PostgreSQL releases it as soon as that connection is lost, and
+    TCP keepalives on the connection let the server notice a dead leader quickly
+    so that a standby can take over.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        name: str,
+        *,
+        keepalive_interval: int = 10,
+    ) -> None:
+        self.engine = engine
+        self.keepalive_interval = keepalive_interval
+        self.key = int.from_bytes(
+            hashlib.sha256(name.encode()).digest()[:8],
+            signed=True,
+        )
+        self.name = name
+        self._connection: Connection | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._connection is not None
+
+    def acquire(self) -> bool:
+        """Try to acquire or renew the lock without blocking.
+
+        Returns True if this process holds the lock.
+        """
+        if self._connection is not None:
+            try:
+                self._connection.execute(text("SELECT 1"))
+            except SQLAlchemyError:
+                logger.warning("Lost connection holding advisory lock '%s'.", self.name)
+                self._close()
+            else:
+                return True
+        connection = self.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT",
+        )
+        try:
+            acquired = bool(
+                connection.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"),
+                    {"key": self.key},
+                ).scalar(),
+            )
+            if acquired:
+                # Let the server detect a dead leader within a few intervals
+                for setting in ("tcp_keepalives_idle", "tcp_keepalives_interval"):
+                    connection.execute(
+                        text(f"SET {setting} = {int(self.keepalive_interval)}"),
+                    )
+        except SQLAlchemyError:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            logger.debug("Advisory lock '%s' is held elsewhere.", self.name)
+            return False
+        logger.info("Acquired advisory lock '%s'.", self.name)
+        self._connection = connection
+        return True
+
+    def release(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"),
+                {"key": self.key},
+            )
+        except SQLAlchemyError:
+            logger.debug("Unable to release advisory lock '%s'.", self.name)
+        self._close()
+        logger.info("Released advisory lock '%s'.", self.name)
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except SQLAlchemyError:
+                logger.debug("Ignoring error while closing lock connection.")
+            self._connection = None
@@ -0,0 +1,55 @@
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from itertools import pairwise
+
+
+@dataclass
+class MergeJoinDiff:
+    """The differences between two sorted streams of names."""
+
+    n_current: int = 0
+    to_add: list[str] = field(default_factory=list)
+    to_remove: list[str] = field(default_factory=list)
+
+
+def increasing(names: Iterable[str], description: str) -> Iterator[str]:
+    """Yield names, raising ValueError if one is not greater than the last."""
+    previous: str | None = None
+    for name in names:
+        if previous is not None and name <= previous:
+            msg = f"{description} are not in increasing order at '{name}'"
+            raise ValueError(msg)
+        previous = name
+        yield name
+
+
+def is_increasing(names: Sequence[str]) -> bool:
+    """Whether every name is greater than the one before it, by code point."""
+    return all(previous < name for previous, name in pairwise(names))
+
+
+def merge_join(desired: Iterable[str], current: Iterable[str]) -> MergeJoinDiff:
+    """Compare two streams of names that are both sorted by code point.
+
+    Each stream is read once, so only the differences are kept in memory rather
+    than either stream as a whole. Raises ValueError if either stream is out of
+    order, since the comparison would otherwise be wrong.
+    """
+    diff = MergeJoinDiff()
+    desired_names = increasing(desired, "Desired names")
+    current_names = increasing(current, "Current names")
+    wanted = next(desired_names, None)
+    existing = next(current_names, None)
+    while wanted is not None or existing is not None:
+        if wanted is not None and (existing is None or wanted < existing):
+            diff.to_add.append(wanted)
+            wanted = next(desired_names, None)
+        elif existing is not None and (wanted is None or existing < wanted):
+            diff.n_current += 1
+            diff.to_remove.append(existing)
+            existing = next(current_names, None)
+        else:
+            diff.n_current += 1
+            wanted = next(desired_names, None)
+            existing = next(current_names, None)
+    return diff
@@ -1,7 +1,7 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import DateTime, Enum, Integer, LargeBinary, String
+from sqlalchemy import Boolean, DateTime, Enum, Integer, LargeBinary, String
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -12,10 +12,65 @@ class GuacamoleEntityType(enum.Enum):
     USER_GROUP = "USER_GROUP"
 
 
+class GuacamoleObjectPermissionType(enum.Enum):
+    """Guacamole object permission enum."""
+
+    ADMINISTER = "ADMINISTER"
+    DELETE = "DELETE"
+    READ = "READ"
+    UPDATE = "UPDATE"
+
+
 class GuacamoleBase(DeclarativeBase):  # type: ignore[misc]
     """Guacamole database base table."""
 
 
+class GuacamoleConnection(GuacamoleBase):
+    """Guacamole database GuacamoleConnection table."""
+
+    __tablename__ = "guacamole_connection"
+
+    connection_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    connection_name: Mapped[str] = mapped_column(String(128))
+    parent_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class GuacamoleConnectionGroup(GuacamoleBase):
+    """Guacamole database GuacamoleConnectionGroup table."""
+
+    __tablename__ = "guacamole_connection_group"
+
+    connection_group_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    connection_group_name: Mapped[str] = mapped_column(String(128))
+    parent_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class GuacamoleConnectionGroupPermission(GuacamoleBase):
+    """Guacamole database GuacamoleConnectionGroupPermission table."""
+
+    __tablename__ = "guacamole_connection_group_permission"
+
+    entity_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    connection_group_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    permission: Mapped[GuacamoleObjectPermissionType] = mapped_column(
+        Enum(GuacamoleObjectPermissionType, name="guacamole_object_permission_type"),
+        primary_key=True,
+    )
+
+
+class GuacamoleConnectionPermission(GuacamoleBase):
+    """Guacamole database GuacamoleConnectionPermission table."""
+
+    __tablename__ = "guacamole_connection_permission"
+
+    entity_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    connection_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    permission: Mapped[GuacamoleObjectPermissionType] = mapped_column(
+        Enum(GuacamoleObjectPermissionType, name="guacamole_object_permission_type"),
+        primary_key=True,
+    )
+
+
 class GuacamoleEntity(GuacamoleBase):
     """Guacamole database GuacamoleEntity table."""
 
@@ -36,9 +91,26 @@ class GuacamoleUser(GuacamoleBase):
     user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     entity_id: Mapped[int] = mapped_column(Integer)
     full_name: Mapped[str] = mapped_column(String(256))
+    email_address: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    organization: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    organizational_role: Mapped[str | None] = mapped_column(
+        String(256),
+        nullable=True,
+    )
     password_hash: Mapped[bytes] = mapped_column(LargeBinary)
     password_salt: Mapped[bytes] = mapped_column(LargeBinary)
     password_date: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    disabled: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class GuacamoleUserAttribute(GuacamoleBase):
+    """Guacamole database GuacamoleUserAttribute table."""
+
+    __tablename__ = "guacamole_user_attribute"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    attribute_name: Mapped[str] = mapped_column(String(128), primary_key=True)
+    attribute_value: Mapped[str] = mapped_column(String(4096))
 
 
 class GuacamoleUserGroup(GuacamoleBase):
@@ -50,10 +122,20 @@ class GuacamoleUserGroup(GuacamoleBase):
     entity_id: Mapped[int] = mapped_column(Integer)
 
 
+class GuacamoleUserGroupAttribute(GuacamoleBase):
+    """Guacamole database GuacamoleUserGroupAttribute table."""
+
+    __tablename__ = "guacamole_user_group_attribute"
+
+    user_group_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    attribute_name: Mapped[str] = mapped_column(String(128), primary_key=True)
+    attribute_value: Mapped[str] = mapped_column(String(4096))
+
+
 class GuacamoleUserGroupMember(GuacamoleBase):
     """Guacamole database GuacamoleUserGroupMember table."""
 
     __tablename__ = "guacamole_user_group_member"
 
     user_group_id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    member_entity_id: Mapped[int] = mapped_column(Integer)
+    member_entity_id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class PostgreSQLPoolOptions:
+    """Dataclass for holding PostgreSQL connection pool options.
+
+    Statements executed `prepare_threshold` times on a connection are prepared on
+    the server, or never if it is None. Independent statements, such as schema
+    commands, are sent in a single round trip when `pipeline` is enabled.
+    """
+
+    keepalives_count: int = 3
+    keepalives_idle: int = 30
+    keepalives_interval: int = 10
+    max_overflow: int = 2
+    pipeline: bool = True
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+    pool_size: int = 2
+    prepare_threshold: int | None = 5
+
+    @property
+    def connect_args(self) -> dict[str, Any]:
+        """Arguments passed to psycopg when opening each connection."""
+        return {
+            "keepalives": 1,
+            "keepalives_count": self.keepalives_count,
+            "keepalives_idle": self.keepalives_idle,
+            "keepalives_interval": self.keepalives_interval,
+            "prepare_threshold": self.prepare_threshold,
+        }
+
+    @property
+    def engine_options(self) -> dict[str, Any]:
+        """Arguments passed to SQLAlchemy when creating an engine."""
+        return {
+            "connect_args": self.connect_args,
+            "max_overflow": self.max_overflow,
+            "pool_pre_ping": self.pool_pre_ping,
+            "pool_recycle": self.pool_recycle,
+            "pool_size": self.pool_size,
+        }
@@ -1,93 +1,428 @@
 import logging
+from collections.abc import Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
 from dataclasses import dataclass
 from typing import Any, TypeVar
 
-from sqlalchemy import URL, Engine, TextClause, create_engine
+import psycopg
+from sqlalchemy import (
+    URL,
+    BinaryExpression,
+    Connection,
+    Engine,
+    TextClause,
+    column,
+    create_engine,
+    inspect,
+    select,
+    text,
+    tuple_,
+    update,
+    values,
+)
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import DeclarativeBase, Session
 
+from .pool_options import PostgreSQLPoolOptions
+from .write_options import PostgreSQLWriteOptions
+from .write_plan import WritePlan
+from .write_scheduler import PostgreSQLWriteScheduler
+
 logger = logging.getLogger("guacamole_user_sync")
 
+# Whether a replica has replayed a primary WAL position, and how far behind it is.
+# The lag is zero whenever the replica has replayed everything it has received, so
+# that an idle primary does not make the replica look stale.
+REPLICA_STATUS = text(
+    """
+    SELECT
+        COALESCE(pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn), true),
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(
+                EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()),
+                0
+            )
+        END
+    """,
+)
+
 
 @dataclass
 class PostgreSQLConnectionDetails:
-    """Dataclass for holding PostgreSQL connection details."""
+    """Dataclass for holding PostgreSQL connection details.
+
+    If `replica_host_name` is set, state is read from that streaming replica while
+    it is no more than `replica_max_lag` seconds behind the primary.
+    """
 
     database_name: str
     host_name: str
     port: int
     user_name: str
     user_password: str
+    replica_host_name: str | None = None
+    replica_max_lag: float = 5.0
+    replica_port: int | None = None
+
+    @property
+    def replica_url(self) -> URL | None:
+        if not self.replica_host_name:
+            return None
+        return self.url.set(
+            host=self.replica_host_name,
+            port=self.replica_port or self.port,
+        )
+
+    @property
+    def url(self) -> URL:
+        return URL.create(
+            "postgresql+psycopg",
+            username=self.user_name,
+            password=self.user_password,
+            host=self.host_name,
+            port=self.port,
+            database=self.database_name,
+        )
 
 
 T = TypeVar("T", bound=DeclarativeBase)
 
 
+def row_values(item: DeclarativeBase) -> dict[str, Any]:
+    """Return the column values that have been set on an ORM object."""
+    return {
+        attr.key: value
+        for attr in inspect(item).mapper.column_attrs
+        if (value := getattr(item, attr.key)) is not None
+    }
+
+
+def primary_key_in(
+    table: type[DeclarativeBase],
+    keys: Sequence[tuple[Any, ...]],
+) -> BinaryExpression[bool]:
+    """Return an expression matching the rows with any of the primary keys."""
+    columns = inspect(table).primary_key
+    if len(columns) == 1:
+        return columns[0].in_([key for (key,) in keys])
+    return tuple_(*columns).in_(keys)
+
+
 class PostgreSQLBackend:
-    """Backend for connecting to a PostgreSQL database."""
+    """Backend for connecting to a PostgreSQL database.
+
+    While `plan` is set, writes are recorded in it instead of being executed, so
+    only read queries are sent to the database.
+
+    State reads go to the replica, if there is one, once it has replayed every write
+    made by this backend. Otherwise, or if it is lagging or unreachable, they go to
+    the primary.
+    """
+
+    plan: WritePlan | None
 
     def __init__(
         self,
         *,
         connection_details: PostgreSQLConnectionDetails,
+        pool_options: PostgreSQLPoolOptions | None = None,
         session: Session | None = None,
+        write_options: PostgreSQLWriteOptions | None = None,
     ) -> None:
         self.connection_details = connection_details
+        self.pool_options = pool_options or PostgreSQLPoolOptions()
+        self.write_options = write_options or PostgreSQLWriteOptions()
+        self.plan = None
+        self.writes = PostgreSQLWriteScheduler(self.write_options)
+        self._cycle_connection: Connection | None = None
         self._engine: Engine | None = None
+        self._replica_engine: Engine | None = None
         self._session = session
+        self._unreplicated_writes = False
+        self._written_lsn: str | None = None
 
     @property
     def engine(self) -> Engine:
         if not self._engine:
-            url_object = URL.create(
-                "postgresql+psycopg",
-                username=self.connection_details.user_name,
-                password=self.connection_details.user_password,
-                host=self.connection_details.host_name,
-                port=self.connection_details.port,
-                database=self.connection_details.database_name,
+            self._engine = create_engine(
+                self.connection_details.url,
+                echo=False,
+                **self.pool_options.engine_options,
             )
-            self._engine = create_engine(url_object, echo=False)
         return self._engine
 
+    @property
+    def replica_engine(self) -> Engine | None:
+        if not self._replica_engine and (url := self.connection_details.replica_url):
+            self._replica_engine = create_engine(
+                url,
+                echo=False,
+                **self.pool_options.engine_options,
+            )
+        return self._replica_engine
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        """Use a single connection for every operation until the context exits.
+
+        This avoids checking a connection out of the pool for each operation, and
+        lets prepared statements be reused for the whole cycle.
+        """
+        if self._session or self._cycle_connection:
+            yield
+            return
+        with self.engine.connect() as connection:
+            self._cycle_connection = connection
+            try:
+                yield
+            finally:
+                self._cycle_connection = None
+
+    def pipeline(self, session: Session) -> AbstractContextManager[Any]:
+        """Send the statements executed in this context without waiting for results.
+
+        Returns a null context if pipelining is disabled or unsupported.
+        """
+        if self.pool_options.pipeline:
+            driver_connection = session.connection().connection.driver_connection
+            if isinstance(driver_connection, psycopg.Connection):
+                return driver_connection.pipeline()
+        return nullcontext()
+
+    def reader(self) -> Session:
+        """Return a session for reading state, from the replica if it is current."""
+        if self._session or not (engine := self.replica_engine):
+            return self.session(expire_on_commit=False)
+        if self._unreplicated_writes:
+            with self.session() as session, session.begin():
+                self._written_lsn = str(
+                    session.execute(text("SELECT pg_current_wal_lsn()")).scalar_one(),
+                )
+            self._unreplicated_writes = False
+        try:
+            with engine.connect() as connection:
+                caught_up, lag = connection.execute(
+                    REPLICA_STATUS,
+                    {"lsn": self._written_lsn},
+                ).one()
+        except SQLAlchemyError:
+            logger.warning("Unable to reach PostgreSQL replica, reading from primary.")
+            return self.session(expire_on_commit=False)
+        if not caught_up or lag > self.connection_details.replica_max_lag:
+            logger.warning(
+                "PostgreSQL replica is %.1fs behind, reading from primary.",
+                lag,
+            )
+            return self.session(expire_on_commit=False)
+        return Session(engine, expire_on_commit=False)
+
     def session(self, *, expire_on_commit: bool = True) -> Session:
         if self._session:
             return self._session
-        return Session(self.engine, expire_on_commit=expire_on_commit)
+        return Session(
+            self._cycle_connection or self.engine,
+            expire_on_commit=expire_on_commit,
+        )
 
-    def add_all(self, items: list[T]) -> None:
+    @contextmanager
+    def transaction(self) -> Iterator[Session]:
+        """Open a transaction that gives up waiting for locks after lock_timeout."""
         with self.session() as session, session.begin():
-            session.add_all(items)
+            if self.write_options.lock_timeout is not None:
+                session.execute(
+                    text("SELECT set_config('lock_timeout', :timeout, true)"),
+                    {"timeout": f"{int(self.write_options.lock_timeout * 1000)}ms"},
+                )
+            yield session
+        self._unreplicated_writes = True
+
+    def add_all(self, items: list[T]) -> None:
+        if self.plan is not None:
+            for table in dict.fromkeys(type(item) for item in items):
+                self.plan.record(
+                    "add",
+                    table.__tablename__,
+                    [row_values(item) for item in items if type(item) is table],
+                )
+            return
+
+        def write(chunk: Sequence[T]) -> int:
+            with self.transaction() as session:
+                session.add_all(chunk)
+            return len(chunk)
+
+        self.writes.run(items, write)
 
     def delete(
         self,
         table: type[T],
         *filter_args: Any,  # noqa: ANN401
-    ) -> None:
-        with self.session() as session, session.begin():
-            if filter_args:
-                session.query(table).filter(*filter_args).delete()
-            else:
-                session.query(table).delete()
+    ) -> int:
+        if self.plan is not None:
+            return self.plan.record(
+                "remove",
+                table.__tablename__,
+                [row_values(row) for row in self.query_filtered(table, *filter_args)],
+                statements_per_chunk=self.statements_per_chunk,
+            )
+        if not self.write_options.chunk_size:
+            with self.transaction() as session:
+                if filter_args:
+                    return int(session.query(table).filter(*filter_args).delete())
+                return int(session.query(table).delete())
+
+        def write(keys: Sequence[tuple[Any, ...]]) -> int:
+            with self.transaction() as session:
+                return int(
+                    session.query(table)
+                    .filter(*filter_args, primary_key_in(table, keys))
+                    .delete(synchronize_session=False),
+                )
+
+        return self.writes.run(self.primary_keys(table, *filter_args), write)
 
     def execute_commands(self, commands: list[TextClause]) -> None:
         try:
-            with self.session() as session, session.begin():
+            with (
+                self.session() as session,
+                session.begin(),
+                self.pipeline(session),
+            ):
                 for command in commands:
                     session.execute(command)
         except SQLAlchemyError:
             logger.warning("Unable to execute PostgreSQL commands.")
             raise
 
+    def update(
+        self,
+        table: type[T],
+        values: dict[Any, Any],
+        *filter_args: Any,  # noqa: ANN401
+    ) -> int:
+        """Update matching rows in committed chunks, returning how many changed."""
+        if self.plan is not None:
+            keys = [key.key for key in inspect(table).primary_key]
+            changes = {
+                getattr(name, "key", name): value for name, value in values.items()
+            }
+            return self.plan.record(
+                "update",
+                table.__tablename__,
+                [
+                    {**{key: getattr(row, key) for key in keys}, **changes}
+                    for row in self.query_filtered(table, *filter_args)
+                ],
+                statements_per_chunk=self.statements_per_chunk,
+            )
+        if not self.write_options.chunk_size:
+            with self.transaction() as session:
+                return int(
+                    session.query(table)
+                    .filter(*filter_args)
+                    .update(values, synchronize_session=False),
+                )
+
+        def write(keys: Sequence[tuple[Any, ...]]) -> int:
+            with self.transaction() as session:
+                return int(
+                    session.query(table)
+                    .filter(*filter_args, primary_key_in(table, keys))
+                    .update(values, synchronize_session=False),
+                )
+
+        return self.writes.run(self.primary_keys(table, *filter_args), write)
+
+    def update_many(
+        self,
+        table: type[T],
+        key: str,
+        rows: Sequence[dict[str, Any]],
+    ) -> int:
+        """Give each row different values with one UPDATE ... FROM (VALUES ...).
+
+        Each row holds the key identifying the row to update and its new column
+        values. Rows are written in committed chunks, returning how many changed.
+        """
+        if not rows:
+            return 0
+        if self.plan is not None:
+            return self.plan.record("update", table.__tablename__, list(rows))
+        columns = inspect(table).columns
+        names = list(rows[0])
+
+        def write(chunk: Sequence[dict[str, Any]]) -> int:
+            changes = values(
+                *(column(name, columns[name].type) for name in names),
+                name="changes",
+            ).data([tuple(row[name] for name in names) for row in chunk])
+            statement = (
+                update(table)
+                .where(columns[key] == changes.c[key])
+                .values({name: changes.c[name] for name in names if name != key})
+            )
+            with self.transaction() as session:
+                result = session.execute(statement)
+            return int(result.rowcount)
+
+        return self.writes.run(rows, write)
+
+    def primary_keys(
+        self,
+        table: type[T],
+        *filter_args: Any,  # noqa: ANN401
+    ) -> list[tuple[Any, ...]]:
+        """Return the full primary keys of the matching rows in key order."""
+        columns = inspect(table).primary_key
+        with self.session() as session, session.begin():
+            query = session.query(*columns).filter(*filter_args).order_by(*columns)
+            return [tuple(row) for row in query.all()]
+
+    def query_filtered(
+        self,
+        table: type[T],
+        *filter_args: Any,  # noqa: ANN401
+    ) -> list[T]:
+        """Return the rows matching SQL expressions, such as those passed to delete."""
+        with self.reader() as session, session.begin():
+            return list(session.query(table).filter(*filter_args).all())
+
     def query(
         self,
         table: type[T],
         **filter_kwargs: Any,  # noqa: ANN401
     ) -> list[T]:
         # We need expire_on_commit to ensure that the results are not marked as stale
-        with self.session(expire_on_commit=False) as session, session.begin():
+        with self.reader() as session, session.begin():
             if filter_kwargs:
                 result = session.query(table).filter_by(**filter_kwargs).all()
             else:
                 result = session.query(table).all()
         return list(result)
+
+    @property
+    def statements_per_chunk(self) -> int:
+        """Statements per chunk of a delete or update, including reading its keys."""
+        return 2 if self.write_options.chunk_size else 1
+
+    def stream_sorted(
+        self,
+        column: Any,  # noqa: ANN401
+        *filter_args: Any,  # noqa: ANN401
+        batch_size: int = 1000,
+    ) -> Iterator[str]:
+        """Yield the values of a string column sorted by code point.
+
+        Values are sorted with the "C" collation, which matches Python string
+        ordering for UTF-8 databases. They are read from a server-side cursor, so at
+        most one batch is held in memory.
+        """
+        statement = (
+            select(column)
+            .filter(*filter_args)
+            .order_by(column.collate("C"))
+            .execution_options(yield_per=batch_size)
+        )
+        with self.reader() as session, session.begin():
+            yield from session.scalars(statement)
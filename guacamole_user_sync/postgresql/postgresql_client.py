@@ -1,33 +1,87 @@
+import copy
 import logging
 import secrets
+import time
+from collections.abc import Collection, Iterable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
 from datetime import UTC, datetime
+from typing import TypeVar
 
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
+from guacamole_user_sync.events import EventEmitter
 from guacamole_user_sync.models import (
+    ChangeEvent,
     GuacamoleUserDetails,
     LDAPGroup,
     LDAPUser,
+    PermissionRule,
     PostgreSQLError,
+    SyncPhase,
+    column_digest,
 )
 
+from .advisory_lock import PostgreSQLAdvisoryLock
+from .merge_join import MergeJoinDiff, is_increasing, merge_join
 from .orm import (
+    GuacamoleConnection,
+    GuacamoleConnectionGroup,
+    GuacamoleConnectionGroupPermission,
+    GuacamoleConnectionPermission,
     GuacamoleEntity,
     GuacamoleEntityType,
+    GuacamoleObjectPermissionType,
     GuacamoleUser,
+    GuacamoleUserAttribute,
     GuacamoleUserGroup,
+    GuacamoleUserGroupAttribute,
     GuacamoleUserGroupMember,
 )
+from .pool_options import PostgreSQLPoolOptions
 from .postgresql_backend import PostgreSQLBackend, PostgreSQLConnectionDetails
-from .sql import GuacamoleSchema, SchemaVersion
+from .retention_options import PostgreSQLRetentionOptions
+from .schema_version import SchemaVersion
+from .sql import GuacamoleSchema
+from .write_options import PostgreSQLWriteOptions
+from .write_plan import WritePlan
 
 logger = logging.getLogger("guacamole_user_sync")
 
+# Tables holding (ID, name, value) attribute triples for users or groups
+AttributeTable = TypeVar(
+    "AttributeTable",
+    GuacamoleUserAttribute,
+    GuacamoleUserGroupAttribute,
+)
+
+# Tables holding (entity ID, object ID, permission) triples
+PermissionTable = TypeVar(
+    "PermissionTable",
+    GuacamoleConnectionGroupPermission,
+    GuacamoleConnectionPermission,
+)
+
+# User attribute recording when a user was disabled because they left LDAP
+DISABLED_AT_ATTRIBUTE = "guacamole-user-sync-disabled-at"
+
+# Names or IDs that are looked up in the database, LOOKUP_BATCH_SIZE at a time
+LookupKey = TypeVar("LookupKey", int, str)
+LOOKUP_BATCH_SIZE = 1000
+
+
+def batches(values: Iterable[LookupKey]) -> Iterator[list[LookupKey]]:
+    """Split values into sorted lists of at most LOOKUP_BATCH_SIZE distinct values."""
+    unique_values = sorted(set(values))
+    for start in range(0, len(unique_values), LOOKUP_BATCH_SIZE):
+        yield unique_values[start : start + LOOKUP_BATCH_SIZE]
+
 
 class PostgreSQLClient:
     """Client for connecting to a PostgreSQL database."""
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         *,
         database_name: str,
@@ -35,6 +89,16 @@ class PostgreSQLClient:
         port: int,
         user_name: str,
         user_password: str,
+        leader_lock_name: str | None = None,
+        replica_host_name: str | None = None,
+        replica_max_lag: float = 5.0,
+        replica_port: int | None = None,
+        pool_options: PostgreSQLPoolOptions | None = None,
+        retention_options: PostgreSQLRetentionOptions | None = None,
+        write_options: PostgreSQLWriteOptions | None = None,
+        permission_rules: Sequence[PermissionRule] = (),
+        event_emitter: EventEmitter | None = None,
+        tenant_name: str = "",
     ) -> None:
         self.backend = PostgreSQLBackend(
             connection_details=PostgreSQLConnectionDetails(
@@ -43,51 +107,88 @@ class PostgreSQLClient:
                 port=port,
                 user_name=user_name,
                 user_password=user_password,
+                replica_host_name=replica_host_name,
+                replica_max_lag=replica_max_lag,
+                replica_port=replica_port,
             ),
+            pool_options=pool_options,
+            write_options=write_options,
+        )
+        self.leader_lock = (
+            PostgreSQLAdvisoryLock(self.backend.engine, leader_lock_name)
+            if leader_lock_name
+            else None
         )
+        self.permission_rules = list(permission_rules)
+        self.retention_options = retention_options or PostgreSQLRetentionOptions()
+        self.event_emitter = event_emitter
+        self.tenant_name = tenant_name
+
+    def acquire_leadership(self) -> bool:
+        """Return True if this replica should synchronise.
+
+        Without a leader lock every replica synchronises. Otherwise only the replica
+        holding the lock does, and it keeps the lock between cycles.
+        """
+        if not self.leader_lock:
+            return True
+        try:
+            return self.leader_lock.acquire()
+        except SQLAlchemyError as exc:
+            msg = "Unable to acquire PostgreSQL leader lock."
+            raise PostgreSQLError(msg) from exc
 
     def assign_users_to_groups(
         self,
         groups: list[LDAPGroup],
         users: list[LDAPUser],
-    ) -> None:
+    ) -> int:
+        """Assign users to groups, returning the number of assignments changed."""
         logger.info(
             "Ensuring that %s user(s) are correctly assigned among %s group(s)",
             len(users),
             len(groups),
         )
+        # Resolve every group and member with one lookup per table, rather than
+        # with queries for each group and each of its members
+        group_entity_ids = self.entity_ids(
+            (group.name for group in groups),
+            GuacamoleEntityType.USER_GROUP,
+        )
+        user_group_ids = {
+            entity_id: user_group.user_group_id
+            for entity_id, user_group in self.user_groups_by_entity_id(
+                group_entity_ids.values(),
+            ).items()
+        }
+        # The first LDAP user with each UID is used
+        users_by_uid = {user.uid: user for user in reversed(users)}
+        user_entity_ids = self.entity_ids(
+            (
+                users_by_uid[user_uid].name
+                for group in groups
+                for user_uid in group.member_uid
+                if user_uid in users_by_uid
+            ),
+            GuacamoleEntityType.USER,
+        )
         user_group_members: list[tuple[int, int]] = []
         for group in groups:
             logger.debug("Working on group '%s'", group.name)
-            # Get the user_group_id for each group (via looking up the entity_id)
-            try:
-                group_entity_id = next(
-                    item.entity_id
-                    for item in self.backend.query(
-                        GuacamoleEntity,
-                        name=group.name,
-                        type=GuacamoleEntityType.USER_GROUP,
-                    )
-                )
-                user_group_id = next(
-                    item.user_group_id
-                    for item in self.backend.query(
-                        GuacamoleUserGroup,
-                        entity_id=group_entity_id,
-                    )
-                )
-                logger.debug(
-                    "Group '%s' has entity_id: %s and user_group_id: %s",
-                    group.name,
-                    group_entity_id,
-                    user_group_id,
-                )
-            except StopIteration:
+            group_entity_id = group_entity_ids.get(group.name)
+            if group_entity_id not in user_group_ids:
                 logger.debug(
                     "Could not determine user_group_id for group '%s'.",
                     group.name,
                 )
                 continue
+            user_group_id = user_group_ids[group_entity_id]
+            logger.debug(
+                "Group '%s' has entity_id: %s and user_group_id: %s",
+                group.name,
+                group_entity_id,
+                user_group_id,
+            )
             # Get the user_entity_id for each user belonging to this group
             logger.debug(
                 "Group '%s' has %s member(s).",
@@ -95,49 +196,211 @@ class PostgreSQLClient:
                 len(group.member_uid),
             )
             for user_uid in group.member_uid:
-                try:
-                    user = next(filter(lambda u: u.uid == user_uid, users))
-                except StopIteration:
+                if (user := users_by_uid.get(user_uid)) is None:
                     logger.debug("Could not find LDAP user with UID %s", user_uid)
                     continue
-                try:
-                    user_entity_id = next(
-                        item.entity_id
-                        for item in self.backend.query(
-                            GuacamoleEntity,
-                            name=user.name,
-                            type=GuacamoleEntityType.USER,
-                        )
-                    )
-                    logger.debug(
-                        "... group member '%s' has entity_id '%s'",
-                        user.name,
-                        user_entity_id,
-                    )
-                except StopIteration:
+                if user.name not in user_entity_ids:
                     logger.debug(
                         "Could not find entity ID for LDAP user '%s'",
                         user_uid,
                     )
                     continue
+                user_entity_id = user_entity_ids[user.name]
+                logger.debug(
+                    "... group member '%s' has entity_id '%s'",
+                    user.name,
+                    user_entity_id,
+                )
                 # Record user/group associations
                 user_group_members.append((user_group_id, user_entity_id))
-        # Clear existing assignments then reassign
-        logger.debug(
-            "... creating %s user/group assignments.",
-            len(user_group_members),
-        )
-        self.backend.delete(GuacamoleUserGroupMember)
-        # Create entries in the user group member table
+        # Leave assignments alone if they are already correct. Only the assignments
+        # of the groups found above are read, rather than the whole table.
+        current_user_group_members = self.members_of(user_group_ids.values())
+        n_changes = len(current_user_group_members ^ set(user_group_members))
+        if not n_changes:
+            logger.debug("... user/group assignments are already up to date.")
+            return 0
+        # Only change the assignments that differ, so that writes committed in
+        # chunks never leave a user without a group they should still belong to
+        to_add = [
+            member
+            for member in user_group_members
+            if member not in current_user_group_members
+        ]
+        to_remove = current_user_group_members - set(user_group_members)
+        logger.debug("... creating %s user/group assignments.", len(to_add))
         self.backend.add_all(
             [
                 GuacamoleUserGroupMember(
                     user_group_id=user_group_id,
                     member_entity_id=user_entity_id,
                 )
-                for user_group_id, user_entity_id in user_group_members
+                for user_group_id, user_entity_id in to_add
+            ],
+        )
+        self.emit_memberships("added", to_add)
+        logger.debug("... removing %s user/group assignments.", len(to_remove))
+        removed_members: dict[int, list[int]] = {}
+        for user_group_id, user_entity_id in sorted(to_remove):
+            removed_members.setdefault(user_group_id, []).append(user_entity_id)
+        for user_group_id, member_entity_ids in removed_members.items():
+            self.backend.delete(
+                GuacamoleUserGroupMember,
+                GuacamoleUserGroupMember.user_group_id == user_group_id,
+                GuacamoleUserGroupMember.member_entity_id.in_(member_entity_ids),
+            )
+        self.emit_memberships("removed", sorted(to_remove))
+        return n_changes
+
+    def bind(self, session: Session) -> "PostgreSQLClient":
+        """Return a copy of this client which runs every operation in one session."""
+        client = copy.copy(self)
+        client.backend = PostgreSQLBackend(
+            connection_details=self.backend.connection_details,
+            pool_options=self.backend.pool_options,
+            session=session,
+            write_options=self.backend.write_options,
+        )
+        return client
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        """Use one pooled connection for every operation in a synchronisation."""
+        try:
+            with self.backend.cycle():
+                yield
+        except SQLAlchemyError as exc:
+            msg = "Unable to connect to PostgreSQL."
+            raise PostgreSQLError(msg) from exc
+
+    def disable_users(self, usernames: list[str]) -> int:
+        """Disable users that are no longer in LDAP instead of deleting them.
+
+        Users are disabled with a single UPDATE and the time is recorded in a user
+        attribute, so that they can be purged later. Users that were already
+        disabled are left alone.
+        """
+        users = [user for user in self.users_named(usernames) if not user.disabled]
+        user_ids = [user.user_id for user in users]
+        logger.debug("... %s user(s) will be disabled", len(user_ids))
+        if not user_ids:
+            return 0
+        n_disabled = self.backend.update(
+            GuacamoleUser,
+            {"disabled": True},
+            GuacamoleUser.user_id.in_(user_ids),
+        )
+        self.backend.delete(
+            GuacamoleUserAttribute,
+            GuacamoleUserAttribute.user_id.in_(user_ids),
+            GuacamoleUserAttribute.attribute_name == DISABLED_AT_ATTRIBUTE,
+        )
+        disabled_at = datetime.now(tz=UTC).isoformat()
+        self.backend.add_all(
+            [
+                GuacamoleUserAttribute(
+                    user_id=user_id,
+                    attribute_name=DISABLED_AT_ATTRIBUTE,
+                    attribute_value=disabled_at,
+                )
+                for user_id in user_ids
             ],
         )
+        self.emit_entities("user", "disabled", [user.entity_id for user in users])
+        return n_disabled
+
+    def enable_users(self, usernames: list[str]) -> int:
+        """Re-enable users that were disabled by this tool and are back in LDAP.
+
+        Users disabled by an administrator are left alone.
+        """
+        disabled_user_ids = {
+            attribute.user_id
+            for attribute in self.backend.query(
+                GuacamoleUserAttribute,
+                attribute_name=DISABLED_AT_ATTRIBUTE,
+            )
+        }
+        if not disabled_user_ids:
+            return 0
+        users = [
+            user
+            for user in self.users_named(usernames)
+            if user.user_id in disabled_user_ids
+        ]
+        user_ids = [user.user_id for user in users]
+        logger.debug("... %s user(s) will be re-enabled", len(user_ids))
+        if not user_ids:
+            return 0
+        self.backend.delete(
+            GuacamoleUserAttribute,
+            GuacamoleUserAttribute.user_id.in_(user_ids),
+            GuacamoleUserAttribute.attribute_name == DISABLED_AT_ATTRIBUTE,
+        )
+        n_enabled = self.backend.update(
+            GuacamoleUser,
+            {"disabled": False},
+            GuacamoleUser.user_id.in_(user_ids),
+        )
+        self.emit_entities("user", "enabled", [user.entity_id for user in users])
+        return n_enabled
+
+    def emit(self, entity_type: str, action: str, names: Iterable[str]) -> None:
+        """Report changes that have been applied, unless they were only planned."""
+        if self.event_emitter is None or self.backend.plan is not None:
+            return
+        self.event_emitter.emit(
+            ChangeEvent(
+                action=action,
+                entity_type=entity_type,
+                name=name,
+                tenant=self.tenant_name,
+            )
+            for name in names
+        )
+
+    def emit_entities(
+        self,
+        entity_type: str,
+        action: str,
+        entity_ids: Collection[int],
+    ) -> None:
+        """Report changes to entities, looking up their names if necessary."""
+        if self.emitting and entity_ids:
+            names = self.entity_names()
+            self.emit(
+                entity_type,
+                action,
+                [names[entity_id] for entity_id in entity_ids],
+            )
+
+    def emit_memberships(
+        self,
+        action: str,
+        members: Collection[tuple[int, int]],
+    ) -> None:
+        """Report (user_group_id, member_entity_id) pairs that were changed."""
+        if self.event_emitter is None or self.backend.plan is not None or not members:
+            return
+        names = self.entity_names()
+        group_names = {
+            group.user_group_id: names[group.entity_id]
+            for group in self.backend.query(GuacamoleUserGroup)
+        }
+        self.event_emitter.emit(
+            ChangeEvent(
+                action=action,
+                entity_type="membership",
+                name=names[member_entity_id],
+                group=group_names[user_group_id],
+                tenant=self.tenant_name,
+            )
+            for user_group_id, member_entity_id in members
+        )
+
+    @property
+    def emitting(self) -> bool:
+        return self.event_emitter is not None and self.backend.plan is None
 
     def ensure_schema(self, schema_version: SchemaVersion) -> None:
         try:
@@ -146,58 +409,353 @@ class PostgreSQLClient:
             msg = "Unable to ensure PostgreSQL schema."
             raise PostgreSQLError(msg) from exc
 
-    def update(self, *, groups: list[LDAPGroup], users: list[LDAPUser]) -> None:
-        """Update the relevant tables to match lists of LDAP users and groups."""
-        self.update_groups(groups)
-        self.update_users(users)
-        self.update_group_entities()
-        self.update_user_entities(users)
-        self.assign_users_to_groups(groups, users)
+    def entity_names(self) -> dict[int, str]:
+        """Map the entity ID of every user and group to its name."""
+        return {
+            entity.entity_id: entity.name
+            for entity in self.backend.query(GuacamoleEntity)
+        }
 
-    def update_groups(self, groups: list[LDAPGroup]) -> None:
-        """Update the entities table with desired groups."""
-        # Set groups to desired list
-        logger.info("Ensuring that %s group(s) are registered", len(groups))
-        desired_group_names = [group.name for group in groups]
-        current_group_names = [
-            item.name
-            for item in self.backend.query(
+    def entity_ids(
+        self,
+        names: Iterable[str],
+        entity_type: GuacamoleEntityType,
+    ) -> dict[str, int]:
+        """Map names to the IDs of their registered entities of one type.
+
+        Only the named entities are read, in batches, rather than the whole table.
+        """
+        return {
+            entity.name: entity.entity_id
+            for batch in batches(names)
+            for entity in self.backend.query_filtered(
                 GuacamoleEntity,
-                type=GuacamoleEntityType.USER_GROUP,
+                GuacamoleEntity.name.in_(batch),
+                GuacamoleEntity.type == entity_type,
+            )
+        }
+
+    def entity_diff(
+        self,
+        names: list[str],
+        entity_type: GuacamoleEntityType,
+    ) -> MergeJoinDiff:
+        """Compare desired names with the registered entities of one type.
+
+        Registered names are streamed from PostgreSQL in sorted order and
+        merge-joined with the sorted desired names, so the entities table is never
+        held in memory. Desired names that the LDAP server has already sorted are
+        merged as they are, without being copied or sorted again.
+        """
+        # The server's ordering rule need not be code point order, so a confirmed
+        # server-side sort is checked with one pass rather than trusted
+        desired = names if is_increasing(names) else dict.fromkeys(sorted(names))
+        try:
+            return merge_join(
+                desired,
+                self.backend.stream_sorted(
+                    GuacamoleEntity.name,
+                    GuacamoleEntity.type == entity_type,
+                ),
+            )
+        except ValueError as exc:
+            msg = "Unable to compare LDAP names with PostgreSQL entities."
+            raise PostgreSQLError(msg) from exc
+
+    def members_of(self, user_group_ids: Iterable[int]) -> set[tuple[int, int]]:
+        """Return the (user_group_id, member_entity_id) assignments of some groups."""
+        return {
+            (member.user_group_id, member.member_entity_id)
+            for batch in batches(user_group_ids)
+            for member in self.backend.query_filtered(
+                GuacamoleUserGroupMember,
+                GuacamoleUserGroupMember.user_group_id.in_(batch),
+            )
+        }
+
+    @contextmanager
+    def plan(self) -> Iterator[WritePlan]:
+        """Record the writes made in this context in a plan instead of making them.
+
+        Reads still go to the database, so rows that would be derived from planned
+        writes, such as the user rows for newly added entities, are not included.
+        """
+        self.backend.plan = WritePlan(self.backend.write_options)
+        try:
+            yield self.backend.plan
+        finally:
+            self.backend.plan = None
+
+    def disabled_before(
+        self,
+        attribute: GuacamoleUserAttribute,
+        cutoff: datetime,
+    ) -> bool:
+        """Whether a disabled-at attribute records a time no later than the cutoff.
+
+        Malformed or naive timestamps are skipped with a warning, so that one bad
+        row cannot stop the purge.
+        """
+        try:
+            return datetime.fromisoformat(attribute.attribute_value) <= cutoff
+        except (TypeError, ValueError):
+            names = [
+                entity.name
+                for user in self.backend.query(
+                    GuacamoleUser,
+                    user_id=attribute.user_id,
+                )
+                for entity in self.backend.query(
+                    GuacamoleEntity,
+                    entity_id=user.entity_id,
+                )
+            ]
+            logger.warning(
+                "Ignoring invalid disabled-at time '%s' for user '%s'.",
+                attribute.attribute_value,
+                names[0] if names else attribute.user_id,
+            )
+            return False
+
+    def purge_disabled_users(self) -> int:
+        """Delete users that have been disabled for longer than the grace period.
+
+        Users are deleted in small batches, each in its own transaction, with a
+        pause between batches so that the cascading deletes never hold locks for
+        long.
+        """
+        cutoff = datetime.now(tz=UTC) - self.retention_options.grace_period
+        expired_user_ids = {
+            attribute.user_id
+            for attribute in self.backend.query(
+                GuacamoleUserAttribute,
+                attribute_name=DISABLED_AT_ATTRIBUTE,
             )
+            if self.disabled_before(attribute, cutoff)
+        }
+        if not expired_user_ids:
+            return 0
+        # Only purge users that are still disabled
+        entity_ids = [
+            user.entity_id
+            for user in self.backend.query(GuacamoleUser)
+            if user.user_id in expired_user_ids and user.disabled
         ]
-        # Add groups
+        logger.info("Purging %s user(s) disabled before %s", len(entity_ids), cutoff)
+        # Names must be read before the entities are deleted
+        names = self.entity_names() if self.emitting else {}
+        batch_size = self.retention_options.purge_batch_size
+        n_purged = 0
+        for start in range(0, len(entity_ids), batch_size):
+            if start and self.backend.plan is None:
+                time.sleep(self.retention_options.purge_pause)
+            batch = entity_ids[start : start + batch_size]
+            n_purged += self.backend.delete(
+                GuacamoleEntity,
+                GuacamoleEntity.entity_id.in_(batch),
+            )
+            if names:
+                self.emit("user", "purged", [names[entity_id] for entity_id in batch])
+            logger.debug("... purged %s user(s)", n_purged)
+        return n_purged
+
+    def reconcile_attributes(
+        self,
+        table: type[AttributeTable],
+        id_attr: str,
+        desired: Mapping[int, Mapping[str, str]],
+    ) -> int:
+        """Make the attributes of some users or groups match the desired values.
+
+        Only attribute names that appear in the desired values are managed, and only
+        for the IDs that appear in it. The current and desired (ID, name, value)
+        triples are compared as sets, then stale triples are deleted and missing ones
+        added in bulk. Returns the number of triples deleted or added.
+        """
+        managed_names = {name for attributes in desired.values() for name in attributes}
+        if not managed_names:
+            return 0
+        desired_triples = {
+            (entity_id, name, value)
+            for entity_id, attributes in desired.items()
+            for name, value in attributes.items()
+            if value
+        }
+        current_triples = {
+            (getattr(item, id_attr), item.attribute_name, item.attribute_value)
+            for item in self.backend.query(table)
+            if item.attribute_name in managed_names
+            and getattr(item, id_attr) in desired
+        }
+        to_remove = current_triples - desired_triples
+        to_add = desired_triples - current_triples
         logger.debug(
-            "There are %s group(s) currently registered",
-            len(current_group_names),
+            "... %s attribute(s) will be removed and %s added",
+            len(to_remove),
+            len(to_add),
         )
-        group_names_to_add = [
-            group_name
-            for group_name in desired_group_names
-            if group_name not in current_group_names
-        ]
-        logger.debug("... %s group(s) will be added", len(group_names_to_add))
+        # Delete stale values first so that changed values can be re-added
+        removed_ids: dict[str, list[int]] = {}
+        for entity_id, name, _ in sorted(to_remove):
+            removed_ids.setdefault(name, []).append(entity_id)
+        for name, entity_ids in removed_ids.items():
+            self.backend.delete(
+                table,
+                table.attribute_name == name,
+                getattr(table, id_attr).in_(entity_ids),
+            )
+        self.backend.add_all(
+            [
+                table(
+                    **{id_attr: entity_id},
+                    attribute_name=name,
+                    attribute_value=value,
+                )
+                for entity_id, name, value in sorted(to_add)
+            ],
+        )
+        return len(to_remove) + len(to_add)
+
+    def reconcile_permissions(
+        self,
+        table: type[PermissionTable],
+        object_id_attr: str,
+        entity_ids: Collection[int],
+        object_ids: Collection[int],
+        desired: set[tuple[int, int, GuacamoleObjectPermissionType]],
+    ) -> int:
+        """Make the permissions of some entities on some objects match the desired set.
+
+        Only rows for the given entities and objects are managed, so permissions
+        granted by hand to anyone else, or on anything else, are left alone. Returns
+        the number of permissions revoked or granted.
+        """
+        current = {
+            (item.entity_id, getattr(item, object_id_attr), item.permission)
+            for item in self.backend.query(table)
+            if item.entity_id in entity_ids
+            and getattr(item, object_id_attr) in object_ids
+        }
+        to_remove = current - desired
+        to_add = desired - current
+        logger.debug(
+            "... %s %s(s) will be revoked and %s granted",
+            len(to_remove),
+            table.__tablename__,
+            len(to_add),
+        )
+        removed: dict[tuple[int, GuacamoleObjectPermissionType], list[int]] = {}
+        for entity_id, object_id, permission in to_remove:
+            removed.setdefault((entity_id, permission), []).append(object_id)
+        for (entity_id, permission), ids in removed.items():
+            self.backend.delete(
+                table,
+                table.entity_id == entity_id,
+                table.permission == permission,
+                getattr(table, object_id_attr).in_(ids),
+            )
+        self.backend.add_all(
+            [
+                table(
+                    **{object_id_attr: object_id},
+                    entity_id=entity_id,
+                    permission=permission,
+                )
+                for entity_id, object_id, permission in to_add
+            ],
+        )
+        return len(to_remove) + len(to_add)
+
+    def update(
+        self,
+        *,
+        groups: list[LDAPGroup],
+        users: list[LDAPUser],
+        phases: Collection[SyncPhase] = tuple(SyncPhase),
+    ) -> int:
+        """Update the relevant tables to match lists of LDAP users and groups.
+
+        Only the tables belonging to the given phases are updated. Returns the number
+        of rows that were added, removed or reassigned.
+        """
+        n_changes = 0
+        if SyncPhase.GROUPS in phases:
+            n_changes += (
+                self.update_groups(groups)
+                + self.update_group_entities()
+                + self.update_group_attributes(groups)
+            )
+        if SyncPhase.USERS in phases:
+            n_changes += (
+                self.update_users(users)
+                + self.update_user_entities(users)
+                + self.update_user_attributes(users)
+            )
+        if SyncPhase.MEMBERSHIPS in phases:
+            n_changes += self.assign_users_to_groups(
+                groups,
+                users,
+            ) + self.update_permissions(groups, users)
+        if SyncPhase.PURGE in phases:
+            n_changes += self.purge_disabled_users()
+        return n_changes
+
+    def update_groups(self, groups: list[LDAPGroup]) -> int:
+        """Update the entities table with desired groups."""
+        # Set groups to desired list
+        logger.info("Ensuring that %s group(s) are registered", len(groups))
+        diff = self.entity_diff(
+            [group.name for group in groups],
+            GuacamoleEntityType.USER_GROUP,
+        )
+        # Add groups
+        logger.debug("There are %s group(s) currently registered", diff.n_current)
+        logger.debug("... %s group(s) will be added", len(diff.to_add))
         self.backend.add_all(
             [
                 GuacamoleEntity(name=group_name, type=GuacamoleEntityType.USER_GROUP)
-                for group_name in group_names_to_add
+                for group_name in diff.to_add
             ],
         )
+        self.emit("group", "added", diff.to_add)
         # Remove groups
-        group_names_to_remove = [
-            group_name
-            for group_name in current_group_names
-            if group_name not in desired_group_names
-        ]
-        logger.debug("... %s group(s) will be removed", len(group_names_to_remove))
-        for group_name in group_names_to_remove:
+        logger.debug("... %s group(s) will be removed", len(diff.to_remove))
+        if diff.to_remove:
             self.backend.delete(
                 GuacamoleEntity,
-                GuacamoleEntity.name == group_name,
+                GuacamoleEntity.name.in_(diff.to_remove),
                 GuacamoleEntity.type == GuacamoleEntityType.USER_GROUP,
             )
+            self.emit("group", "removed", diff.to_remove)
+        return len(diff.to_add) + len(diff.to_remove)
+
+    def update_group_attributes(self, groups: list[LDAPGroup]) -> int:
+        """Copy mapped LDAP attributes into the group attributes table."""
+        if not any(group.attributes for group in groups):
+            return 0
+        logger.info("Ensuring that attributes of %s group(s) are correct", len(groups))
+        entity_ids = {
+            item.name: item.entity_id
+            for item in self.backend.query(
+                GuacamoleEntity,
+                type=GuacamoleEntityType.USER_GROUP,
+            )
+        }
+        user_group_ids = {
+            item.entity_id: item.user_group_id
+            for item in self.backend.query(GuacamoleUserGroup)
+        }
+        return self.reconcile_attributes(
+            GuacamoleUserGroupAttribute,
+            "user_group_id",
+            {
+                user_group_ids[entity_ids[group.name]]: group.attributes
+                for group in groups
+                if entity_ids.get(group.name) in user_group_ids
+            },
+        )
 
-    def update_group_entities(self) -> None:
+    def update_group_entities(self) -> int:
         """Add group entities to the groups table."""
         current_user_group_entity_ids = [
             group.entity_id for group in self.backend.query(GuacamoleUserGroup)
@@ -236,102 +794,271 @@ class PostgreSQLClient:
             "There are %s valid user group entit(y|ies)",
             len(valid_entity_ids),
         )
-        self.backend.delete(
+        return len(new_group_entity_ids) + self.backend.delete(
             GuacamoleUserGroup,
             GuacamoleUserGroup.entity_id.not_in(valid_entity_ids),
         )
 
-    def update_users(self, users: list[LDAPUser]) -> None:
+    def update_permissions(
+        self,
+        groups: list[LDAPGroup],
+        users: list[LDAPUser],
+    ) -> int:
+        """Grant the connection permissions given by the permission rules.
+
+        Permissions of LDAP groups and users on the connections and connection groups
+        named by the rules are compared with the desired set, then any differences
+        are revoked or granted in bulk.
+        """
+        if not self.permission_rules:
+            return 0
+        logger.info(
+            "Ensuring that permissions from %s rule(s) are granted",
+            len(self.permission_rules),
+        )
+        group_entity_ids = self.entity_ids(
+            (group.name for group in groups),
+            GuacamoleEntityType.USER_GROUP,
+        )
+        user_entity_ids = self.entity_ids(
+            (user.name for user in users),
+            GuacamoleEntityType.USER,
+        )
+        connection_ids: dict[str, list[int]] = {}
+        for connection in self.backend.query(GuacamoleConnection):
+            connection_ids.setdefault(connection.connection_name, []).append(
+                connection.connection_id,
+            )
+        connection_group_ids: dict[str, list[int]] = {}
+        for connection_group in self.backend.query(GuacamoleConnectionGroup):
+            connection_group_ids.setdefault(
+                connection_group.connection_group_name,
+                [],
+            ).append(connection_group.connection_group_id)
+        # Work out which (entity, object, permission) triples each table should hold
+        desired: dict[str, set[tuple[int, int, GuacamoleObjectPermissionType]]] = {
+            "connection": set(),
+            "connection_group": set(),
+        }
+        managed_object_ids: dict[str, set[int]] = {
+            "connection": set(),
+            "connection_group": set(),
+        }
+        for rule in self.permission_rules:
+            if rule.connection is not None:
+                kind, object_ids = "connection", connection_ids.get(rule.connection, [])
+            else:
+                kind = "connection_group"
+                object_ids = connection_group_ids.get(rule.connection_group or "", [])
+            if not object_ids:
+                logger.warning(
+                    "Could not find %s '%s' for permission rule.",
+                    kind.replace("_", " "),
+                    rule.connection or rule.connection_group,
+                )
+            if rule.group is not None:
+                entity_ids = [
+                    entity_id
+                    for name, entity_id in group_entity_ids.items()
+                    if name == rule.group
+                ]
+            else:
+                entity_ids = [
+                    user_entity_ids[user.name]
+                    for user in users
+                    if user.name in user_entity_ids
+                    and user.attributes.get(rule.attribute or "") == rule.value
+                ]
+            managed_object_ids[kind].update(object_ids)
+            desired[kind].update(
+                (entity_id, object_id, GuacamoleObjectPermissionType(permission))
+                for entity_id in entity_ids
+                for object_id in object_ids
+                for permission in rule.permissions
+            )
+        managed_entity_ids = {
+            *group_entity_ids.values(),
+            *(
+                user_entity_ids[user.name]
+                for user in users
+                if user.name in user_entity_ids
+            ),
+        }
+        return self.reconcile_permissions(
+            GuacamoleConnectionPermission,
+            "connection_id",
+            managed_entity_ids,
+            managed_object_ids["connection"],
+            desired["connection"],
+        ) + self.reconcile_permissions(
+            GuacamoleConnectionGroupPermission,
+            "connection_group_id",
+            managed_entity_ids,
+            managed_object_ids["connection_group"],
+            desired["connection_group"],
+        )
+
+    def update_users(self, users: list[LDAPUser]) -> int:
         """Update the entities table with desired users."""
         # Set users to desired list
         logger.info("Ensuring that %s user(s) are registered", len(users))
         desired_usernames = [user.name for user in users]
-        current_usernames = [
-            user.name
-            for user in self.backend.query(
-                GuacamoleEntity,
-                type=GuacamoleEntityType.USER,
-            )
-        ]
+        diff = self.entity_diff(desired_usernames, GuacamoleEntityType.USER)
         # Add users
-        logger.debug(
-            "There are %s user(s) currently registered",
-            len(current_usernames),
-        )
-        usernames_to_add = [
-            username
-            for username in desired_usernames
-            if username not in current_usernames
-        ]
-        logger.debug("... %s user(s) will be added", len(usernames_to_add))
+        logger.debug("There are %s user(s) currently registered", diff.n_current)
+        logger.debug("... %s user(s) will be added", len(diff.to_add))
         self.backend.add_all(
             [
                 GuacamoleEntity(name=username, type=GuacamoleEntityType.USER)
-                for username in usernames_to_add
+                for username in diff.to_add
             ],
         )
+        self.emit("user", "added", diff.to_add)
         # Remove users
-        usernames_to_remove = [
-            username
-            for username in current_usernames
-            if username not in desired_usernames
-        ]
-        logger.debug("... %s user(s) will be removed", len(usernames_to_remove))
-        for username in usernames_to_remove:
+        if self.retention_options.disable_missing_users:
+            return (
+                len(diff.to_add)
+                + self.disable_users(diff.to_remove)
+                + self.enable_users(desired_usernames)
+            )
+        logger.debug("... %s user(s) will be removed", len(diff.to_remove))
+        if diff.to_remove:
             self.backend.delete(
                 GuacamoleEntity,
-                GuacamoleEntity.name == username,
+                GuacamoleEntity.name.in_(diff.to_remove),
                 GuacamoleEntity.type == GuacamoleEntityType.USER,
             )
+            self.emit("user", "removed", diff.to_remove)
+        return len(diff.to_add) + len(diff.to_remove)
 
-    def update_user_entities(self, users: list[LDAPUser]) -> None:
-        """Add user entities to the users table."""
-        current_user_entity_ids = [
-            user.entity_id for user in self.backend.query(GuacamoleUser)
-        ]
-        logger.debug(
-            "There are %s user entit(y|ies) currently registered",
-            len(current_user_entity_ids),
+    def update_user_attributes(self, users: list[LDAPUser]) -> int:
+        """Copy mapped LDAP attributes into the user attributes table."""
+        if not any(user.attributes for user in users):
+            return 0
+        logger.info("Ensuring that attributes of %s user(s) are correct", len(users))
+        entity_ids = self.entity_ids(
+            (user.name for user in users),
+            GuacamoleEntityType.USER,
         )
-        user_entities = self.backend.query(
-            GuacamoleEntity,
-            type=GuacamoleEntityType.USER,
+        user_ids = {
+            entity_id: user.user_id
+            for entity_id, user in self.users_by_entity_id(entity_ids.values()).items()
+        }
+        return self.reconcile_attributes(
+            GuacamoleUserAttribute,
+            "user_id",
+            {
+                user_ids[entity_ids[user.name]]: user.attributes
+                for user in users
+                if entity_ids.get(user.name) in user_ids
+            },
         )
-        new_users = [
-            GuacamoleUserDetails(
-                entity_id=entity.entity_id,
-                full_name=user.display_name,
-                name=user.name,
-            )
-            for user in users
-            for entity in user_entities
-            if entity.name == user.name
-            and entity.entity_id not in current_user_entity_ids
-        ]
-        logger.debug("... %s user entit(y|ies) will be added", len(new_users))
 
-        self.backend.add_all(
-            [
-                GuacamoleUser(
-                    entity_id=new_user.entity_id,
-                    full_name=new_user.full_name,
-                    password_date=datetime.now(tz=UTC),
-                    password_hash=secrets.token_bytes(32),
-                    password_salt=secrets.token_bytes(32),
+    def update_user_entities(self, users: list[LDAPUser]) -> int:
+        """Add user entities to the users table and update any changed details.
+
+        LDAP users are compared in batches, reading only the matching entity and
+        user rows for each batch, so neither table is held in memory. Details are
+        compared by hashing the synchronised columns, and the users whose details
+        changed are updated together with one bulk UPDATE per batch.
+        """
+        n_current = n_added = n_updated = 0
+        users_by_name = {user.name: user for user in users}
+        for names in batches(users_by_name):
+            entity_ids = self.entity_ids(names, GuacamoleEntityType.USER)
+            current_users = self.users_by_entity_id(entity_ids.values())
+            n_current += len(current_users)
+            user_details = [
+                GuacamoleUserDetails(
+                    entity_id=entity_ids[user.name],
+                    full_name=user.display_name,
+                    name=user.name,
+                    email_address=user.email_address or None,
+                    organization=user.organization or None,
+                    organizational_role=user.organizational_role or None,
                 )
-                for new_user in new_users
-            ],
-        )
-        # Clean up any unused entries
-        valid_entity_ids = [
-            user.entity_id
-            for user in self.backend.query(
-                GuacamoleEntity,
-                type=GuacamoleEntityType.USER,
+                for user in (users_by_name[name] for name in names)
+                if user.name in entity_ids
+            ]
+            new_users = [
+                details
+                for details in user_details
+                if details.entity_id not in current_users
+            ]
+            self.backend.add_all(
+                [
+                    GuacamoleUser(
+                        entity_id=new_user.entity_id,
+                        password_date=datetime.now(tz=UTC),
+                        password_hash=secrets.token_bytes(32),
+                        password_salt=secrets.token_bytes(32),
+                        **new_user.columns,
+                    )
+                    for new_user in new_users
+                ],
             )
-        ]
-        logger.debug("There are %s valid user entit(y|ies)", len(valid_entity_ids))
-        self.backend.delete(
+            n_added += len(new_users)
+            changed_users = [
+                details
+                for details in user_details
+                if (current_user := current_users.get(details.entity_id))
+                and details.digest
+                != column_digest(
+                    {name: getattr(current_user, name) for name in details.columns},
+                )
+            ]
+            n_updated += self.backend.update_many(
+                GuacamoleUser,
+                "entity_id",
+                [
+                    {"entity_id": details.entity_id, **details.columns}
+                    for details in changed_users
+                ],
+            )
+        logger.debug(
+            "There are %s user entit(y|ies) currently registered",
+            n_current,
+        )
+        logger.debug("... %s user entit(y|ies) were added", n_added)
+        logger.debug("... %s user entit(y|ies) were updated", n_updated)
+        # Clean up users whose entity no longer exists, without reading either table
+        n_removed = self.backend.delete(
             GuacamoleUser,
-            GuacamoleUser.entity_id.not_in(valid_entity_ids),
+            GuacamoleUser.entity_id.not_in(
+                select(GuacamoleEntity.entity_id).where(
+                    GuacamoleEntity.type == GuacamoleEntityType.USER,
+                ),
+            ),
         )
+        logger.debug("... %s unused user entit(y|ies) were removed", n_removed)
+        return n_added + n_updated + n_removed
+
+    def user_groups_by_entity_id(
+        self,
+        entity_ids: Iterable[int],
+    ) -> dict[int, GuacamoleUserGroup]:
+        """Map entity IDs to their registered user groups, reading them in batches."""
+        return {
+            user_group.entity_id: user_group
+            for batch in batches(entity_ids)
+            for user_group in self.backend.query_filtered(
+                GuacamoleUserGroup,
+                GuacamoleUserGroup.entity_id.in_(batch),
+            )
+        }
+
+    def users_by_entity_id(self, entity_ids: Iterable[int]) -> dict[int, GuacamoleUser]:
+        """Map entity IDs to their registered users, reading them in batches."""
+        return {
+            user.entity_id: user
+            for batch in batches(entity_ids)
+            for user in self.backend.query_filtered(
+                GuacamoleUser,
+                GuacamoleUser.entity_id.in_(batch),
+            )
+        }
+
+    def users_named(self, usernames: list[str]) -> list[GuacamoleUser]:
+        """Return the users with the given names."""
+        entity_ids = self.entity_ids(usernames, GuacamoleEntityType.USER)
+        return list(self.users_by_entity_id(entity_ids.values()).values())
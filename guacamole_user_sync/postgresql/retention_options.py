@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from datetime import timedelta
+
+
+@dataclass
+class PostgreSQLRetentionOptions:
+    """Dataclass for holding options for users that are no longer in LDAP.
+
+    If `disable_missing_users` is set, these users are disabled rather than deleted.
+    They are purged once they have been disabled for `grace_period`, at most
+    `purge_batch_size` at a time, pausing for `purge_pause` seconds between batches.
+    """
+
+    disable_missing_users: bool = False
+    grace_period: timedelta = timedelta(days=30)
+    purge_batch_size: int = 100
+    purge_pause: float = 1.0
@@ -0,0 +1,7 @@
+from enum import StrEnum
+
+
+class SchemaVersion(StrEnum):
+    """Version for Guacamole database schema."""
+
+    v1_5_5 = "1.5.5"
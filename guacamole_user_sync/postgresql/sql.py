@@ -1,17 +1,11 @@
 import logging
-from enum import StrEnum
 from pathlib import Path
 
-import sqlparse
 from sqlalchemy import TextClause, text
 
-logger = logging.getLogger("guacamole_user_sync")
-
-
-class SchemaVersion(StrEnum):
-    """Version for Guacamole database schema."""
+from .schema_version import SchemaVersion
 
-    v1_5_5 = "1.5.5"
+logger = logging.getLogger("guacamole_user_sync")
 
 
 class GuacamoleSchema:
@@ -19,6 +13,9 @@ class GuacamoleSchema:
 
     @classmethod
     def commands(cls, schema_version: SchemaVersion) -> list[TextClause]:
+        # sqlparse is only needed here, so it is not imported at startup
+        import sqlparse
+
         logger.info("Ensuring correct schema for Guacamole %s", schema_version.value)
         commands = []
         sql_file_path = Path(__file__).with_name(
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class PostgreSQLWriteOptions:
+    """Dataclass for holding options for splitting writes into chunks.
+
+    Each chunk is committed separately. The chunk size starts at `chunk_size` and
+    adapts to keep commits below `target_commit_latency` seconds, within the given
+    bounds. Chunks start at least `min_chunk_interval` seconds apart. Each chunk
+    waits at most `lock_timeout` seconds for locks and is retried, at a smaller
+    size, up to `max_retries` times if it times out. Setting `chunk_size` to None
+    writes everything in one transaction.
+    """
+
+    chunk_size: int | None = 500
+    lock_timeout: float | None = 2.0
+    max_chunk_size: int = 5000
+    max_retries: int = 3
+    min_chunk_interval: float = 0
+    min_chunk_size: int = 10
+    target_commit_latency: float = 0.25
@@ -0,0 +1,103 @@
+import json
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+from .write_options import PostgreSQLWriteOptions
+
+# Approximate per-row overhead of a PostgreSQL heap tuple, in bytes
+ROW_OVERHEAD = 24
+
+# Columns holding random credentials, which are never written to a plan's output
+SECRET_COLUMNS = frozenset({"password_hash", "password_salt"})
+
+
+def row_size(row: dict[str, Any]) -> int:
+    """Estimate how many bytes a row occupies when written."""
+    size = ROW_OVERHEAD
+    for value in row.values():
+        if isinstance(value, bytes):
+            size += len(value)
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        else:
+            size += 8
+    return size
+
+
+@dataclass
+class PlannedWrite:
+    """One row that a synchronisation would add, remove or update."""
+
+    action: str
+    table: str
+    row: dict[str, Any]
+
+
+@dataclass
+class WritePlan:
+    """Writes recorded instead of applied, with an estimate of their cost.
+
+    The estimate assumes that every chunk holds the initial chunk size and takes
+    the target commit latency, since the chunk size only adapts while writing.
+    """
+
+    write_options: PostgreSQLWriteOptions
+    n_bytes: int = 0
+    n_statements: int = 0
+    n_transactions: int = 0
+    writes: list[PlannedWrite] = field(default_factory=list)
+
+    @property
+    def estimated_seconds(self) -> float:
+        return self.n_transactions * self.write_options.target_commit_latency + max(
+            self.n_transactions - 1,
+            0,
+        ) * (self.write_options.min_chunk_interval)
+
+    def record(
+        self,
+        action: str,
+        table: str,
+        rows: list[dict[str, Any]],
+        *,
+        statements_per_chunk: int = 1,
+    ) -> int:
+        """Record rows that would be written, returning how many there are."""
+        if not rows:
+            return 0
+        chunk_size = self.write_options.chunk_size or len(rows)
+        n_chunks = math.ceil(len(rows) / chunk_size)
+        if self.write_options.lock_timeout is not None:
+            statements_per_chunk += 1
+        self.n_bytes += sum(row_size(row) for row in rows)
+        self.n_statements += n_chunks * statements_per_chunk
+        self.n_transactions += n_chunks
+        self.writes += [PlannedWrite(action, table, row) for row in rows]
+        return len(rows)
+
+    def summary(self) -> dict[str, Any]:
+        rows = Counter(f"{write.table}.{write.action}" for write in self.writes)
+        return {
+            "estimated_bytes": self.n_bytes,
+            "estimated_seconds": round(self.estimated_seconds, 3),
+            "rows": dict(sorted(rows.items())),
+            "statements": self.n_statements,
+            "transactions": self.n_transactions,
+        }
+
+    def write_jsonl(self, output: TextIO, **context: Any) -> None:  # noqa: ANN401
+        """Write one JSON line for each planned row, then one for the summary.
+
+        Password hashes and salts are left out of each row.
+        """
+        for write in self.writes:
+            line = {**context, "action": write.action, "table": write.table}
+            row = {
+                name: value
+                for name, value in write.row.items()
+                if name not in SECRET_COLUMNS
+            }
+            output.write(json.dumps({**line, "row": row}, default=str) + "\n")
+        output.write(json.dumps({**context, "summary": self.summary()}) + "\n")
@@ -0,0 +1,84 @@
+import logging
+import math
+import time
+from collections.abc import Callable, Sequence
+from typing import TypeVar
+
+from psycopg.errors import LockNotAvailable
+from sqlalchemy.exc import OperationalError
+
+from .write_options import PostgreSQLWriteOptions
+
+logger = logging.getLogger("guacamole_user_sync")
+
+T = TypeVar("T")
+
+
+class PostgreSQLWriteScheduler:
+    """Apply writes in chunks whose size adapts to the measured commit latency."""
+
+    def __init__(
+        self,
+        options: PostgreSQLWriteOptions,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.chunk_size = options.chunk_size or 0
+        self.clock = clock
+        self.last_started = -math.inf
+        self.options = options
+        self.sleep = sleep
+
+    def adapt(self, latency: float) -> None:
+        """Halve the chunk size after a slow commit and double it after a fast one."""
+        if latency > self.options.target_commit_latency:
+            chunk_size = max(self.options.min_chunk_size, self.chunk_size // 2)
+        elif latency < self.options.target_commit_latency / 2:
+            chunk_size = min(self.options.max_chunk_size, self.chunk_size * 2)
+        else:
+            return
+        if chunk_size != self.chunk_size:
+            logger.debug(
+                "Commit took %.3f seconds, changing chunk size from %s to %s.",
+                latency,
+                self.chunk_size,
+                chunk_size,
+            )
+            self.chunk_size = chunk_size
+
+    def run(self, items: Sequence[T], write: Callable[[Sequence[T]], int]) -> int:
+        """Write items in committed chunks, returning the total number written."""
+        if not self.options.chunk_size:
+            return write(items)
+        n_written, retries, start = 0, 0, 0
+        while start < len(items):
+            chunk = items[start : start + self.chunk_size]
+            self.throttle()
+            started = self.clock()
+            try:
+                n_written += write(chunk)
+            except OperationalError as exc:
+                if (
+                    not isinstance(exc.orig, LockNotAvailable)
+                    or retries >= self.options.max_retries
+                ):
+                    raise
+                retries += 1
+                self.chunk_size = max(self.options.min_chunk_size, self.chunk_size // 2)
+                logger.warning(
+                    "Timed out waiting for PostgreSQL locks, retrying with %s rows.",
+                    self.chunk_size,
+                )
+                continue
+            retries = 0
+            self.adapt(self.clock() - started)
+            start += len(chunk)
+        return n_written
+
+    def throttle(self) -> None:
+        """Wait until the minimum interval since the previous chunk has passed."""
+        delay = self.last_started + self.options.min_chunk_interval - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+        self.last_started = self.clock()
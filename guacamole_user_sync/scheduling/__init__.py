@@ -0,0 +1,14 @@
+"""Schedule synchronisation cycles."""
+
+from .cycle_profiler import CycleProfiler
+from .phase_tracker import SyncPhaseTracker
+from .sync_scheduler import SyncOutcome, SyncScheduler
+from .sync_trigger import SyncTrigger
+
+__all__ = [
+    "CycleProfiler",
+    "SyncOutcome",
+    "SyncPhaseTracker",
+    "SyncScheduler",
+    "SyncTrigger",
+]
@@ -0,0 +1,156 @@
+import cProfile
+import functools
+import inspect
+import logging
+import random
+import signal
+import threading
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class CycleProfiler:
+    """Profile selected synchronisations with cProfile and tracemalloc.
+
+    A synchronisation is profiled while armed cycles remain, which are set at
+    startup or by a signal, and otherwise with probability `sample_rate`. Each
+    profile writes cProfile statistics, readable with pstats or snakeviz, and the
+    `top_allocations` lines that allocated the most memory to `directory`. When no
+    synchronisation is selected the only overhead is a counter check.
+
+    Allocation reports include every tenant running at the same time. With
+    asynchronous synchronisation the cProfile statistics also include the other
+    tenants on the event loop.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        cycles: int = 0,
+        sample_rate: float = 0,
+        top_allocations: int = 25,
+        uniform: Callable[[], float] = random.random,
+    ) -> None:
+        self.directory = directory
+        self.remaining = cycles
+        self.sample_rate = sample_rate
+        self.top_allocations = top_allocations
+        self.uniform = uniform
+        self._lock = threading.Lock()
+        self._active = False
+        self._n_profiled = 0
+
+    def arm(self, cycles: int) -> None:
+        """Profile the next few synchronisations."""
+        with self._lock:
+            self.remaining += cycles
+        logger.info("Profiling the next %s synchronisation(s).", self.remaining)
+
+    def handle_signals(
+        self,
+        cycles: int = 1,
+        signals: tuple[signal.Signals, ...] = (signal.SIGUSR2,),
+    ) -> None:
+        """Profile the next few synchronisations whenever a signal is received."""
+
+        def handler(*_: int | FrameType | None) -> None:
+            # Arm from another thread as the main thread may hold the lock
+            threading.Thread(target=self.arm, args=(cycles,), daemon=True).start()
+
+        for signum in signals:
+            signal.signal(signum, handler)
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """Profile the code run in this context and write the results."""
+        self._n_profiled += 1
+        name = f"{datetime.now(tz=UTC):%Y%m%dT%H%M%S}-{self._n_profiled:04d}"
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.write(name, profiler, snapshot)
+            with self._lock:
+                self._active = False
+
+    def selected(self) -> bool:
+        """Return whether the next synchronisation should be profiled.
+
+        Only one synchronisation is profiled at a time, so concurrent tenants wait
+        for a later cycle rather than using up the armed cycles.
+        """
+        if self.remaining <= 0 and self.sample_rate <= 0:
+            return False
+        with self._lock:
+            if self._active:
+                return False
+            if self.remaining > 0:
+                self.remaining -= 1
+            elif self.uniform() >= self.sample_rate:
+                return False
+            self._active = True
+        return True
+
+    def wrap(self, function: Callable[..., Any]) -> Callable[..., Any]:
+        """Profile selected calls to a synchronise function or coroutine function."""
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def profiled_async(**kwargs: Any) -> Any:  # noqa: ANN401
+                if not self.selected():
+                    return await function(**kwargs)
+                with self.profile():
+                    return await function(**kwargs)
+
+            return profiled_async
+
+        @functools.wraps(function)
+        def profiled(**kwargs: Any) -> Any:  # noqa: ANN401
+            if not self.selected():
+                return function(**kwargs)
+            with self.profile():
+                return function(**kwargs)
+
+        return profiled
+
+    def write(
+        self,
+        name: str,
+        profiler: cProfile.Profile,
+        snapshot: tracemalloc.Snapshot,
+    ) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(self.directory / f"{name}.prof")
+            statistics = snapshot.filter_traces(
+                (
+                    tracemalloc.Filter(
+                        inclusive=False,
+                        filename_pattern=tracemalloc.__file__,
+                    ),
+                ),
+            ).statistics("lineno")
+            with (self.directory / f"{name}-allocations.txt").open(
+                "w",
+                encoding="utf-8",
+            ) as f_allocations:
+                f_allocations.writelines(
+                    f"{statistic}\n" for statistic in statistics[: self.top_allocations]
+                )
+        except OSError:
+            logger.warning("Unable to write profile to %s.", self.directory)
+            return
+        logger.info("Wrote profile %s to %s.", name, self.directory)
@@ -0,0 +1,49 @@
+import time
+from collections.abc import Callable, Collection, Mapping
+
+from guacamole_user_sync.models import SyncPhase
+
+# Phases run by every forced cycle, whether or not they are due
+FORCED_PHASES = frozenset({SyncPhase.GROUPS, SyncPhase.MEMBERSHIPS, SyncPhase.USERS})
+
+
+class SyncPhaseTracker:
+    """Track which synchronisation phases are due.
+
+    Each phase runs at most once every `intervals[phase]` seconds, measured from
+    the start of the last cycle in which it completed. A phase that fails stays due.
+    `tolerance` lets a phase run in a cycle that starts slightly early, for example
+    because of scheduling jitter. A forced cycle, which was requested early or
+    follows a cycle that found changes, also runs the phases in FORCED_PHASES.
+    """
+
+    def __init__(
+        self,
+        intervals: Mapping[SyncPhase, float],
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        tolerance: float = 0,
+    ) -> None:
+        self.clock = clock
+        self.intervals = dict(intervals)
+        self.last_completed: dict[SyncPhase, float] = {}
+        self.tolerance = tolerance
+
+    def completed(self, phases: Collection[SyncPhase], started: float) -> None:
+        for phase in phases:
+            self.last_completed[phase] = started
+
+    def due(
+        self,
+        now: float | None = None,
+        *,
+        forced: bool = False,
+    ) -> frozenset[SyncPhase]:
+        now = self.clock() if now is None else now
+        return frozenset(
+            phase
+            for phase, interval in self.intervals.items()
+            if (forced and phase in FORCED_PHASES)
+            or phase not in self.last_completed
+            or now + self.tolerance >= self.last_completed[phase] + interval
+        )
@@ -0,0 +1,138 @@
+import logging
+import math
+import random
+import time
+from collections.abc import Callable
+from enum import StrEnum
+
+from .sync_trigger import SyncTrigger
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class SyncOutcome(StrEnum):
+    """Outcome of a single synchronisation cycle."""
+
+    CHANGED = "changed"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    UNCHANGED = "unchanged"
+
+
+class SyncScheduler:
+    """Run synchronisation cycles at a fixed rate.
+
+    Cycles start every `interval` seconds, measured from the start of the previous
+    cycle, with random jitter to keep replicas from running in lockstep. A cycle
+    that finds changes is followed sooner, after `active_interval` seconds. Failed
+    cycles are retried with exponential backoff, starting at `retry_interval` and
+    capped at `max_retry_interval`. A standby replica that skipped a cycle checks
+    again after `standby_interval` seconds so that it can take over quickly.
+    Deadlines that pass while a cycle is still running are skipped and counted in
+    `missed_deadlines`. An optional trigger can wake the scheduler early to start
+    the next cycle immediately.
+
+    Each cycle is called with `forced=True` if it was started by the trigger, or
+    follows a changed cycle sooner than `interval`, so that it does its work even
+    though no phase is due yet.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        interval: float,
+        *,
+        active_interval: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        jitter: float = 0.1,
+        max_retry_interval: float = 3600,
+        retry_interval: float = 30,
+        sleep: Callable[[float], None] = time.sleep,
+        standby_interval: float | None = None,
+        trigger: SyncTrigger | None = None,
+    ) -> None:
+        self.active_interval = active_interval or interval
+        self.clock = clock
+        self.failures = 0
+        self.interval = interval
+        self.jitter = jitter
+        self.max_retry_interval = max_retry_interval
+        self.missed_deadlines = 0
+        self.retry_interval = retry_interval
+        self.sleep = sleep
+        self.standby_interval = standby_interval or interval
+        self.trigger = trigger
+
+    def jitter_offset(self, delay: float) -> float:
+        """Return a random offset of up to +/- `jitter` times a delay."""
+        spread = delay * self.jitter
+        return random.uniform(-spread, spread)  # noqa: S311
+
+    def next_start(
+        self,
+        outcome: SyncOutcome,
+        started: float,
+        finished: float,
+    ) -> float:
+        """Return the clock time at which the next cycle should start."""
+        if outcome == SyncOutcome.FAILED:
+            self.failures += 1
+            delay = min(
+                self.retry_interval * 2.0 ** (self.failures - 1),
+                self.max_retry_interval,
+            )
+            logger.info("Synchronisation failed %s time(s) in a row.", self.failures)
+            return finished + delay + self.jitter_offset(delay)
+        self.failures = 0
+        interval = {
+            SyncOutcome.CHANGED: self.active_interval,
+            SyncOutcome.SKIPPED: self.standby_interval,
+        }.get(outcome, self.interval)
+        deadline = started + interval
+        if deadline < finished:
+            missed = math.ceil((finished - deadline) / interval)
+            self.missed_deadlines += missed
+            logger.warning(
+                "Synchronisation took %.1f seconds, missing %s deadline(s).",
+                finished - started,
+                missed,
+            )
+            deadline += missed * interval
+        return deadline + self.jitter_offset(interval)
+
+    def run(
+        self,
+        cycle: Callable[..., SyncOutcome],
+        *,
+        max_cycles: int | None = None,
+    ) -> None:
+        """Run cycles until terminated, or until `max_cycles` have run."""
+        forced = False
+        n_cycles = 0
+        while max_cycles is None or n_cycles < max_cycles:
+            started = self.clock()
+            outcome = cycle(forced=forced)
+            finished = self.clock()
+            n_cycles += 1
+            logger.info(
+                "Synchronisation %s after %.1f seconds.",
+                outcome.value,
+                finished - started,
+            )
+            next_start = self.next_start(outcome, started, finished)
+            if max_cycles is not None and n_cycles >= max_cycles:
+                break
+            woken = self.wait(max(0.0, next_start - self.clock()))
+            forced = woken or (
+                outcome == SyncOutcome.CHANGED and self.active_interval < self.interval
+            )
+
+    def wait(self, delay: float) -> bool:
+        """Wait until the next cycle, returning True if the trigger woke us early."""
+        logger.info("Waiting %.0f seconds.", delay)
+        if not self.trigger:
+            self.sleep(delay)
+            return False
+        if self.trigger.wait(delay):
+            logger.info("Starting synchronisation early.")
+            return True
+        return False
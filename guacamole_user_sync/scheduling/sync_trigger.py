@@ -0,0 +1,100 @@
+import logging
+import signal
+import socketserver
+import threading
+import time
+from collections.abc import Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import FrameType
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+class SyncTrigger:
+    """Wake the scheduler early when an immediate synchronisation is requested.
+
+    Requests that arrive within `coalesce_window` seconds of each other, or while a
+    cycle is running, are merged into a single cycle.
+    """
+
+    def __init__(self, *, coalesce_window: float = 5) -> None:
+        self.coalesce_window = coalesce_window
+        self._event = threading.Event()
+        self._servers: list[socketserver.BaseServer] = []
+
+    def close(self) -> None:
+        """Stop any endpoints that are listening for requests."""
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def handle_signals(
+        self,
+        signals: Iterable[signal.Signals] = (signal.SIGHUP, signal.SIGUSR1),
+    ) -> None:
+        """Request a synchronisation whenever one of these signals is received."""
+
+        def handler(signum: int, _: FrameType | None) -> None:
+            # Set the event from another thread as the main thread may hold its lock
+            threading.Thread(
+                target=self.request,
+                args=(signal.Signals(signum).name,),
+                daemon=True,
+            ).start()
+
+        for signum in signals:
+            signal.signal(signum, handler)
+
+    def request(self, source: str) -> None:
+        logger.info("Immediate synchronisation requested by %s.", source)
+        self._event.set()
+
+    def serve_http(self, port: int, host: str = "127.0.0.1") -> int:
+        """Request a synchronisation for every POST to /sync on a local port.
+
+        Returns the port that is being listened on.
+        """
+        trigger = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802
+                if self.path != "/sync":
+                    self.send_error(404)
+                    return
+                trigger.request("HTTP request")
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, *_: object) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        self._start(server)
+        return int(server.server_address[1])
+
+    def serve_unix_socket(self, path: Path) -> None:
+        """Request a synchronisation for every connection to a Unix socket."""
+        trigger = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                trigger.request("Unix socket")
+                self.wfile.write(b"ok\n")
+
+        path.unlink(missing_ok=True)
+        self._start(socketserver.ThreadingUnixStreamServer(str(path), Handler))
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for up to `timeout` seconds, returning True if woken by a request."""
+        if not self._event.wait(timeout):
+            return False
+        # Give closely-spaced requests a chance to arrive before the cycle starts
+        time.sleep(self.coalesce_window)
+        self._event.clear()
+        return True
+
+    def _start(self, server: socketserver.BaseServer) -> None:
+        self._servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
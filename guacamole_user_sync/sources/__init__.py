@@ -0,0 +1,34 @@
+"""Read LDAP groups and users from files as well as live directories."""
+
+from typing import TYPE_CHECKING
+
+from guacamole_user_sync.lazy_import import lazy_attributes
+
+if TYPE_CHECKING:
+    from .directory_source import DirectorySource
+    from .file_source import file_source
+    from .ldif_source import LDIFSource, parse_ldif
+    from .snapshot import SnapshotRecorder, SnapshotSource
+
+__all__ = [
+    "DirectorySource",
+    "LDIFSource",
+    "SnapshotRecorder",
+    "SnapshotSource",
+    "file_source",
+    "parse_ldif",
+]
+
+# Submodules are imported on first use, so that ldap3 is only imported when a
+# file is read
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "DirectorySource": "directory_source",
+        "LDIFSource": "ldif_source",
+        "SnapshotRecorder": "snapshot",
+        "SnapshotSource": "snapshot",
+        "file_source": "file_source",
+        "parse_ldif": "ldif_source",
+    },
+)
@@ -0,0 +1,29 @@
+from collections.abc import Sequence
+from contextlib import AbstractContextManager
+from typing import Protocol
+
+from guacamole_user_sync.models import LDAPGroup, LDAPQuery, LDAPUser
+
+
+class DirectorySource(Protocol):
+    """Anything that can list the LDAP groups and users matching a query.
+
+    LDAPClient searches a live directory, while LDIFSource and SnapshotSource read
+    files, so that a synchronisation can be reproduced without LDAP access.
+    """
+
+    def reuse_results(self) -> AbstractContextManager[None]: ...
+
+    def search_groups(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = ...,
+    ) -> list[LDAPGroup]: ...
+
+    def search_users(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = ...,
+    ) -> list[LDAPUser]: ...
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from guacamole_user_sync.models import InternTable
+
+from .directory_source import DirectorySource
+from .ldif_source import LDIFSource
+from .snapshot import SnapshotSource
+
+
+def file_source(
+    path: Path,
+    *,
+    intern_table: InternTable | None = None,
+) -> DirectorySource:
+    """Return a source reading an LDIF file, or a snapshot for any other suffix."""
+    if path.suffix.lower() == ".ldif":
+        return LDIFSource(path, intern_table=intern_table)
+    return SnapshotSource(path, intern_table=intern_table)
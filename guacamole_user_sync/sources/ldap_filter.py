@@ -0,0 +1,102 @@
+import re
+from collections.abc import Callable, Mapping, Sequence
+from typing import Any
+
+from ldap3.core.exceptions import LDAPInvalidFilterError
+from ldap3.operation.search import (
+    AND,
+    MATCH_APPROX,
+    MATCH_EQUAL,
+    MATCH_EXTENSIBLE,
+    MATCH_GREATER_OR_EQUAL,
+    MATCH_LESS_OR_EQUAL,
+    MATCH_PRESENT,
+    MATCH_SUBSTRING,
+    NOT,
+    OR,
+    ROOT,
+    parse_filter,
+)
+
+from guacamole_user_sync.models import LDAPError
+
+# Raw attribute values of an entry, keyed by lower-case attribute name
+Attributes = Mapping[str, Sequence[bytes]]
+
+ESCAPED_BYTE = re.compile(rb"\\([0-9A-Fa-f]{2})")
+
+
+def fold(value: bytes) -> str:
+    """Decode an attribute value for case-insensitive comparison."""
+    return value.decode("utf-8").casefold()
+
+
+def normalise(value: bytes) -> str:
+    """Decode a filter value for case-insensitive comparison, undoing escapes."""
+    return fold(ESCAPED_BYTE.sub(lambda match: bytes.fromhex(match[1].decode()), value))
+
+
+def compare(value: str, expected: str) -> int:
+    """Compare integer values numerically and anything else as strings."""
+    if value.lstrip("-").isdigit() and expected.lstrip("-").isdigit():
+        return (int(value) > int(expected)) - (int(value) < int(expected))
+    return (value > expected) - (value < expected)
+
+
+def substring_matches(value: str, assertion: dict[str, Any]) -> bool:
+    position = 0
+    if initial := assertion.get("initial"):
+        if not value.startswith(normalised := normalise(initial)):
+            return False
+        position = len(normalised)
+    for part in map(normalise, assertion.get("any") or ()):
+        if (found := value.find(part, position)) < 0:
+            return False
+        position = found + len(part)
+    final = normalise(assertion["final"]) if assertion.get("final") else ""
+    return value.endswith(final) and len(value) - len(final) >= position
+
+
+def node_matches(node: Any, attributes: Attributes) -> bool:  # noqa: ANN401, PLR0911
+    """Evaluate one node of a parsed filter against an entry's attributes."""
+    if node.tag in (ROOT, AND):
+        return all(node_matches(element, attributes) for element in node.elements)
+    if node.tag == OR:
+        return any(node_matches(element, attributes) for element in node.elements)
+    if node.tag == NOT:
+        return not node_matches(node.elements[0], attributes)
+    assertion = node.assertion
+    values = [fold(value) for value in attributes.get(assertion["attr"].lower(), ())]
+    if node.tag == MATCH_PRESENT:
+        return bool(values)
+    if node.tag == MATCH_SUBSTRING:
+        return any(substring_matches(value, assertion) for value in values)
+    expected = normalise(assertion["value"])
+    if node.tag == MATCH_GREATER_OR_EQUAL:
+        return any(compare(value, expected) >= 0 for value in values)
+    if node.tag == MATCH_LESS_OR_EQUAL:
+        return any(compare(value, expected) <= 0 for value in values)
+    # Matching rules, such as LDAP_MATCHING_RULE_IN_CHAIN, are treated as equality
+    if node.tag in (MATCH_APPROX, MATCH_EQUAL, MATCH_EXTENSIBLE):
+        return expected in values
+    return False
+
+
+def filter_matcher(search_filter: str) -> Callable[[Attributes], bool]:
+    """Return a function testing whether an entry's attributes match a filter.
+
+    Comparisons ignore case, as for the directory string attributes used here.
+    """
+    try:
+        root = parse_filter(
+            search_filter,
+            schema=None,
+            auto_escape=False,
+            auto_encode=False,
+            validator=None,
+            check_names=False,
+        )
+    except LDAPInvalidFilterError as exc:
+        msg = f"Invalid LDAP filter {search_filter}."
+        raise LDAPError(msg) from exc
+    return lambda attributes: node_matches(root, attributes)
@@ -0,0 +1,139 @@
+import base64
+import binascii
+import logging
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from guacamole_user_sync.ldap import LDAPEntryParser
+from guacamole_user_sync.models import InternTable, LDAPError, LDAPQuery
+
+from .ldap_filter import filter_matcher
+
+logger = logging.getLogger("guacamole_user_sync")
+
+# Commas separate the RDNs of a DN unless they are escaped
+RDN_SEPARATOR = re.compile(r"(?<!\\),")
+
+
+def dn_components(dn: str) -> list[str]:
+    """Split a DN into RDNs, normalised for case-insensitive comparison."""
+    return [
+        "=".join(part.strip() for part in rdn.split("=", 1)).casefold()
+        for rdn in RDN_SEPARATOR.split(dn)
+        if rdn.strip()
+    ]
+
+
+def logical_lines(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """Unfold LDIF lines, yielding each with the number of its first line."""
+    current: str | None = None
+    start = 0
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip("\r\n")  # noqa: PLW2901
+        if line.startswith(" ") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, number
+    if current is not None:
+        yield start, current
+
+
+def parse_line(line: str, number: int) -> tuple[str, bytes]:
+    """Split an LDIF line into an attribute name and its raw value."""
+    name, separator, value = line.partition(":")
+    if not separator or not name:
+        msg = f"Line {number} is not an 'attribute: value' pair."
+        raise ValueError(msg)
+    if value.startswith(":"):
+        try:
+            return name, base64.b64decode(value[1:].strip(), validate=True)
+        except binascii.Error as exc:
+            msg = f"Line {number} has an invalid base64 value."
+            raise ValueError(msg) from exc
+    if value.startswith("<"):
+        msg = f"Line {number} refers to a URL, which is not supported."
+        raise ValueError(msg)
+    return name, value.lstrip(" ").encode("utf-8")
+
+
+def parse_ldif(lines: Iterable[str]) -> Iterator[tuple[str, dict[str, list[bytes]]]]:
+    """Yield the DN and raw attributes of each entry in an LDIF stream.
+
+    Attribute names are lower-cased, since they are case-insensitive. Change records
+    other than additions are skipped.
+    """
+    dn: str | None = None
+    attributes: dict[str, list[bytes]] = {}
+    skipping = False
+    for number, line in (*logical_lines(lines), (0, "")):
+        if line.startswith("#"):
+            continue
+        if not line:
+            if dn is not None and not skipping:
+                yield dn, attributes
+            dn, attributes, skipping = None, {}, False
+            continue
+        # Lines of a skipped change record, such as "-" separators, are not parsed
+        if skipping:
+            continue
+        name, value = parse_line(line, number)
+        if name.lower() == "dn":
+            dn = value.decode("utf-8")
+        elif dn is not None and name.lower() == "changetype":
+            skipping = value.strip() != b"add"
+        elif dn is not None:
+            attributes.setdefault(name.lower(), []).append(value)
+        elif name.lower() != "version":
+            msg = f"Line {number} is not part of an entry."
+            raise ValueError(msg)
+
+
+class LDIFSource(LDAPEntryParser):
+    """Read groups and users from an LDIF file instead of an LDAP server.
+
+    The file is streamed on each search, keeping only entries that are inside one of
+    the query's base DNs and match its filter. Values are compared ignoring case, and
+    matching rules such as LDAP_MATCHING_RULE_IN_CHAIN are treated as equality.
+    """
+
+    def __init__(self, path: Path, *, intern_table: InternTable | None = None) -> None:
+        super().__init__(intern_table=intern_table)
+        self.path = path
+
+    def search(
+        self,
+        query: LDAPQuery,
+        attributes: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        logger.info("Reading LDIF file %s with:", self.path)
+        logger.info("... filter: %s", query.filter)
+        matches = filter_matcher(query.filter)
+        base_dns = [dn_components(base_dn) for base_dn in query.base_dns]
+        results = []
+        try:
+            with self.path.open(encoding="utf-8") as f_ldif:
+                for dn, values in parse_ldif(f_ldif):
+                    components = dn_components(dn)
+                    if not any(
+                        components[len(components) - len(base_dn) :] == base_dn
+                        for base_dn in base_dns
+                    ) or not matches(values):
+                        continue
+                    results.append(
+                        {
+                            "dn": dn,
+                            "raw_attributes": {
+                                name: values.get(name.lower(), [])
+                                for name in attributes or values
+                            },
+                        },
+                    )
+        except (OSError, ValueError) as exc:
+            msg = f"Unable to read LDIF file {self.path}."
+            raise LDAPError(msg) from exc
+        logger.debug("LDIF file contained %s results.", len(results))
+        return results
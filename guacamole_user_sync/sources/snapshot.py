@@ -0,0 +1,200 @@
+import dataclasses
+import json
+import logging
+from collections.abc import Callable, Mapping, Sequence
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import Any, TypeVar
+
+from guacamole_user_sync.ldap import InterningSource
+from guacamole_user_sync.ldap.entry_parser import GROUP_ATTRIBUTES, USER_ATTRIBUTES
+from guacamole_user_sync.models import (
+    InternTable,
+    LDAPError,
+    LDAPGroup,
+    LDAPQuery,
+    LDAPUser,
+)
+
+from .directory_source import DirectorySource
+
+logger = logging.getLogger("guacamole_user_sync")
+
+T = TypeVar("T")
+Record = TypeVar("Record", LDAPGroup, LDAPUser)
+
+# The group and user fields filled from each LDAP attribute that can be requested
+GROUP_FIELDS = {"memberOf": "member_of", "memberUid": "member_uid"}
+USER_FIELDS = {
+    "displayName": "display_name",
+    "mail": "email_address",
+    "memberOf": "member_of",
+    "o": "organization",
+    "title": "organizational_role",
+    "uid": "uid",
+}
+
+
+def snapshot_record(kind: str, item: LDAPGroup | LDAPUser) -> str:
+    """Serialise a group or user as one compact JSON line."""
+    record: dict[str, Any] = {"type": kind}
+    for field in dataclasses.fields(item):
+        value = getattr(item, field.name)
+        if isinstance(value, Mapping):
+            value = dict(value)
+        elif isinstance(value, Sequence) and not isinstance(value, str):
+            value = list(value)
+        record[field.name] = value
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def merge_records(
+    previous: list[Record],
+    current: list[Record],
+    kept_fields: list[str],
+) -> list[Record]:
+    """Return the current records, with kept fields copied from previous records.
+
+    Records are matched by name. Records that are not in the current search are
+    dropped.
+    """
+    if not kept_fields or not previous:
+        return current
+    previous_by_name = {record.name: record for record in previous}
+    return [
+        (
+            dataclasses.replace(
+                record,
+                **{name: getattr(old, name) for name in kept_fields},
+            )
+            if (old := previous_by_name.get(record.name))
+            else record
+        )
+        for record in current
+    ]
+
+
+class SnapshotSource(InterningSource):
+    """Replay the groups and users recorded in a snapshot file.
+
+    A snapshot holds one group or user per JSON line, as written by
+    SnapshotRecorder. It records the results of a single tenant's queries, so the
+    queries and attributes passed to each search are ignored.
+    """
+
+    def __init__(self, path: Path, *, intern_table: InternTable | None = None) -> None:
+        super().__init__(intern_table=intern_table)
+        self.path = path
+
+    def load(self, kind: str, build: Callable[[dict[str, Any]], T]) -> list[T]:
+        """Stream the records of one type from the snapshot, building each one."""
+        try:
+            with self.path.open(encoding="utf-8") as f_snapshot:
+                items = [
+                    build(record)
+                    for line in f_snapshot
+                    if line.strip() and (record := json.loads(line))["type"] == kind
+                ]
+        except (KeyError, OSError, TypeError, ValueError) as exc:
+            msg = f"Unable to read snapshot {self.path}."
+            raise LDAPError(msg) from exc
+        logger.debug("Loaded %s LDAP %ss from %s", len(items), kind, self.path)
+        return items
+
+    def search_groups(
+        self,
+        query: LDAPQuery,  # noqa: ARG002
+        *,
+        attributes: Sequence[str] = GROUP_ATTRIBUTES,  # noqa: ARG002
+    ) -> list[LDAPGroup]:
+        return self.load(
+            "group",
+            lambda record: LDAPGroup(
+                member_of=self.intern_all(record["member_of"]),
+                member_uid=self.intern_all(record["member_uid"]),
+                name=self.intern(record["name"]),
+                attributes=record.get("attributes", {}),
+            ),
+        )
+
+    def search_users(
+        self,
+        query: LDAPQuery,  # noqa: ARG002
+        *,
+        attributes: Sequence[str] = USER_ATTRIBUTES,  # noqa: ARG002
+    ) -> list[LDAPUser]:
+        return self.load(
+            "user",
+            lambda record: LDAPUser(
+                display_name=record["display_name"],
+                member_of=self.intern_all(record["member_of"]),
+                name=self.intern(record["name"]),
+                uid=self.intern(record["uid"]),
+                email_address=record.get("email_address", ""),
+                organization=self.intern(record.get("organization", "")),
+                organizational_role=self.intern(record.get("organizational_role", "")),
+                attributes=record.get("attributes", {}),
+            ),
+        )
+
+
+class SnapshotRecorder:
+    """Record the groups and users returned by another source in a snapshot file.
+
+    The file is rewritten after every search with the latest groups and users, so
+    it can be replayed by SnapshotSource. Searches that request fewer attributes,
+    such as those for a single phase, only update the fields they requested. The
+    other fields keep the values recorded by an earlier search.
+    """
+
+    def __init__(self, source: DirectorySource, path: Path) -> None:
+        self.groups: list[LDAPGroup] = []
+        self.path = path
+        self.source = source
+        self.users: list[LDAPUser] = []
+
+    def reuse_results(self) -> AbstractContextManager[None]:
+        return self.source.reuse_results()
+
+    def save(self) -> None:
+        """Replace the snapshot file with the latest groups and users."""
+        partial = self.path.with_name(f"{self.path.name}.partial")
+        try:
+            with partial.open("w", encoding="utf-8") as f_snapshot:
+                f_snapshot.writelines(
+                    snapshot_record("group", group) for group in self.groups
+                )
+                f_snapshot.writelines(
+                    snapshot_record("user", user) for user in self.users
+                )
+            partial.replace(self.path)
+        except OSError:
+            logger.warning("Unable to write snapshot %s.", self.path)
+
+    def search_groups(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = GROUP_ATTRIBUTES,
+    ) -> list[LDAPGroup]:
+        self.groups = merge_records(
+            self.groups,
+            self.source.search_groups(query, attributes=attributes),
+            [name for attr, name in GROUP_FIELDS.items() if attr not in attributes],
+        )
+        self.save()
+        return self.groups
+
+    def search_users(
+        self,
+        query: LDAPQuery,
+        *,
+        attributes: Sequence[str] = USER_ATTRIBUTES,
+    ) -> list[LDAPUser]:
+        self.users = merge_records(
+            self.users,
+            self.source.search_users(query, attributes=attributes),
+            [name for attr, name in USER_FIELDS.items() if attr not in attributes],
+        )
+        self.save()
+        return self.users
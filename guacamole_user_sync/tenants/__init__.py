@@ -0,0 +1,24 @@
+"""Synchronise several Guacamole instances from one process."""
+
+from typing import TYPE_CHECKING
+
+from guacamole_user_sync.lazy_import import lazy_attributes
+
+if TYPE_CHECKING:
+    from .multi_tenant_synchroniser import MultiTenantSynchroniser
+    from .tenant_config import TenantConfig
+
+__all__ = [
+    "MultiTenantSynchroniser",
+    "TenantConfig",
+]
+
+# Submodules are imported on first use, so that configuration can be validated
+# before the LDAP and PostgreSQL clients are imported
+__getattr__ = lazy_attributes(
+    __name__,
+    {
+        "MultiTenantSynchroniser": "multi_tenant_synchroniser",
+        "TenantConfig": "tenant_config",
+    },
+)
@@ -0,0 +1,329 @@
+import asyncio
+import inspect
+import logging
+from collections import Counter
+from collections.abc import Awaitable, Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import cached_property, partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
+
+from guacamole_user_sync.events import (
+    EventEmitter,
+    EventSink,
+    JSONLinesSink,
+    UnixSocketSink,
+)
+from guacamole_user_sync.ldap import LDAPClient, LDAPSearchCache
+from guacamole_user_sync.models import InternTable, LDAPQuery, SyncPhase
+from guacamole_user_sync.postgresql import PostgreSQLClient
+from guacamole_user_sync.scheduling import SyncOutcome, SyncPhaseTracker
+from guacamole_user_sync.sources import DirectorySource, SnapshotRecorder, file_source
+
+from .tenant_config import TenantConfig
+
+if TYPE_CHECKING:
+    from guacamole_user_sync.aio import AsyncLDAPClient, AsyncPostgreSQLClient
+
+logger = logging.getLogger("guacamole_user_sync")
+
+
+@dataclass
+class Tenant:
+    """The clients and queries used to synchronise one tenant."""
+
+    config: TenantConfig
+    ldap_client: DirectorySource
+    ldap_group_query: LDAPQuery
+    ldap_user_query: LDAPQuery
+    phases: SyncPhaseTracker
+    postgresql_client: PostgreSQLClient
+
+    # The asynchronous wrappers are only imported by asynchronous synchronisation
+    @cached_property
+    def async_ldap_client(self) -> "AsyncLDAPClient":
+        """Wrap the LDAP client for an asynchronous synchronise function."""
+        from guacamole_user_sync.aio import AsyncLDAPClient
+
+        return AsyncLDAPClient(self.ldap_client)
+
+    @cached_property
+    def async_postgresql_client(self) -> "AsyncPostgreSQLClient":
+        """Wrap the PostgreSQL client for an asynchronous synchronise function."""
+        from guacamole_user_sync.aio import AsyncPostgreSQLClient
+
+        return AsyncPostgreSQLClient(self.postgresql_client)
+
+
+class MultiTenantSynchroniser:
+    """Synchronise many tenants from one process using a bounded worker pool.
+
+    Tenants that use the same LDAP servers and credentials share one LDAPClient,
+    and identical queries from different tenants are only sent once per cycle. Each
+    tenant tracks which phases are due separately, so a failure in one tenant does
+    not delay the others.
+
+    If synchronise is a coroutine function, tenants are synchronised concurrently on
+    one event loop, which is kept between cycles so that async connection pools can
+    be reused, instead of in a thread pool.
+    """
+
+    def __init__(
+        self,
+        tenants: list[TenantConfig],
+        synchronise: Callable[..., SyncOutcome | Awaitable[SyncOutcome]],
+        *,
+        max_workers: int = 4,
+        phase_intervals: Mapping[SyncPhase, float] | None = None,
+        phase_tolerance: float = 0,
+    ) -> None:
+        self.event_emitters: dict[tuple[str, str], EventEmitter] = {}
+        self.ldap_clients: dict[tuple[object, ...], DirectorySource] = {}
+        self.max_workers = max_workers
+        self.runner: asyncio.Runner | None = None
+        self.synchronise = synchronise
+        self.tenants = [
+            Tenant(
+                config=config,
+                ldap_client=self.ldap_client(config),
+                ldap_group_query=config.ldap_group_query,
+                ldap_user_query=config.ldap_user_query,
+                phases=SyncPhaseTracker(
+                    phase_intervals or dict.fromkeys(SyncPhase, 0),
+                    tolerance=phase_tolerance,
+                ),
+                postgresql_client=PostgreSQLClient(
+                    database_name=config.postgresql_database_name,
+                    host_name=config.postgresql_host_name,
+                    port=config.postgresql_port,
+                    user_name=config.postgresql_user_name,
+                    user_password=config.postgresql_password,
+                    leader_lock_name=config.postgresql_leader_lock,
+                    replica_host_name=config.postgresql_replica_host_name,
+                    replica_max_lag=config.postgresql_replica_max_lag,
+                    replica_port=config.postgresql_replica_port,
+                    pool_options=config.postgresql_pool_options,
+                    retention_options=config.postgresql_retention_options,
+                    write_options=config.postgresql_write_options,
+                    permission_rules=config.permissions,
+                    event_emitter=self.event_emitter(config),
+                    tenant_name=config.name,
+                ),
+            )
+            for config in tenants
+        ]
+        logger.info(
+            "Synchronising %s tenant(s) using %s LDAP client(s)",
+            len(self.tenants),
+            len(self.ldap_clients),
+        )
+
+    def event_emitter(self, config: TenantConfig) -> EventEmitter | None:
+        """Return the shared emitter for a tenant's change event file or socket."""
+        if config.events_socket:
+            key = ("socket", config.events_socket)
+        elif config.events_file:
+            key = ("file", config.events_file)
+        else:
+            return None
+        if key not in self.event_emitters:
+            sink: EventSink = (
+                UnixSocketSink(Path(key[1]))
+                if key[0] == "socket"
+                else JSONLinesSink(Path(key[1]))
+            )
+            self.event_emitters[key] = EventEmitter(
+                sink,
+                batch_size=config.events_batch_size,
+                max_queued=config.events_queue_size,
+            )
+        return self.event_emitters[key]
+
+    def ldap_client(self, config: TenantConfig) -> DirectorySource:
+        """Return the shared LDAP client for a tenant's servers and credentials.
+
+        A tenant with a source file reads it instead, and a tenant with a snapshot
+        file records its results there.
+        """
+        source = self.shared_ldap_client(config)
+        if config.ldap_snapshot_file:
+            return SnapshotRecorder(source, Path(config.ldap_snapshot_file))
+        return source
+
+    def shared_ldap_client(self, config: TenantConfig) -> DirectorySource:
+        """Return the LDAP client shared by tenants with the same LDAP settings.
+
+        If memberships are interned, every tenant sharing the client also shares
+        its table of DNs and names.
+        """
+        if config.ldap_source_file:
+            key: tuple[object, ...] = (
+                config.ldap_source_file,
+                config.ldap_intern_memberships,
+            )
+            if key not in self.ldap_clients:
+                self.ldap_clients[key] = file_source(
+                    Path(config.ldap_source_file),
+                    intern_table=self.intern_table(config),
+                )
+            return self.ldap_clients[key]
+        key = (
+            config.ldap_hostnames,
+            config.ldap_bind_dn,
+            config.ldap_bind_password,
+            config.ldap_cache_size,
+            config.ldap_cache_watermark_attr,
+            config.ldap_intern_memberships,
+        )
+        if key not in self.ldap_clients:
+            self.ldap_clients[key] = LDAPClient(
+                list(config.ldap_hostnames),
+                bind_dn=config.ldap_bind_dn,
+                bind_password=config.ldap_bind_password,
+                cache=LDAPSearchCache(max_entries=config.ldap_cache_size),
+                intern_table=self.intern_table(config),
+                watermark_attr=config.ldap_cache_watermark_attr,
+            )
+        return self.ldap_clients[key]
+
+    @staticmethod
+    def intern_table(config: TenantConfig) -> InternTable | None:
+        return InternTable() if config.ldap_intern_memberships else None
+
+    def close(self) -> None:
+        """Close the event loop and async connection pools, if there are any.
+
+        Change events that are still queued are delivered first.
+        """
+        if self.runner:
+            for tenant in self.tenants:
+                self.runner.run(tenant.async_postgresql_client.dispose())
+            self.runner.close()
+            self.runner = None
+        for emitter in self.event_emitters.values():
+            emitter.close()
+        self.event_emitters.clear()
+
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.synchronise)
+
+    def run_cycle(self, *, forced: bool = False) -> SyncOutcome:
+        """Synchronise every tenant once, returning the combined outcome.
+
+        The cycle counts as changed if any tenant changed, and otherwise as failed if
+        any tenant failed. A forced cycle runs the forced phases even if they are not
+        due.
+        """
+        with ExitStack() as stack:
+            for ldap_client in self.ldap_clients.values():
+                stack.enter_context(ldap_client.reuse_results())
+            if self.is_async:
+                if not self.runner:
+                    self.runner = asyncio.Runner()
+                outcomes = Counter(
+                    self.runner.run(self.synchronise_tenants_async(forced=forced)),
+                )
+            else:
+                with ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(self.tenants)),
+                ) as executor:
+                    outcomes = Counter(
+                        executor.map(
+                            partial(self.synchronise_tenant, forced=forced),
+                            self.tenants,
+                        ),
+                    )
+        logger.info(
+            "Finished synchronising %s tenant(s): %s",
+            len(self.tenants),
+            ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items()),
+        )
+        for outcome in (SyncOutcome.CHANGED, SyncOutcome.FAILED, SyncOutcome.UNCHANGED):
+            if outcomes[outcome]:
+                return outcome
+        return SyncOutcome.SKIPPED
+
+    def synchronise_tenant(
+        self,
+        tenant: Tenant,
+        *,
+        forced: bool = False,
+    ) -> SyncOutcome:
+        started = tenant.phases.clock()
+        if not (phases := tenant.phases.due(started, forced=forced)):
+            logger.debug("No phases are due for tenant '%s'.", tenant.config.name)
+            return SyncOutcome.UNCHANGED
+        logger.info("Synchronising tenant '%s'.", tenant.config.name)
+        try:
+            outcome = self.synchronise(
+                ldap_client=tenant.ldap_client,
+                ldap_group_query=tenant.ldap_group_query,
+                ldap_user_query=tenant.ldap_user_query,
+                phases=phases,
+                postgresql_client=tenant.postgresql_client,
+            )
+        except Exception:
+            # One tenant must not stop the others from being synchronised
+            logger.exception("Unexpected error synchronising '%s'.", tenant.config.name)
+            return SyncOutcome.FAILED
+        return self.tenant_finished(tenant, phases, started, outcome)
+
+    async def synchronise_tenant_async(
+        self,
+        tenant: Tenant,
+        semaphore: asyncio.Semaphore,
+        *,
+        forced: bool = False,
+    ) -> SyncOutcome:
+        async with semaphore:
+            started = tenant.phases.clock()
+            if not (phases := tenant.phases.due(started, forced=forced)):
+                logger.debug("No phases are due for tenant '%s'.", tenant.config.name)
+                return SyncOutcome.UNCHANGED
+            logger.info("Synchronising tenant '%s'.", tenant.config.name)
+            try:
+                outcome = await cast(
+                    Awaitable[SyncOutcome],
+                    self.synchronise(
+                        ldap_client=tenant.async_ldap_client,
+                        ldap_group_query=tenant.ldap_group_query,
+                        ldap_user_query=tenant.ldap_user_query,
+                        phases=phases,
+                        postgresql_client=tenant.async_postgresql_client,
+                    ),
+                )
+            except Exception:
+                logger.exception(
+                    "Unexpected error synchronising '%s'.",
+                    tenant.config.name,
+                )
+                return SyncOutcome.FAILED
+            return self.tenant_finished(tenant, phases, started, outcome)
+
+    async def synchronise_tenants_async(
+        self,
+        *,
+        forced: bool = False,
+    ) -> list[SyncOutcome]:
+        semaphore = asyncio.Semaphore(self.max_workers)
+        return await asyncio.gather(
+            *(
+                self.synchronise_tenant_async(tenant, semaphore, forced=forced)
+                for tenant in self.tenants
+            ),
+        )
+
+    @staticmethod
+    def tenant_finished(
+        tenant: Tenant,
+        phases: frozenset[SyncPhase],
+        started: float,
+        outcome: Any,  # noqa: ANN401
+    ) -> SyncOutcome:
+        """Record which phases completed, returning the tenant's outcome."""
+        if outcome in (SyncOutcome.CHANGED, SyncOutcome.UNCHANGED):
+            tenant.phases.completed(phases, started)
+        return SyncOutcome(outcome)
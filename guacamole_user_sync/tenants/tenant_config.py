@@ -0,0 +1,321 @@
+import os
+import tomllib
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+from guacamole_user_sync.models import LDAPQuery, PermissionRule
+from guacamole_user_sync.postgresql import (
+    PostgreSQLPoolOptions,
+    PostgreSQLRetentionOptions,
+    PostgreSQLWriteOptions,
+)
+
+
+def attribute_map(value: str | None) -> dict[str, str]:
+    """Parse comma-separated 'ldapAttribute=guacamole-attribute' pairs.
+
+    A pair without '=' keeps the LDAP attribute name in Guacamole.
+    """
+    pairs = [pair.strip() for pair in (value or "").split(",") if pair.strip()]
+    return {
+        ldap_attribute.strip(): (name.strip() or ldap_attribute.strip())
+        for ldap_attribute, _, name in (pair.partition("=") for pair in pairs)
+    }
+
+
+def optional_float(value: str | None) -> float | None:
+    if not value or value.strip().lower() == "none":
+        return None
+    return float(value)
+
+
+def optional_int(value: str | None) -> int | None:
+    if not value or value.strip().lower() == "none":
+        return None
+    return int(value)
+
+
+def permission_rules(path: str | None) -> list[PermissionRule]:
+    """Load the [[permissions]] tables of a TOML file, if one is given."""
+    if not path:
+        return []
+    with Path(path).open("rb") as f_config:
+        return [
+            PermissionRule(**rule)
+            for rule in tomllib.load(f_config).get("permissions", [])
+        ]
+
+
+def required_env(name: str) -> str:
+    if not (value := os.getenv(name, None)):
+        msg = f"{name} is not defined"
+        raise ValueError(msg)
+    return value
+
+
+@dataclass
+class TenantConfig:
+    """Configuration for synchronising one Guacamole instance with LDAP."""
+
+    name: str
+    ldap_group_base_dn: str
+    ldap_group_filter: str
+    ldap_host: str
+    ldap_user_base_dn: str
+    ldap_user_filter: str
+    postgresql_host_name: str
+    postgresql_password: str
+    postgresql_user_name: str
+    events_batch_size: int = 100
+    events_file: str | None = None
+    events_queue_size: int = 10000
+    events_socket: str | None = None
+    ldap_bind_dn: str | None = None
+    ldap_bind_password: str | None = None
+    ldap_cache_size: int = 128
+    ldap_cache_watermark_attr: str | None = None
+    ldap_group_attribute_map: dict[str, str] = field(default_factory=dict)
+    ldap_group_cache_ttl: float = 0
+    ldap_group_name_attr: str = "cn"
+    ldap_intern_memberships: bool = False
+    ldap_port: int = 389
+    ldap_server_side_sort: bool = False
+    ldap_shard_by_initial: bool = False
+    ldap_snapshot_file: str | None = None
+    ldap_source_file: str | None = None
+    ldap_user_attribute_map: dict[str, str] = field(default_factory=dict)
+    ldap_user_cache_ttl: float = 0
+    ldap_user_name_attr: str = "userPrincipalName"
+    permissions: list[PermissionRule] = field(default_factory=list)
+    postgresql_database_name: str = "guacamole"
+    postgresql_disable_missing_users: bool = False
+    postgresql_keepalives_idle: int = 30
+    postgresql_leader_lock: str | None = None
+    postgresql_lock_timeout: float | None = 2.0
+    postgresql_pipeline: bool = True
+    postgresql_pool_pre_ping: bool = True
+    postgresql_pool_recycle: int = 1800
+    postgresql_pool_size: int = 2
+    postgresql_port: int = 5432
+    postgresql_prepare_threshold: int | None = 5
+    postgresql_purge_batch_size: int = 100
+    postgresql_purge_grace_period: float = 30 * 24 * 3600
+    postgresql_purge_pause: float = 1.0
+    postgresql_replica_host_name: str | None = None
+    postgresql_replica_max_lag: float = 5.0
+    postgresql_replica_port: int | None = None
+    postgresql_write_chunk_size: int | None = 500
+    postgresql_write_interval: float = 0
+    postgresql_write_target_latency: float = 0.25
+
+    @classmethod
+    def from_env(cls, name: str = "default") -> "TenantConfig":
+        """Load a single tenant from environment variables."""
+        return cls(
+            name=name,
+            events_batch_size=int(os.getenv("EVENTS_BATCH_SIZE", "100")),
+            events_file=os.getenv("EVENTS_FILE", None),
+            events_queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "10000")),
+            events_socket=os.getenv("EVENTS_SOCKET", None),
+            ldap_bind_dn=os.getenv("LDAP_BIND_DN", None),
+            ldap_bind_password=os.getenv("LDAP_BIND_PASSWORD", None),
+            ldap_cache_size=int(os.getenv("LDAP_CACHE_SIZE", "128")),
+            ldap_cache_watermark_attr=os.getenv("LDAP_CACHE_WATERMARK_ATTR", None),
+            ldap_group_attribute_map=attribute_map(
+                os.getenv("LDAP_GROUP_ATTRIBUTE_MAP", None),
+            ),
+            ldap_group_base_dn=required_env("LDAP_GROUP_BASE_DN"),
+            ldap_group_cache_ttl=float(os.getenv("LDAP_GROUP_CACHE_TTL", "0")),
+            ldap_group_filter=required_env("LDAP_GROUP_FILTER"),
+            ldap_group_name_attr=os.getenv("LDAP_GROUP_NAME_ATTR", "cn"),
+            ldap_host=(
+                os.getenv("LDAP_HOST", "")
+                if os.getenv("LDAP_SOURCE_FILE", None)
+                else required_env("LDAP_HOST")
+            ),
+            ldap_intern_memberships=os.getenv(
+                "LDAP_INTERN_MEMBERSHIPS",
+                "False",
+            ).lower()
+            == "true",
+            ldap_port=int(os.getenv("LDAP_PORT", "389")),
+            ldap_server_side_sort=os.getenv("LDAP_SERVER_SIDE_SORT", "False").lower()
+            == "true",
+            ldap_shard_by_initial=os.getenv("LDAP_SHARD_BY_INITIAL", "False").lower()
+            == "true",
+            ldap_snapshot_file=os.getenv("LDAP_SNAPSHOT_FILE", None),
+            ldap_source_file=os.getenv("LDAP_SOURCE_FILE", None),
+            ldap_user_attribute_map=attribute_map(
+                os.getenv("LDAP_USER_ATTRIBUTE_MAP", None),
+            ),
+            ldap_user_base_dn=required_env("LDAP_USER_BASE_DN"),
+            ldap_user_cache_ttl=float(os.getenv("LDAP_USER_CACHE_TTL", "0")),
+            ldap_user_filter=required_env("LDAP_USER_FILTER"),
+            ldap_user_name_attr=os.getenv("LDAP_USER_NAME_ATTR", "userPrincipalName"),
+            permissions=permission_rules(os.getenv("PERMISSIONS_CONFIG", None)),
+            postgresql_database_name=os.getenv("POSTGRESQL_DB_NAME", "guacamole"),
+            postgresql_disable_missing_users=os.getenv(
+                "POSTGRESQL_DISABLE_MISSING_USERS",
+                "False",
+            ).lower()
+            == "true",
+            postgresql_host_name=required_env("POSTGRESQL_HOST"),
+            postgresql_keepalives_idle=int(
+                os.getenv("POSTGRESQL_KEEPALIVES_IDLE", "30"),
+            ),
+            postgresql_leader_lock=os.getenv("POSTGRESQL_LEADER_LOCK", None),
+            postgresql_lock_timeout=optional_float(
+                os.getenv("POSTGRESQL_LOCK_TIMEOUT", "2"),
+            ),
+            postgresql_password=required_env("POSTGRESQL_PASSWORD"),
+            postgresql_pipeline=os.getenv("POSTGRESQL_PIPELINE", "True").lower()
+            == "true",
+            postgresql_pool_pre_ping=os.getenv(
+                "POSTGRESQL_POOL_PRE_PING",
+                "True",
+            ).lower()
+            == "true",
+            postgresql_pool_recycle=int(os.getenv("POSTGRESQL_POOL_RECYCLE", "1800")),
+            postgresql_pool_size=int(os.getenv("POSTGRESQL_POOL_SIZE", "2")),
+            postgresql_port=int(os.getenv("POSTGRESQL_PORT", "5432")),
+            postgresql_prepare_threshold=optional_int(
+                os.getenv("POSTGRESQL_PREPARE_THRESHOLD", "5"),
+            ),
+            postgresql_purge_batch_size=int(
+                os.getenv("POSTGRESQL_PURGE_BATCH_SIZE", "100"),
+            ),
+            postgresql_purge_grace_period=float(
+                os.getenv("POSTGRESQL_PURGE_GRACE_PERIOD", str(30 * 24 * 3600)),
+            ),
+            postgresql_purge_pause=float(os.getenv("POSTGRESQL_PURGE_PAUSE", "1")),
+            postgresql_replica_host_name=os.getenv("POSTGRESQL_REPLICA_HOST", None),
+            postgresql_replica_max_lag=float(
+                os.getenv("POSTGRESQL_REPLICA_MAX_LAG", "5"),
+            ),
+            postgresql_replica_port=optional_int(
+                os.getenv("POSTGRESQL_REPLICA_PORT", None),
+            ),
+            postgresql_user_name=required_env("POSTGRESQL_USERNAME"),
+            postgresql_write_chunk_size=optional_int(
+                os.getenv("POSTGRESQL_WRITE_CHUNK_SIZE", "500"),
+            ),
+            postgresql_write_interval=float(
+                os.getenv("POSTGRESQL_WRITE_INTERVAL", "0"),
+            ),
+            postgresql_write_target_latency=float(
+                os.getenv("POSTGRESQL_WRITE_TARGET_LATENCY", "0.25"),
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> list["TenantConfig"]:
+        """Load tenants from a TOML file.
+
+        Each [[tenants]] table is merged over an optional [defaults] table. A key
+        ending in `_env`, such as `postgresql_password_env`, gives the name of an
+        environment variable to read that setting from. Each [[tenants.permissions]]
+        table is a PermissionRule.
+        """
+        with path.open("rb") as f_config:
+            config = tomllib.load(f_config)
+        defaults: dict[str, Any] = config.get("defaults", {})
+        tenants = []
+        for tenant in config.get("tenants", []):
+            values = {**defaults, **tenant}
+            for key in [key for key in values if key.endswith("_env")]:
+                values[key.removesuffix("_env")] = required_env(values.pop(key))
+            try:
+                values["permissions"] = [
+                    PermissionRule(**rule) for rule in values.get("permissions", [])
+                ]
+                tenants.append(cls(**values))
+            except (TypeError, ValueError) as exc:
+                msg = f"Invalid configuration for tenant {values.get('name')}: {exc}"
+                raise ValueError(msg) from exc
+        if not tenants:
+            msg = f"No tenants are defined in {path}"
+            raise ValueError(msg)
+        return tenants
+
+    @property
+    def ldap_group_query(self) -> LDAPQuery:
+        return self.ldap_query(
+            self.ldap_group_base_dn,
+            self.ldap_group_filter,
+            self.ldap_group_name_attr,
+            attribute_map=self.ldap_group_attribute_map,
+            cache_ttl=self.ldap_group_cache_ttl,
+        )
+
+    @property
+    def ldap_hostnames(self) -> tuple[str, ...]:
+        return tuple(
+            f"{host.strip()}:{self.ldap_port}" for host in self.ldap_host.split(",")
+        )
+
+    def ldap_query(
+        self,
+        base_dn: str,
+        ldap_filter: str,
+        id_attr: str,
+        *,
+        attribute_map: dict[str, str] | None = None,
+        cache_ttl: float = 0,
+    ) -> LDAPQuery:
+        """Build a query over one or more semicolon-separated base DNs."""
+        base_dns = [dn.strip() for dn in base_dn.split(";")]
+        return LDAPQuery(
+            base_dn=base_dns[0],
+            filter=ldap_filter,
+            id_attr=id_attr,
+            cache_ttl=cache_ttl,
+            attribute_map=tuple(sorted((attribute_map or {}).items())),
+            extra_base_dns=tuple(base_dns[1:]),
+            filter_partitions=(
+                LDAPQuery.initial_partitions(id_attr)
+                if self.ldap_shard_by_initial
+                else ()
+            ),
+            server_side_sort=self.ldap_server_side_sort,
+        )
+
+    @property
+    def ldap_user_query(self) -> LDAPQuery:
+        return self.ldap_query(
+            self.ldap_user_base_dn,
+            self.ldap_user_filter,
+            self.ldap_user_name_attr,
+            attribute_map=self.ldap_user_attribute_map,
+            cache_ttl=self.ldap_user_cache_ttl,
+        )
+
+    @property
+    def postgresql_pool_options(self) -> PostgreSQLPoolOptions:
+        return PostgreSQLPoolOptions(
+            keepalives_idle=self.postgresql_keepalives_idle,
+            pipeline=self.postgresql_pipeline,
+            pool_pre_ping=self.postgresql_pool_pre_ping,
+            pool_recycle=self.postgresql_pool_recycle,
+            pool_size=self.postgresql_pool_size,
+            prepare_threshold=self.postgresql_prepare_threshold,
+        )
+
+    @property
+    def postgresql_retention_options(self) -> PostgreSQLRetentionOptions:
+        return PostgreSQLRetentionOptions(
+            disable_missing_users=self.postgresql_disable_missing_users,
+            grace_period=timedelta(seconds=self.postgresql_purge_grace_period),
+            purge_batch_size=self.postgresql_purge_batch_size,
+            purge_pause=self.postgresql_purge_pause,
+        )
+
+    @property
+    def postgresql_write_options(self) -> PostgreSQLWriteOptions:
+        return PostgreSQLWriteOptions(
+            chunk_size=self.postgresql_write_chunk_size,
+            lock_timeout=self.postgresql_lock_timeout,
+            min_chunk_interval=self.postgresql_write_interval,
+            target_commit_latency=self.postgresql_write_target_latency,
+        )
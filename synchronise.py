@@ -1,120 +1,297 @@
 #! /usr/bin/env python3
+import argparse
+import asyncio
 import logging
 import os
-import time
+import sys
+from collections.abc import Collection
+from pathlib import Path
+from typing import TYPE_CHECKING, TextIO
 
-from guacamole_user_sync.ldap import LDAPClient
-from guacamole_user_sync.models import LDAPError, LDAPQuery, PostgreSQLError
-from guacamole_user_sync.postgresql import PostgreSQLClient, SchemaVersion
+from guacamole_user_sync.models import (
+    LDAPError,
+    LDAPQuery,
+    PostgreSQLError,
+    SyncPhase,
+)
+from guacamole_user_sync.postgresql import SchemaVersion
+from guacamole_user_sync.scheduling import (
+    CycleProfiler,
+    SyncOutcome,
+    SyncScheduler,
+    SyncTrigger,
+)
+from guacamole_user_sync.sources import DirectorySource
+from guacamole_user_sync.tenants import TenantConfig
+
+# Clients are imported when synchronisation starts, after the configuration has been
+# validated, so that invalid configuration and --help are reported quickly
+if TYPE_CHECKING:
+    from guacamole_user_sync.aio import AsyncLDAPClient, AsyncPostgreSQLClient
+    from guacamole_user_sync.postgresql import PostgreSQLClient
 
 
 def main(  # noqa: PLR0913
-    ldap_bind_dn: str | None,
-    ldap_bind_password: str | None,
-    ldap_group_base_dn: str,
-    ldap_group_filter: str,
-    ldap_group_name_attr: str,
-    ldap_host: str,
-    ldap_port: int,
-    ldap_user_base_dn: str,
-    ldap_user_filter: str,
-    ldap_user_name_attr: str,
-    postgresql_database_name: str,
-    postgresql_host_name: str,
-    postgresql_password: str,
-    postgresql_port: int,
-    postgresql_user_name: str,
+    *,
+    profile_cycles: int,
+    profile_directory: str | None,
+    profile_sample_rate: float,
+    profile_signal_cycles: int,
     repeat_interval: int,
+    sync_active_interval: int | None,
+    sync_async: bool,
+    sync_groups_interval: int | None,
+    sync_jitter: float,
+    sync_max_retry_interval: int,
+    sync_memberships_interval: int | None,
+    sync_purge_interval: int,
+    sync_retry_interval: int,
+    sync_standby_interval: int,
+    sync_trigger_coalesce_window: float,
+    sync_trigger_http_port: int | None,
+    sync_trigger_socket: str | None,
+    sync_users_interval: int | None,
+    tenant_workers: int,
+    tenants: list[TenantConfig],
 ) -> None:
-    # Initialise LDAP resources
-    ldap_client = LDAPClient(
-        f"{ldap_host}:{ldap_port}",
-        bind_dn=ldap_bind_dn,
-        bind_password=ldap_bind_password,
-    )
-    ldap_group_query = LDAPQuery(
-        base_dn=ldap_group_base_dn,
-        filter=ldap_group_filter,
-        id_attr=ldap_group_name_attr,
-    )
-    ldap_user_query = LDAPQuery(
-        base_dn=ldap_user_base_dn,
-        filter=ldap_user_filter,
-        id_attr=ldap_user_name_attr,
-    )
-    postgresql_client = PostgreSQLClient(
-        database_name=postgresql_database_name,
-        host_name=postgresql_host_name,
-        port=postgresql_port,
-        user_name=postgresql_user_name,
-        user_password=postgresql_password,
+    # Each phase runs on its own cadence, checked at the shortest of them
+    phase_intervals = {
+        SyncPhase.GROUPS: sync_groups_interval or repeat_interval,
+        SyncPhase.MEMBERSHIPS: sync_memberships_interval or repeat_interval,
+        SyncPhase.PURGE: sync_purge_interval,
+        SyncPhase.USERS: sync_users_interval or repeat_interval,
+    }
+    repeat_interval = min(repeat_interval, *phase_intervals.values())
+
+    # Profile some synchronisations if requested by the environment or a signal
+    synchronise_function = synchronise_async if sync_async else synchronise
+    if profile_directory:
+        profiler = CycleProfiler(
+            Path(profile_directory),
+            cycles=profile_cycles,
+            sample_rate=profile_sample_rate,
+        )
+        profiler.handle_signals(profile_signal_cycles)
+        synchronise_function = profiler.wrap(synchronise_function)
+
+    # Initialise LDAP and PostgreSQL resources for each tenant
+    from guacamole_user_sync.tenants import MultiTenantSynchroniser
+
+    synchroniser = MultiTenantSynchroniser(
+        tenants,
+        synchronise_function,
+        max_workers=tenant_workers,
+        phase_intervals=phase_intervals,
+        phase_tolerance=repeat_interval / 2,
     )
 
-    # Loop until terminated
-    while True:
-        # Run synchronisation step
-        synchronise(
-            ldap_client=ldap_client,
-            ldap_group_query=ldap_group_query,
-            ldap_user_query=ldap_user_query,
-            postgresql_client=postgresql_client,
+    # Allow signals and local endpoints to request an immediate synchronisation
+    trigger = SyncTrigger(coalesce_window=sync_trigger_coalesce_window)
+    try:
+        trigger.handle_signals()
+        if sync_trigger_http_port is not None:
+            trigger.serve_http(sync_trigger_http_port)
+        if sync_trigger_socket:
+            trigger.serve_unix_socket(Path(sync_trigger_socket))
+
+        # Loop until terminated
+        scheduler = SyncScheduler(
+            repeat_interval,
+            active_interval=sync_active_interval,
+            jitter=sync_jitter,
+            max_retry_interval=sync_max_retry_interval,
+            retry_interval=sync_retry_interval,
+            standby_interval=sync_standby_interval,
+            trigger=trigger,
         )
+        scheduler.run(synchroniser.run_cycle)
+    finally:
+        trigger.close()
+        synchroniser.close()
 
-        # Wait before repeating
-        logger.info("Waiting %s seconds.", repeat_interval)
-        time.sleep(repeat_interval)
+
+def plan(tenants: list[TenantConfig], output: TextIO) -> bool:
+    """Write the changes a full synchronisation would make, without making them.
+
+    Each tenant's planned rows are written as JSON lines, followed by a summary line
+    estimating the statements and write volume. Only read queries are sent to
+    PostgreSQL, so this is safe to run against a read replica. Returns False if any
+    tenant could not be planned.
+    """
+    from guacamole_user_sync.tenants import MultiTenantSynchroniser
+
+    synchroniser = MultiTenantSynchroniser(tenants, synchronise)
+    succeeded = True
+    try:
+        for tenant in synchroniser.tenants:
+            logger.info("Planning synchronisation of tenant '%s'.", tenant.config.name)
+            try:
+                ldap_groups = tenant.ldap_client.search_groups(tenant.ldap_group_query)
+                ldap_users = tenant.ldap_client.search_users(tenant.ldap_user_query)
+                with (
+                    tenant.postgresql_client.cycle(),
+                    tenant.postgresql_client.plan() as write_plan,
+                ):
+                    tenant.postgresql_client.update(
+                        groups=ldap_groups,
+                        users=ldap_users,
+                    )
+            except (LDAPError, PostgreSQLError):
+                logger.warning("Unable to plan tenant '%s'.", tenant.config.name)
+                succeeded = False
+                continue
+            write_plan.write_jsonl(output, tenant=tenant.config.name)
+    finally:
+        synchroniser.close()
+    return succeeded
+
+
+def ldap_attributes(
+    phases: Collection[SyncPhase],
+) -> tuple[list[str] | None, list[str] | None]:
+    """Return the group and user attributes needed by the given phases.
+
+    None means that the corresponding search is not needed at all.
+    """
+    group_attributes = ["memberUid"] if SyncPhase.MEMBERSHIPS in phases else []
+    user_attributes = (
+        ["displayName", "mail", "o", "title"] if SyncPhase.USERS in phases else []
+    ) + (["uid"] if SyncPhase.MEMBERSHIPS in phases else [])
+    return (
+        (
+            group_attributes
+            if {SyncPhase.GROUPS, SyncPhase.MEMBERSHIPS} & set(phases)
+            else None
+        ),
+        user_attributes or None,
+    )
 
 
 def synchronise(
     *,
-    ldap_client: LDAPClient,
+    ldap_client: DirectorySource,
     ldap_group_query: LDAPQuery,
     ldap_user_query: LDAPQuery,
-    postgresql_client: PostgreSQLClient,
-) -> None:
-    logger.info("Starting synchronisation.")
+    phases: Collection[SyncPhase] = tuple(SyncPhase),
+    postgresql_client: "PostgreSQLClient",
+) -> SyncOutcome:
+    try:
+        if not postgresql_client.acquire_leadership():
+            logger.info("Another replica is synchronising, skipping this cycle.")
+            return SyncOutcome.SKIPPED
+    except PostgreSQLError:
+        logger.warning("PostgreSQL leader election failed")
+        return SyncOutcome.FAILED
+
+    logger.info("Starting synchronisation of %s.", ", ".join(sorted(phases)))
+    # Only request the LDAP attributes needed by the phases that are due
+    group_attributes, user_attributes = ldap_attributes(phases)
+    try:
+        ldap_groups = (
+            []
+            if group_attributes is None
+            else ldap_client.search_groups(
+                ldap_group_query,
+                attributes=group_attributes,
+            )
+        )
+        ldap_users = (
+            []
+            if user_attributes is None
+            else ldap_client.search_users(ldap_user_query, attributes=user_attributes)
+        )
+    except LDAPError:
+        logger.warning("LDAP server query failed")
+        return SyncOutcome.FAILED
+
+    try:
+        with postgresql_client.cycle():
+            postgresql_client.ensure_schema(SchemaVersion.v1_5_5)
+            n_changes = postgresql_client.update(
+                groups=ldap_groups,
+                users=ldap_users,
+                phases=phases,
+            )
+    except PostgreSQLError:
+        logger.warning("PostgreSQL update failed")
+        return SyncOutcome.FAILED
+    return SyncOutcome.CHANGED if n_changes else SyncOutcome.UNCHANGED
+
+
+async def synchronise_async(
+    *,
+    ldap_client: "AsyncLDAPClient",
+    ldap_group_query: LDAPQuery,
+    ldap_user_query: LDAPQuery,
+    phases: Collection[SyncPhase] = tuple(SyncPhase),
+    postgresql_client: "AsyncPostgreSQLClient",
+) -> SyncOutcome:
+    try:
+        if not await postgresql_client.acquire_leadership():
+            logger.info("Another replica is synchronising, skipping this cycle.")
+            return SyncOutcome.SKIPPED
+    except PostgreSQLError:
+        logger.warning("PostgreSQL leader election failed")
+        return SyncOutcome.FAILED
+
+    logger.info("Starting synchronisation of %s.", ", ".join(sorted(phases)))
+    # Check the schema while both LDAP searches are running
+    schema = asyncio.create_task(postgresql_client.ensure_schema(SchemaVersion.v1_5_5))
+    group_attributes, user_attributes = ldap_attributes(phases)
     try:
-        ldap_groups = ldap_client.search_groups(ldap_group_query)
-        ldap_users = ldap_client.search_users(ldap_user_query)
+        ldap_groups, ldap_users = await asyncio.gather(
+            (
+                asyncio.sleep(0, result=[])
+                if group_attributes is None
+                else ldap_client.search_groups(
+                    ldap_group_query,
+                    attributes=group_attributes,
+                )
+            ),
+            (
+                asyncio.sleep(0, result=[])
+                if user_attributes is None
+                else ldap_client.search_users(
+                    ldap_user_query,
+                    attributes=user_attributes,
+                )
+            ),
+        )
     except LDAPError:
         logger.warning("LDAP server query failed")
-        return
+        await asyncio.gather(schema, return_exceptions=True)
+        return SyncOutcome.FAILED
 
     try:
-        postgresql_client.ensure_schema(SchemaVersion.v1_5_5)
-        postgresql_client.update(groups=ldap_groups, users=ldap_users)
+        await schema
+        n_changes = await postgresql_client.update(
+            groups=ldap_groups,
+            users=ldap_users,
+            phases=phases,
+        )
     except PostgreSQLError:
         logger.warning("PostgreSQL update failed")
-        return
+        return SyncOutcome.FAILED
+    return SyncOutcome.CHANGED if n_changes else SyncOutcome.UNCHANGED
 
 
 if __name__ == "__main__":
-    if not (ldap_host := os.getenv("LDAP_HOST", None)):
-        msg = "LDAP_HOST is not defined"
-        raise ValueError(msg)
-    if not (ldap_group_base_dn := os.getenv("LDAP_GROUP_BASE_DN", None)):
-        msg = "LDAP_GROUP_BASE_DN is not defined"
-        raise ValueError(msg)
-    if not (ldap_group_filter := os.getenv("LDAP_GROUP_FILTER", None)):
-        msg = "LDAP_GROUP_FILTER is not defined"
-        raise ValueError(msg)
-
-    if not (ldap_user_base_dn := os.getenv("LDAP_USER_BASE_DN", None)):
-        msg = "LDAP_USER_BASE_DN is not defined"
-        raise ValueError(msg)
-    if not (ldap_user_filter := os.getenv("LDAP_USER_FILTER", None)):
-        msg = "LDAP_USER_FILTER is not defined"
-        raise ValueError(msg)
-
-    if not (postgresql_host_name := os.getenv("POSTGRESQL_HOST", None)):
-        msg = "POSTGRESQL_HOST is not defined"
-        raise ValueError(msg)
-    if not (postgresql_password := os.getenv("POSTGRESQL_PASSWORD", None)):
-        msg = "POSTGRESQL_PASSWORD is not defined"
-        raise ValueError(msg)
-    if not (postgresql_user_name := os.getenv("POSTGRESQL_USERNAME", None)):
-        msg = "POSTGRESQL_USERNAME is not defined"
-        raise ValueError(msg)
+    parser = argparse.ArgumentParser(
+        description="Synchronise Guacamole users and groups with LDAP.",
+    )
+    parser.add_argument(
+        "--plan",
+        metavar="PATH",
+        help="write the changes that would be made as JSON lines ('-' for stdout)",
+    )
+    args = parser.parse_args()
+
+    # Either synchronise several tenants from a file or a single one from the env
+    tenants = (
+        TenantConfig.load(Path(tenants_config))
+        if (tenants_config := os.getenv("TENANTS_CONFIG", None))
+        else [TenantConfig.from_env()]
+    )
 
     logging.basicConfig(
         level=(
@@ -127,21 +304,53 @@ if __name__ == "__main__":
     )
     logger = logging.getLogger("guacamole_user_sync")
 
+    if args.plan:
+        if args.plan == "-":
+            sys.exit(0 if plan(tenants, sys.stdout) else 1)
+        with Path(args.plan).open("w", encoding="utf-8") as output:
+            sys.exit(0 if plan(tenants, output) else 1)
+
     main(
-        ldap_bind_dn=os.getenv("LDAP_BIND_DN", None),
-        ldap_bind_password=os.getenv("LDAP_BIND_PASSWORD", None),
-        ldap_group_base_dn=ldap_group_base_dn,
-        ldap_group_filter=ldap_group_filter,
-        ldap_group_name_attr=os.getenv("LDAP_GROUP_NAME_ATTR", "cn"),
-        ldap_host=ldap_host,
-        ldap_port=int(os.getenv("LDAP_PORT", "389")),
-        ldap_user_base_dn=ldap_user_base_dn,
-        ldap_user_filter=ldap_user_filter,
-        ldap_user_name_attr=os.getenv("LDAP_USER_NAME_ATTR", "userPrincipalName"),
-        postgresql_database_name=os.getenv("POSTGRESQL_DB_NAME", "guacamole"),
-        postgresql_host_name=postgresql_host_name,
-        postgresql_password=postgresql_password,
-        postgresql_port=int(os.getenv("POSTGRESQL_PORT", "5432")),
-        postgresql_user_name=postgresql_user_name,
+        profile_cycles=int(os.getenv("PROFILE_CYCLES", "0")),
+        profile_directory=os.getenv("PROFILE_DIRECTORY", None),
+        profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        profile_signal_cycles=int(os.getenv("PROFILE_SIGNAL_CYCLES", "1")),
         repeat_interval=int(os.getenv("REPEAT_INTERVAL", "300")),
+        sync_active_interval=(
+            int(active_interval)
+            if (active_interval := os.getenv("SYNC_ACTIVE_INTERVAL", None))
+            else None
+        ),
+        sync_async=os.getenv("SYNC_ASYNC", "False").lower() == "true",
+        sync_groups_interval=(
+            int(groups_interval)
+            if (groups_interval := os.getenv("SYNC_GROUPS_INTERVAL", None))
+            else None
+        ),
+        sync_jitter=float(os.getenv("SYNC_JITTER", "0.1")),
+        sync_max_retry_interval=int(os.getenv("SYNC_MAX_RETRY_INTERVAL", "3600")),
+        sync_memberships_interval=(
+            int(memberships_interval)
+            if (memberships_interval := os.getenv("SYNC_MEMBERSHIPS_INTERVAL", None))
+            else None
+        ),
+        sync_purge_interval=int(os.getenv("SYNC_PURGE_INTERVAL", "3600")),
+        sync_retry_interval=int(os.getenv("SYNC_RETRY_INTERVAL", "30")),
+        sync_standby_interval=int(os.getenv("SYNC_STANDBY_INTERVAL", "30")),
+        sync_trigger_coalesce_window=float(
+            os.getenv("SYNC_TRIGGER_COALESCE_WINDOW", "5"),
+        ),
+        sync_trigger_http_port=(
+            int(http_port)
+            if (http_port := os.getenv("SYNC_TRIGGER_HTTP_PORT", None))
+            else None
+        ),
+        sync_trigger_socket=os.getenv("SYNC_TRIGGER_SOCKET", None),
+        sync_users_interval=(
+            int(users_interval)
+            if (users_interval := os.getenv("SYNC_USERS_INTERVAL", None))
+            else None
+        ),
+        tenant_workers=int(os.getenv("TENANT_WORKERS", "4")),
+        tenants=tenants,
     )
@@ -1,9 +1,13 @@
+from collections.abc import Iterator
 from datetime import UTC, datetime
 
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
 from guacamole_user_sync.models import LDAPGroup, LDAPQuery, LDAPUser
 from guacamole_user_sync.postgresql.orm import (
+    GuacamoleBase,
     GuacamoleEntity,
     GuacamoleEntityType,
     GuacamoleUser,
@@ -200,3 +204,23 @@ def postgresql_model_guacamoleusergroup_fixture() -> list[GuacamoleUserGroup]:
             user_group_id=13,
         ),
     ]
+
+
+@pytest.fixture
+def sqlite_session_fixture(
+    postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+    postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+) -> Iterator[Session]:
+    """Yield a real session on an in-memory database holding the entities."""
+    engine = create_engine("sqlite://")
+    GuacamoleBase.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as session:
+        session.add_all(
+            [
+                *postgresql_model_guacamoleentity_fixture,
+                *postgresql_model_guacamoleusergroup_fixture,
+            ],
+        )
+        session.commit()
+        yield session
+    engine.dispose()
@@ -1,19 +1,52 @@
-from typing import Any
+from collections.abc import Iterator
+from typing import Any, Generic, TypeVar, cast
 
+from ldap3 import BASE, SUBTREE
 from ldap3.core.exceptions import LDAPBindError
-from sqlalchemy import TextClause
+from sqlalchemy import BinaryExpression, Column, Select, TextClause
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.selectable import ScalarSelect
 
+from guacamole_user_sync.postgresql import PostgreSQLWriteOptions
 from guacamole_user_sync.postgresql.orm import GuacamoleBase
 
+AttributeValue = TypeVar("AttributeValue", bound=str | float | list[str])
 
-class MockLDAPAttribute:
+
+class MockLDAPAttribute(Generic[AttributeValue]):
     """Mock LDAP value."""
 
-    def __init__(self, value: str | float | list[str]) -> None:
+    def __init__(self, value: AttributeValue) -> None:
         self.value = value
 
 
-class MockLDAPGroupEntry:
+class MockLDAPEntry:
+    """Mock LDAP entry."""
+
+    dn: MockLDAPAttribute[str]
+
+    def as_response(self) -> dict[str, Any]:
+        raw_attributes = {
+            name: [
+                str(value).encode()
+                for value in (
+                    attribute.value
+                    if isinstance(attribute.value, list)
+                    else [attribute.value]
+                )
+            ]
+            for name, attribute in vars(self).items()
+            if name != "dn"
+        }
+        return {
+            "type": "searchResEntry",
+            "dn": self.dn.value,
+            "attributes": {},
+            "raw_attributes": raw_attributes,
+        }
+
+
+class MockLDAPGroupEntry(MockLDAPEntry):
     """Mock LDAP group entry."""
 
     def __init__(
@@ -29,7 +62,7 @@ class MockLDAPGroupEntry:
         self.memberUid = MockLDAPAttribute(memberUid)
 
 
-class MockLDAPUserEntry:
+class MockLDAPUserEntry(MockLDAPEntry):
     """Mock LDAP user entry."""
 
     def __init__(
@@ -53,8 +86,31 @@ class MockLDAPServer:
     def __init__(
         self,
         entries: list[MockLDAPGroupEntry] | list[MockLDAPUserEntry],
+        *,
+        ranges: dict[tuple[str, str], list[str]] | None = None,
+        range_size: int = 2,
+        sort_result: int | None = None,
     ) -> None:
         self.entries = entries
+        self.ranges = ranges or {}
+        self.range_size = range_size
+        self.sort_result = sort_result
+
+    def range_response(self, dn: str, attribute: str) -> list[dict[str, Any]]:
+        attr_type, _, span = attribute.partition(";range=")
+        values = self.ranges[(dn, attr_type)]
+        low = int(span.partition("-")[0])
+        high = low + self.range_size - 1
+        chunk = values[low : high + 1]
+        name = f"{attr_type};range={low}-{high if high + 1 < len(values) else '*'}"
+        return [
+            {
+                "type": "searchResEntry",
+                "dn": dn,
+                "attributes": {name: chunk},
+                "raw_attributes": {name: [value.encode() for value in chunk]},
+            },
+        ]
 
 
 class MockLDAPConnection:
@@ -74,38 +130,118 @@ class MockLDAPConnection:
             raise LDAPBindError
         self.server = server
         self.user = user
+        self.response: list[dict[str, Any]] = []
+        self.result: dict[str, Any] = {}
+        self.unbound = False
 
     def search(
         self,
-        base_dn: str,  # noqa: ARG002
+        base_dn: str,
         ldap_filter: str,  # noqa: ARG002
-        attributes: str,  # noqa: ARG002
+        attributes: str | list[str],
+        search_scope: str = SUBTREE,
+        controls: list[Any] | None = None,
     ) -> None:
-        if self.server:
-            self.entries = self.server.entries
+        self.controls = controls
+        if not self.server:
+            return
+        if controls and self.server.sort_result is not None:
+            # An RFC 2891 sort response holding only the result code
+            self.result = {
+                "controls": {
+                    "1.2.840.113556.1.4.474": {
+                        "value": bytes([0x30, 3, 0x0A, 1, self.server.sort_result]),
+                    },
+                },
+            }
+        if search_scope == BASE:
+            self.response = self.server.range_response(base_dn, attributes[0])
+        else:
+            self.response = [
+                entry.as_response()
+                for entry in self.server.entries
+                if entry.dn.value.lower().endswith(base_dn.lower())
+            ]
+
+    def unbind(self) -> None:
+        self.unbound = True
 
 
 class MockPostgreSQLBackend:
     """Mock PostgreSQLBackend."""
 
     def __init__(self, *data_lists: Any, **kwargs: Any) -> None:  # noqa: ANN401, ARG002
+        self.plan: Any = None
+        self.write_options = PostgreSQLWriteOptions()
         self.contents: dict[type[GuacamoleBase], list[GuacamoleBase]] = {}
         for data_list in data_lists:
             self.add_all(data_list)
 
     def add_all(self, items: list[GuacamoleBase]) -> None:
+        if not items:
+            return
         cls = type(items[0])
         if cls not in self.contents:
             self.contents[cls] = []
         self.contents[cls] += items
 
-    def delete(self, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
-        pass
+    def delete(
+        self,
+        table: type[GuacamoleBase],
+        *filter_args: BinaryExpression[Any],
+    ) -> int:
+        items = self.matching(table, filter_args)
+        self.contents[table] = [
+            item for item in self.contents.get(table, []) if item not in items
+        ]
+        return len(items)
 
     def execute_commands(self, commands: list[TextClause]) -> None:
         for command in commands:
             print(f"Executing {command}")  # noqa: T201
 
+    def matching(
+        self,
+        table: type[GuacamoleBase],
+        filter_args: tuple[BinaryExpression[Any], ...],
+    ) -> list[GuacamoleBase]:
+        def matches(item: GuacamoleBase, expression: BinaryExpression[Any]) -> bool:
+            value = getattr(item, cast(Column[Any], expression.left).key)
+            right: Any = expression.right
+            if isinstance(right, ScalarSelect):
+                # Evaluate a subquery selecting one column of another mocked table
+                subquery = cast(Select[Any], right.element)
+                (description,) = subquery.column_descriptions
+                expected = [
+                    getattr(row, description["name"])
+                    for row in self.matching(
+                        description["entity"],
+                        (cast(BinaryExpression[Any], subquery.whereclause),),
+                    )
+                ]
+            elif hasattr(right, "clauses"):
+                expected = [getattr(clause, "value", None) for clause in right.clauses]
+            else:
+                expected = right.value
+            if expression.operator is operators.in_op:
+                return value in expected
+            if expression.operator is operators.not_in_op:
+                return value not in expected
+            return bool(value == expected)
+
+        return [
+            item
+            for item in self.contents.get(table, [])
+            if all(matches(item, expression) for expression in filter_args)
+        ]
+
+    def query_filtered(
+        self,
+        table: type[GuacamoleBase],
+        *filter_args: BinaryExpression[Any],
+    ) -> list[GuacamoleBase]:
+        return self.matching(table, filter_args)
+
     def query(
         self,
         table: type[GuacamoleBase],
@@ -113,17 +249,43 @@ class MockPostgreSQLBackend:
     ) -> list[GuacamoleBase]:
         if table not in self.contents:
             self.contents[table] = []
-        results = list(self.contents[table])
+        return [
+            item
+            for item in self.contents[table]
+            if all(getattr(item, key) == value for key, value in filter_kwargs.items())
+        ]
 
-        if "entity_id" in filter_kwargs:
-            results = [
-                item for item in results if item.entity_id == filter_kwargs["entity_id"]
-            ]
-
-        if "name" in filter_kwargs:
-            results = [item for item in results if item.name == filter_kwargs["name"]]
+    def stream_sorted(
+        self,
+        column: Any,  # noqa: ANN401
+        *filter_args: BinaryExpression[Any],
+    ) -> Iterator[str]:
+        items = self.matching(column.class_, filter_args)
+        yield from sorted(getattr(item, column.key) for item in items)
 
-        if "type" in filter_kwargs:
-            results = [item for item in results if item.type == filter_kwargs["type"]]
+    def update(
+        self,
+        table: type[GuacamoleBase],
+        values: dict[str, Any],
+        *filter_args: BinaryExpression[Any],
+    ) -> int:
+        items = self.matching(table, filter_args)
+        for item in items:
+            for key, value in values.items():
+                setattr(item, key, value)
+        return len(items)
 
-        return results
+    def update_many(
+        self,
+        table: type[GuacamoleBase],
+        key: str,
+        rows: list[dict[str, Any]],
+    ) -> int:
+        n_updated = 0
+        for row in rows:
+            for item in self.contents.get(table, []):
+                if getattr(item, key) == row[key]:
+                    for name, value in row.items():
+                        setattr(item, name, value)
+                    n_updated += 1
+        return n_updated
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any, ClassVar
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from guacamole_user_sync.aio import AsyncLDAPClient, AsyncPostgreSQLClient
+from guacamole_user_sync.ldap import LDAPClient
+from guacamole_user_sync.models import (
+    LDAPGroup,
+    LDAPQuery,
+    LDAPUser,
+    PostgreSQLError,
+    SyncPhase,
+)
+from guacamole_user_sync.postgresql import PostgreSQLClient, PostgreSQLPoolOptions
+
+from .mocks import MockLDAPConnection, MockLDAPGroupEntry, MockLDAPServer
+
+
+class TestAsyncLDAPClient:
+    """Test AsyncLDAPClient."""
+
+    def test_search_groups(
+        self,
+        ldap_query_groups_fixture: LDAPQuery,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        ldap_model_groups_fixture: list[LDAPGroup],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_groups_fixture),
+            ),
+        )
+        client = AsyncLDAPClient(LDAPClient(hostname="test-host"))
+        groups = asyncio.run(client.search_groups(ldap_query_groups_fixture))
+        for group in ldap_model_groups_fixture:
+            assert group in groups
+
+
+class TestAsyncPostgreSQLClient:
+    """Test AsyncPostgreSQLClient."""
+
+    client_kwargs: ClassVar[dict[str, Any]] = {
+        "database_name": "database_name",
+        "host_name": "host_name",
+        "port": 1234,
+        "user_name": "user_name",
+        "user_password": "user_password",
+    }
+
+    def test_engine(self) -> None:
+        client = AsyncPostgreSQLClient(
+            PostgreSQLClient(
+                **self.client_kwargs,
+                pool_options=PostgreSQLPoolOptions(pool_size=3),
+            ),
+        )
+        assert isinstance(client.engine, AsyncEngine)
+        assert client.engine.dialect.is_async
+        assert client.engine.pool.size() == 3  # type: ignore[attr-defined]  # noqa: PLR2004
+        asyncio.run(client.dispose())
+
+    def test_run(self) -> None:
+        client = AsyncPostgreSQLClient(PostgreSQLClient(**self.client_kwargs))
+        sync_session = mock.MagicMock()
+
+        async def run_sync(_: AsyncSession, operation: Any) -> Any:  # noqa: ANN401
+            return operation(sync_session)
+
+        with mock.patch.object(AsyncSession, "run_sync", run_sync):
+            backend = asyncio.run(client.run(lambda bound: bound.backend))
+        assert backend.session() is sync_session
+        assert client.client.backend.session() is not sync_session
+
+    def test_run_exception(self) -> None:
+        client = AsyncPostgreSQLClient(PostgreSQLClient(**self.client_kwargs))
+        with (
+            mock.patch.object(
+                AsyncSession,
+                "run_sync",
+                side_effect=OperationalError(
+                    statement="",
+                    params=None,
+                    orig=Exception(),
+                ),
+            ),
+            pytest.raises(PostgreSQLError, match="Unable to run PostgreSQL operation."),
+        ):
+            asyncio.run(client.run(lambda _: None))
+
+    def test_update(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        client = AsyncPostgreSQLClient(PostgreSQLClient(**self.client_kwargs))
+        calls: list[str] = []
+
+        def update(**kwargs: Any) -> int:  # noqa: ANN401
+            calls.append(",".join(kwargs["phases"]))
+            return len(calls)
+
+        def assign_users_to_groups(*_: Any) -> int:  # noqa: ANN401
+            calls.append("memberships")
+            return len(calls)
+
+        bound = mock.MagicMock()
+        bound.update.side_effect = update
+        bound.assign_users_to_groups.side_effect = assign_users_to_groups
+
+        async def run(operation: Any) -> Any:  # noqa: ANN401
+            await asyncio.sleep(0)
+            return operation(bound)
+
+        with mock.patch.object(client, "run", run):
+            n_changes = asyncio.run(
+                client.update(
+                    groups=ldap_model_groups_fixture,
+                    users=ldap_model_users_fixture,
+                    phases={SyncPhase.GROUPS, SyncPhase.MEMBERSHIPS, SyncPhase.USERS},
+                ),
+            )
+        assert calls == ["groups", "users", "memberships"]
+        assert n_changes == 6  # noqa: PLR2004
+
+    def test_update_phases(self) -> None:
+        client = AsyncPostgreSQLClient(PostgreSQLClient(**self.client_kwargs))
+        bound = mock.MagicMock()
+        bound.update.return_value = 1
+
+        async def run(operation: Any) -> Any:  # noqa: ANN401
+            return operation(bound)
+
+        with mock.patch.object(client, "run", run):
+            asyncio.run(client.update(groups=[], users=[], phases={SyncPhase.USERS}))
+        bound.update.assert_called_once_with(
+            groups=[],
+            users=[],
+            phases={SyncPhase.USERS},
+        )
+        bound.assign_users_to_groups.assert_not_called()
@@ -0,0 +1,163 @@
+import json
+import logging
+import socket
+import threading
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+import pytest
+
+from guacamole_user_sync.events import EventEmitter, JSONLinesSink, UnixSocketSink
+from guacamole_user_sync.models import ChangeEvent
+
+
+class ListSink:
+    """Sink that records each batch, optionally waiting before accepting it."""
+
+    def __init__(self, release: threading.Event | None = None) -> None:
+        self.batches: list[list[ChangeEvent]] = []
+        self.closed = False
+        self.release = release
+
+    def close(self) -> None:
+        self.closed = True
+
+    def write(self, events: Sequence[ChangeEvent]) -> None:
+        if self.release:
+            self.release.wait()
+        self.batches.append(list(events))
+
+
+def events(*names: str) -> list[ChangeEvent]:
+    return [
+        ChangeEvent(action="added", entity_type="user", name=name, timestamp="now")
+        for name in names
+    ]
+
+
+class TestChangeEvent:
+    """Test ChangeEvent."""
+
+    def test_as_dict(self) -> None:
+        event = ChangeEvent(
+            action="removed",
+            entity_type="membership",
+            name="aulus.agerius",
+            group="plaintiffs",
+            timestamp="2000-01-01T00:00:00+00:00",
+        )
+        # Empty fields are left out
+        assert event.as_dict() == {
+            "action": "removed",
+            "entity_type": "membership",
+            "name": "aulus.agerius",
+            "group": "plaintiffs",
+            "timestamp": "2000-01-01T00:00:00+00:00",
+        }
+
+
+class TestEventEmitter:
+    """Test EventEmitter."""
+
+    def test_batches(self) -> None:
+        sink = ListSink()
+        emitter = EventEmitter(sink, batch_size=2, flush_interval=60)
+        emitter.emit(events("aulus", "numerius", "titius"))
+        emitter.close()
+
+        # Full batches are delivered at once and the rest when closing
+        assert [[event.name for event in batch] for batch in sink.batches] == [
+            ["aulus", "numerius"],
+            ["titius"],
+        ]
+        assert sink.closed
+
+    def test_flush_interval(self) -> None:
+        sink = ListSink()
+        emitter = EventEmitter(sink, batch_size=100, flush_interval=0)
+        emitter.emit(events("aulus"))
+        emitter.flush()
+        assert len(sink.batches) == 1
+        emitter.close()
+
+    def test_back_pressure(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        release = threading.Event()
+        sink = ListSink(release)
+        emitter = EventEmitter(
+            sink,
+            batch_size=1,
+            max_queued=1,
+            put_timeout=0.01,
+        )
+        # One event is being delivered, one is queued and the last is dropped
+        emitter.emit(events("aulus", "numerius", "titius"))
+        release.set()
+        emitter.close()
+        assert emitter.n_dropped >= 1
+        assert (
+            "Change event queue is full, dropped 1 event(s), 1 so far." in caplog.text
+        )
+
+    def test_back_pressure_deadline(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        release = threading.Event()
+        emitter = EventEmitter(
+            ListSink(release),
+            batch_size=1,
+            max_queued=1,
+            put_timeout=0.1,
+        )
+        started = time.monotonic()
+        emitter.emit(events(*(f"user{idx}" for idx in range(20))))
+        elapsed = time.monotonic() - started
+        release.set()
+        emitter.close()
+
+        # The timeout covers the whole call, with one warning for every dropped event
+        assert elapsed < 1
+        assert emitter.n_dropped == 18  # noqa: PLR2004
+        assert len(caplog.records) == 1
+
+    def test_delivery_failure(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        emitter = EventEmitter(UnixSocketSink(Path("/nonexistent/events.sock")))
+        emitter.emit(events("aulus"))
+        emitter.close()
+        assert "Unable to deliver 1 change event(s)." in caplog.text
+
+
+class TestEventSinks:
+    """Test JSONLinesSink and UnixSocketSink."""
+
+    def test_json_lines_sink(self, tmp_path: Path) -> None:
+        sink = JSONLinesSink(tmp_path / "events.jsonl")
+        sink.write(events("aulus"))
+        sink.write(events("numerius"))
+        lines = sink.path.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["aulus", "numerius"]
+
+    def test_unix_socket_sink(self, tmp_path: Path) -> None:
+        path = tmp_path / "events.sock"
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(path))
+            server.listen(1)
+            sink = UnixSocketSink(path)
+            sink.write(events("aulus"))
+            connection, _ = server.accept()
+            with connection:
+                received = connection.recv(4096)
+            sink.close()
+        assert json.loads(received)["name"] == "aulus"
+
+    def test_unix_socket_sink_timeout(self, tmp_path: Path) -> None:
+        path = tmp_path / "events.sock"
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(path))
+            server.listen(2)
+            sink = UnixSocketSink(path, timeout=0.1)
+            # The consumer never reads, so a large batch cannot be sent
+            with pytest.raises(TimeoutError):
+                sink.write(events("a" * (1 << 23)))
+            assert sink.socket is None
@@ -1,4 +1,10 @@
 import logging
+import math
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any
 from unittest import mock
 
 import pytest
@@ -7,10 +13,19 @@ from ldap3.core.exceptions import (
     LDAPBindError,
     LDAPException,
     LDAPSessionTerminatedByServerError,
+    LDAPSocketOpenError,
 )
 
-from guacamole_user_sync.ldap import LDAPClient
+from guacamole_user_sync.ldap import (
+    LDAPClient,
+    LDAPEntryParser,
+    LDAPSearchCache,
+    LDAPServerSelector,
+)
+from guacamole_user_sync.ldap.connection_pool import LDAPConnectionPool
 from guacamole_user_sync.models import (
+    InternedArray,
+    InternTable,
     LDAPError,
     LDAPGroup,
     LDAPQuery,
@@ -18,6 +33,7 @@ from guacamole_user_sync.models import (
 )
 
 from .mocks import (
+    MockLDAPAttribute,
     MockLDAPConnection,
     MockLDAPGroupEntry,
     MockLDAPServer,
@@ -33,6 +49,10 @@ class TestLDAPClient:
         assert isinstance(client.server, Server)
         assert client.server.host == "test-host"
 
+    def test_entry_parser_requires_search(self) -> None:
+        with pytest.raises(TypeError, match="abstract method search"):
+            LDAPEntryParser()  # type: ignore[abstract]
+
     def test_connect_invalid_server(self) -> None:
         client = LDAPClient("test-host")
         with pytest.raises(LDAPError, match="Server could not be reached."):
@@ -84,24 +104,55 @@ class TestLDAPClient:
             ):
                 client.connect()
 
-    @pytest.mark.parametrize(
-        ("test_input", "expected"),
-        [("test", ["test"]), (None, []), (["a", "b"], ["a", "b"])],
-    )
-    def test_as_list_valid(
+    def test_fetch_attribute_ranges(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        dns = [f"CN=group{idx},OU=groups,DC=rome,DC=la" for idx in range(3)]
+        members = [f"user{idx}" for idx in range(7)]
+        server = MockLDAPServer([], ranges={(dn, "memberUid"): members for dn in dns})
+        connections: list[MockLDAPConnection] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(MockLDAPConnection(server=server))
+            return connections[-1]
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        response = [
+            {
+                "type": "searchResEntry",
+                "dn": dn,
+                "attributes": {"memberUid;range=0-1": members[:2]},
+                "raw_attributes": {
+                    "memberUid;range=0-1": [member.encode() for member in members[:2]],
+                },
+            }
+            for dn in dns
+        ]
+        client = LDAPClient(hostname="test-host", auto_bind=False, range_workers=2)
+        client.fetch_attribute_ranges(response)
+        for entry in response:
+            assert entry["attributes"] == {"memberUid": members}
+            assert entry["raw_attributes"] == {
+                "memberUid": [member.encode() for member in members],
+            }
+        assert 0 < len(connections) <= 2  # noqa: PLR2004
+        assert all(connection.unbound for connection in connections)
+
+    def test_fetch_attribute_ranges_not_ranged(
         self,
-        test_input: str | list[str] | None,
-        expected: list[str],
+        monkeypatch: pytest.MonkeyPatch,
     ) -> None:
-        assert LDAPClient.as_list(test_input) == expected
-
-    @pytest.mark.parametrize(("test_input", "expected"), [(42, "int"), (1.5, "float")])
-    def test_as_list_invalid(self, test_input: float, expected: str) -> None:
-        with pytest.raises(
-            ValueError,
-            match=f"Unexpected input {test_input} of type <class '{expected}'>",
-        ):
-            LDAPClient.as_list(test_input)  # type: ignore[arg-type]
+        monkeypatch.setattr(LDAPClient, "connect", mock.Mock())
+        response = [
+            {
+                "type": "searchResEntry",
+                "dn": "CN=defendants,OU=groups,DC=rome,DC=la",
+                "attributes": {"memberUid": ["numerius.negidius"]},
+                "raw_attributes": {"memberUid": [b"numerius.negidius"]},
+            },
+        ]
+        client = LDAPClient(hostname="test-host", auto_bind=False)
+        client.fetch_attribute_ranges(response)
+        assert response[0]["attributes"] == {"memberUid": ["numerius.negidius"]}
+        LDAPClient.connect.assert_not_called()  # type: ignore[attr-defined]
 
     def test_search_session_terminated(self) -> None:
         with mock.patch(
@@ -192,3 +243,492 @@ class TestLDAPClient:
         assert "base DN: OU=users,DC=rome,DC=la" in caplog.text
         assert "Server returned 2 results." in caplog.text
         assert "Loaded 2 LDAP users" in caplog.text
+
+    def test_search_users_interns_member_of(
+        self,
+        ldap_query_users_fixture: LDAPQuery,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        group_dn = "CN=everyone,OU=groups,DC=rome,DC=la"
+        entries = [
+            MockLDAPUserEntry(
+                dn=f"CN={uid},OU=users,DC=rome,DC=la",
+                displayName=uid,
+                memberOf=[group_dn],
+                uid=uid,
+                userName=f"{uid}@rome.la",
+            )
+            for uid in ("aulus.agerius", "numerius.negidius")
+        ]
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(server=MockLDAPServer(entries)),
+        )
+        client = LDAPClient(hostname="test-host")
+        users = client.search_users(query=ldap_query_users_fixture)
+        assert users[0].member_of[0] is users[1].member_of[0]
+
+    def test_search_users_details(
+        self,
+        ldap_query_users_fixture: LDAPQuery,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        entry = ldap_response_users_fixture[0]
+        entry.mail = MockLDAPAttribute("aulus.agerius@rome.la")  # type: ignore[attr-defined]
+        entry.o = MockLDAPAttribute("Senate")  # type: ignore[attr-defined]
+        entry.title = MockLDAPAttribute("Plaintiff")  # type: ignore[attr-defined]
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_users_fixture),
+            ),
+        )
+        client = LDAPClient(hostname="test-host")
+        users = client.search_users(query=ldap_query_users_fixture)
+        assert users[0].email_address == "aulus.agerius@rome.la"
+        assert users[0].organization == "Senate"
+        assert users[0].organizational_role == "Plaintiff"
+        assert not users[1].email_address
+
+    def test_search_users_attribute_map(
+        self,
+        ldap_query_users_fixture: LDAPQuery,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        ldap_response_users_fixture[0].department = MockLDAPAttribute("Law")  # type: ignore[attr-defined]
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_users_fixture),
+            ),
+        )
+        ldap_query_users_fixture.attribute_map = (("department", "department"),)
+        client = LDAPClient(hostname="test-host")
+        users = client.search_users(query=ldap_query_users_fixture)
+        assert users[0].attributes == {"department": "Law"}
+        assert users[1].attributes == {"department": ""}
+
+    def test_search_server_side_sort(
+        self,
+        ldap_query_users_fixture: LDAPQuery,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        connection = MockLDAPConnection(
+            server=MockLDAPServer(ldap_response_users_fixture),
+        )
+        monkeypatch.setattr(LDAPClient, "connect", lambda _: connection)
+        client = LDAPClient(hostname="test-host")
+        client.search_users(query=ldap_query_users_fixture)
+        assert connection.controls is None
+
+        ldap_query_users_fixture.server_side_sort = True
+        client.search_users(query=ldap_query_users_fixture)
+        assert connection.controls is not None
+        (control,) = connection.controls
+        assert str(control["controlType"]) == "1.2.840.113556.1.4.473"
+        assert not control["criticality"]
+        # A SortKeyList holding one SortKey for the name attribute
+        id_attr = ldap_query_users_fixture.id_attr.encode()
+        expected = bytes([0x30, len(id_attr) + 4, 0x30, len(id_attr) + 2, 0x04])
+        assert bytes(control["controlValue"]) == (
+            expected + bytes([len(id_attr)]) + id_attr
+        )
+
+    @pytest.mark.parametrize(
+        ("sort_result", "sorted_by_server"),
+        [(0, True), (53, False), (None, False)],
+    )
+    def test_search_server_side_sort_confirmed(  # noqa: PLR0913
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_query_users_fixture: LDAPQuery,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+        sort_result: int | None,
+        sorted_by_server: bool,  # noqa: FBT001
+    ) -> None:
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(
+                    ldap_response_users_fixture,
+                    sort_result=sort_result,
+                ),
+            ),
+        )
+        ldap_query_users_fixture.server_side_sort = True
+        client = LDAPClient(hostname="test-host")
+        assert client.search_users(query=ldap_query_users_fixture)
+        # The server's sort response is checked, so a server that declined is noticed
+        assert (
+            "LDAP server did not sort the results from" in caplog.text
+        ) is not sorted_by_server
+
+    def test_search_users_attributes(
+        self,
+        ldap_query_users_fixture: LDAPQuery,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        requested: list[list[str]] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connection = MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_users_fixture),
+            )
+            search = connection.search
+
+            def record(*args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+                requested.append(kwargs.get("attributes", args[2:3]))
+                search(*args, **kwargs)
+
+            monkeypatch.setattr(connection, "search", record)
+            return connection
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        client = LDAPClient(hostname="test-host")
+        users = client.search_users(ldap_query_users_fixture, attributes=["uid"])
+        assert requested == [["userName", "uid"]]
+        assert all(user.uid for user in users)
+
+    def test_search_users_missing_id_attr(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        caplog.set_level(logging.DEBUG)
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_users_fixture),
+            ),
+        )
+        client = LDAPClient(hostname="test-host")
+        users = client.search_users(
+            query=LDAPQuery(base_dn="", filter="", id_attr="mail"),
+        )
+        assert users == []
+        assert (
+            "Skipping LDAP user CN=aulus.agerius,OU=users,DC=rome,DC=la with no mail"
+            in caplog.text
+        )
+
+    def test_search_groups_with_intern_table(
+        self,
+        ldap_query_groups_fixture: LDAPQuery,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        ldap_model_groups_fixture: list[LDAPGroup],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            lambda _: MockLDAPConnection(
+                server=MockLDAPServer(ldap_response_groups_fixture),
+            ),
+        )
+        table = InternTable()
+        client = LDAPClient(hostname="test-host", intern_table=table)
+        groups = client.search_groups(query=ldap_query_groups_fixture)
+        for group in ldap_model_groups_fixture:
+            assert group in groups
+        assert all(isinstance(group.member_uid, InternedArray) for group in groups)
+        # Each distinct group name and member UID is stored only once
+        assert len(table) == 5  # noqa: PLR2004
+
+    def test_connect_failover(self, caplog: pytest.LogCaptureFixture) -> None:
+        connection = MockLDAPConnection()
+        with mock.patch(
+            "guacamole_user_sync.ldap.ldap_client.Connection",
+            side_effect=[LDAPSocketOpenError(), connection],
+        ) as mock_connection:
+            client = LDAPClient(["ldap://dc1", "ldap://dc2"], auto_bind=False)
+            client.selector.latencies = {"ldap://dc1:389": 0.1, "ldap://dc2:389": 0.2}
+            client.selector.check_interval = math.inf
+            client.selector._last_check = 0  # noqa: SLF001
+            assert client.connect() is connection
+        servers = [call.args[0].host for call in mock_connection.call_args_list]
+        assert servers == ["dc1", "dc2"]
+        assert client.server.host == "dc2"
+        assert "Marking LDAP server ldap://dc1:389 as unavailable" in caplog.text
+
+    def test_search_failover(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        failed = MockLDAPConnection()
+        failed.search = mock.Mock(  # type: ignore[method-assign]
+            side_effect=LDAPSessionTerminatedByServerError(),
+        )
+        monkeypatch.setattr(
+            LDAPClient,
+            "connect",
+            mock.Mock(
+                side_effect=[
+                    failed,
+                    MockLDAPConnection(server=MockLDAPServer([])),
+                ],
+            ),
+        )
+        client = LDAPClient(["ldap://dc1", "ldap://dc2"], auto_bind=False)
+        client.selector.mark_failed = mock.Mock()  # type: ignore[method-assign]
+        assert client.search(query=LDAPQuery(base_dn="", filter="", id_attr="")) == []
+        client.selector.mark_failed.assert_called_once()
+
+    def test_search_shards(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        ldap_response_users_fixture: list[MockLDAPUserEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        caplog.set_level(logging.DEBUG)
+        connections: list[MockLDAPConnection] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(
+                MockLDAPConnection(
+                    server=MockLDAPServer(
+                        ldap_response_groups_fixture + ldap_response_users_fixture,  # type: ignore[operator]
+                    ),
+                ),
+            )
+            return connections[-1]
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        client = LDAPClient(hostname="test-host", shard_workers=2)
+        query = LDAPQuery(
+            base_dn="OU=groups,DC=rome,DC=la",
+            filter="(objectClass=*)",
+            id_attr="cn",
+            extra_base_dns=("OU=users,DC=rome,DC=la",),
+            filter_partitions=("(cn=a*)", "(!(cn=a*))"),
+        )
+        results = client.search(query)
+        # The mock server ignores filters so each entry is returned by two shards
+        assert len(results) == 5  # noqa: PLR2004
+        assert "Searching 4 shards concurrently." in caplog.text
+        assert "Server returned 5 results." in caplog.text
+        assert 0 < len(connections) <= 2  # noqa: PLR2004
+        assert all(connection.unbound for connection in connections)
+
+    def test_search_shard_connection_reused(
+        self,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+    ) -> None:
+        connection = MockLDAPConnection(
+            server=MockLDAPServer(ldap_response_groups_fixture),
+        )
+
+        class ReusedConnectionPool(LDAPConnectionPool):
+            """Pool whose connections are borrowed again as soon as they return."""
+
+            @contextmanager
+            def connection(self) -> Iterator[Connection]:
+                with super().connection() as borrowed:
+                    yield borrowed
+                borrowed.response = []
+
+        client = LDAPClient(hostname="test-host")
+        with ReusedConnectionPool(lambda: connection) as pool:
+            results = client.search_shard(
+                pool,
+                "OU=groups,DC=rome,DC=la",
+                "(objectClass=*)",
+                None,
+            )
+        assert len(results) == len(ldap_response_groups_fixture)
+
+    def test_search_reuse_results(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_query_groups_fixture: LDAPQuery,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        caplog.set_level(logging.DEBUG)
+        connections: list[MockLDAPConnection] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(
+                MockLDAPConnection(server=MockLDAPServer(ldap_response_groups_fixture)),
+            )
+            return connections[-1]
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        client = LDAPClient(hostname="test-host")
+        with client.reuse_results():
+            first = client.search_groups(ldap_query_groups_fixture)
+            second = client.search_groups(ldap_query_groups_fixture)
+        assert first == second
+        assert len(connections) == 1
+        assert "Using cached LDAP search results." in caplog.text
+        # Results are not reused outside the context
+        client.search_groups(ldap_query_groups_fixture)
+        assert len(connections) == 2  # noqa: PLR2004
+
+    def test_search_cache_ttl(
+        self,
+        ldap_query_groups_fixture: LDAPQuery,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        connections: list[MockLDAPConnection] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(
+                MockLDAPConnection(server=MockLDAPServer(ldap_response_groups_fixture)),
+            )
+            return connections[-1]
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        monkeypatch.setattr(LDAPClient, "read_watermark", lambda _: "1")
+        client = LDAPClient(hostname="test-host", watermark_attr="highestCommittedUSN")
+        ldap_query_groups_fixture.cache_ttl = 60
+        client.search_groups(ldap_query_groups_fixture)
+        client.search_groups(ldap_query_groups_fixture)
+        assert len(connections) == 1
+        # A different set of attributes is a different search
+        client.search(ldap_query_groups_fixture, ["cn"])
+        assert len(connections) == 2  # noqa: PLR2004
+        # Sorted results are not reused for an unsorted search or vice versa
+        ldap_query_groups_fixture.server_side_sort = True
+        client.search_groups(ldap_query_groups_fixture)
+        assert len(connections) == 3  # noqa: PLR2004
+
+
+class TestLDAPSearchCache:
+    """Test LDAPSearchCache."""
+
+    def test_ttl(self) -> None:
+        now = [0.0]
+        cache = LDAPSearchCache(clock=lambda: now[0])
+        searches: list[int] = []
+
+        def search() -> list[dict[str, Any]]:
+            searches.append(len(searches))
+            return [{"dn": f"CN={len(searches)}"}]
+
+        assert cache.get("groups", search, ttl=10) == [{"dn": "CN=1"}]
+        now[0] = 9.0
+        assert cache.get("groups", search, ttl=10) == [{"dn": "CN=1"}]
+        now[0] = 10.0
+        assert cache.get("groups", search, ttl=10) == [{"dn": "CN=2"}]
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_cycle(self) -> None:
+        cache = LDAPSearchCache()
+        searches: list[str] = []
+
+        def search() -> list[dict[str, Any]]:
+            searches.append("users")
+            return []
+
+        with cache.cycle():
+            cache.get("users", search)
+            cache.get("users", search)
+        assert len(searches) == 1
+        with cache.cycle():
+            cache.get("users", search)
+        assert len(searches) == 2  # noqa: PLR2004
+        # Results without a TTL are not kept once the cycle ends
+        assert len(cache.entries) == 0
+        cache.get("users", search)
+        assert len(cache.entries) == 0
+
+    def test_expired_entries_removed(self) -> None:
+        now = [0.0]
+        cache = LDAPSearchCache(clock=lambda: now[0])
+        cache.get("groups", list, ttl=10)
+        now[0] = 10.0
+        cache.get("users", list, ttl=60)
+        assert list(cache.entries) == ["users"]
+
+    def test_lru_eviction(self) -> None:
+        cache = LDAPSearchCache(max_entries=2)
+        for key in ("a", "b", "a", "c"):
+            cache.get(key, list, ttl=60)
+        assert list(cache.entries) == ["a", "c"]
+        assert len(cache) == 2  # noqa: PLR2004
+
+    def test_failure_not_cached(self) -> None:
+        cache = LDAPSearchCache()
+
+        def search() -> list[dict[str, Any]]:
+            msg = "Server unavailable"
+            raise LDAPError(msg)
+
+        with pytest.raises(LDAPError, match="Server unavailable"):
+            cache.get("users", search, ttl=60)
+        assert len(cache) == 0
+
+    def test_concurrent_searches(self) -> None:
+        cache = LDAPSearchCache()
+        started = threading.Event()
+        release = threading.Event()
+        searches: list[str] = []
+
+        def search() -> list[dict[str, Any]]:
+            searches.append("groups")
+            started.set()
+            release.wait(5)
+            return [{"dn": "CN=plaintiffs"}]
+
+        with cache.cycle(), ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(cache.get, "groups", search)
+            started.wait(5)
+            second = executor.submit(cache.get, "groups", search)
+            release.set()
+            assert first.result() == second.result() == [{"dn": "CN=plaintiffs"}]
+        assert searches == ["groups"]
+
+    def test_watermark(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.INFO)
+        now = [0.0]
+        cache = LDAPSearchCache(clock=lambda: now[0], watermark_interval=30)
+        cache.check_watermark(lambda: "100")
+        cache.get("groups", list, ttl=3600)
+        # The watermark is not read again until the interval has passed
+        cache.check_watermark(lambda: "101")
+        assert len(cache) == 1
+        now[0] = 30.0
+        cache.check_watermark(lambda: "100")
+        assert len(cache) == 1
+        now[0] = 60.0
+        cache.check_watermark(lambda: "101")
+        assert len(cache) == 0
+        assert "LDAP watermark changed from 100 to 101" in caplog.text
+
+
+class TestLDAPServerSelector:
+    """Test LDAPServerSelector."""
+
+    def test_ordered(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        servers = [Server(f"ldap://dc{idx}") for idx in range(3)]
+        latencies = {"dc0": math.inf, "dc1": 0.2, "dc2": 0.1}
+        monkeypatch.setattr(
+            LDAPServerSelector,
+            "measure",
+            lambda _, server: latencies[server.host],
+        )
+        selector = LDAPServerSelector(servers)
+        assert [server.host for server in selector.ordered()] == ["dc2", "dc1", "dc0"]
+        selector.mark_failed(servers[2])
+        assert selector.preferred.host == "dc1"
+
+    def test_ordered_single_server(self) -> None:
+        selector = LDAPServerSelector([Server("ldap://dc0")])
+        selector.check = mock.Mock()  # type: ignore[method-assign]
+        assert [server.host for server in selector.ordered()] == ["dc0"]
+        selector.check.assert_not_called()
+
+    def test_measure_unreachable(self) -> None:
+        selector = LDAPServerSelector([Server("ldap://dc0")], check_timeout=0.1)
+        with mock.patch("socket.create_connection", side_effect=OSError()):
+            assert selector.measure(selector.servers[0]) == math.inf
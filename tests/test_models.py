@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from guacamole_user_sync.models import (
+    InternedArray,
+    InternTable,
+    LDAPQuery,
+    LDAPUser,
+    PermissionRule,
+)
+
+
+class TestInternTable:
+    """Test InternTable."""
+
+    def test_add(self) -> None:
+        table = InternTable()
+        assert table.add("plaintiffs") == 0
+        assert table.add("defendants") == 1
+        assert table.add("plaintiffs") == 0
+        assert len(table) == 2  # noqa: PLR2004
+        assert table[1] == "defendants"
+
+    def test_intern(self) -> None:
+        table = InternTable()
+        first = table.intern(b"aulus.agerius".decode())
+        second = table.intern(b"aulus.agerius".decode())
+        assert first is not b"aulus.agerius".decode()
+        assert first is second
+
+    def test_array(self) -> None:
+        table = InternTable()
+        members = table.array(["aulus.agerius", "numerius.negidius"])
+        assert isinstance(members, InternedArray)
+        assert list(members.ids) == [0, 1]
+        assert members.ids.itemsize == 4  # noqa: PLR2004
+        assert members[1] == "numerius.negidius"
+        assert members[:1] == ["aulus.agerius"]
+        assert list(members) == ["aulus.agerius", "numerius.negidius"]
+
+    def test_add_concurrently(self) -> None:
+        table = InternTable()
+        values = [f"CN=group{idx},OU=groups,DC=rome,DC=la" for idx in range(1000)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(table.add, values * 8))
+        # Every thread sees the same ID for the same string
+        assert len(table) == len(values)
+        assert all(
+            table[value_id] == value
+            for value_id, value in zip(results, values * 8, strict=True)
+        )
+
+
+class TestInternedArray:
+    """Test InternedArray."""
+
+    def test_equality(self) -> None:
+        table = InternTable()
+        members = table.array(["aulus.agerius", "numerius.negidius"])
+        assert members == ["aulus.agerius", "numerius.negidius"]
+        assert members == ("aulus.agerius", "numerius.negidius")
+        assert members == table.array(["aulus.agerius", "numerius.negidius"])
+        assert members != ["aulus.agerius"]
+        assert members != "aulus.agerius"
+        assert hash(members) == hash(("aulus.agerius", "numerius.negidius"))
+
+    def test_ldap_user_equality(self) -> None:
+        table = InternTable()
+        dn = "CN=plaintiffs,OU=groups,DC=rome,DC=la"
+        user = LDAPUser(
+            display_name="Aulus Agerius",
+            member_of=table.array([dn]),
+            name="aulus.agerius@rome.la",
+            uid="aulus.agerius",
+        )
+        assert user == LDAPUser(
+            display_name="Aulus Agerius",
+            member_of=[dn],
+            name="aulus.agerius@rome.la",
+            uid="aulus.agerius",
+        )
+        assert repr(user.member_of) == f"InternedArray(['{dn}'])"
+
+
+class TestLDAPQuery:
+    """Test LDAPQuery."""
+
+    def test_shards(self) -> None:
+        query = LDAPQuery(
+            base_dn="OU=users,DC=rome,DC=la",
+            filter="(objectClass=posixAccount)",
+            id_attr="uid",
+        )
+        assert query.shards() == [
+            ("OU=users,DC=rome,DC=la", "(objectClass=posixAccount)"),
+        ]
+
+    def test_shards_with_partitions(self) -> None:
+        query = LDAPQuery(
+            base_dn="OU=users,DC=rome,DC=la",
+            filter="(objectClass=posixAccount)",
+            id_attr="uid",
+            extra_base_dns=("OU=users,DC=ostia,DC=la",),
+            filter_partitions=LDAPQuery.initial_partitions("uid", "an"),
+        )
+        shards = query.shards()
+        assert len(shards) == 6  # noqa: PLR2004
+        assert shards[0] == (
+            "OU=users,DC=rome,DC=la",
+            "(&(objectClass=posixAccount)(uid=a*))",
+        )
+        assert shards[-1] == (
+            "OU=users,DC=ostia,DC=la",
+            "(&(objectClass=posixAccount)(!(|(uid=a*)(uid=n*))))",
+        )
+
+
+class TestPermissionRule:
+    """Test PermissionRule."""
+
+    def test_constructor(self) -> None:
+        rule = PermissionRule(
+            connection="forum",
+            group="plaintiffs",
+            permissions=["READ", "UPDATE"],  # type: ignore[arg-type]
+        )
+        assert rule.permissions == ("READ", "UPDATE")
+        assert PermissionRule(connection_group="basilica", group="everyone")
+
+    @pytest.mark.parametrize(
+        ("kwargs", "message"),
+        [
+            ({"group": "plaintiffs"}, "one of connection or connection_group"),
+            (
+                {"connection": "forum", "connection_group": "basilica"},
+                "one of connection or connection_group",
+            ),
+            ({"connection": "forum"}, "one of group or attribute"),
+            ({"attribute": "department", "connection": "forum"}, "needs a value"),
+            (
+                {"connection": "forum", "group": "plaintiffs", "permissions": ["X"]},
+                "Unknown permission",
+            ),
+        ],
+    )
+    def test_invalid(self, kwargs: dict[str, object], message: str) -> None:
+        with pytest.raises(ValueError, match=message):
+            PermissionRule(**kwargs)  # type: ignore[arg-type]
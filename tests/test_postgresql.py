@@ -1,7 +1,12 @@
+import dataclasses
+import io
+import json
 import logging
-from typing import Any, ClassVar
+from datetime import UTC, datetime, timedelta
+from typing import Any, ClassVar, cast
 from unittest import mock
 
+import psycopg
 import pytest
 from sqlalchemy import URL, Engine, text
 from sqlalchemy.dialects.postgresql.psycopg import PGDialect_psycopg
@@ -10,19 +15,41 @@ from sqlalchemy.orm import Session
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql.elements import BinaryExpression, TextClause
 
-from guacamole_user_sync.models import LDAPGroup, LDAPUser, PostgreSQLError
+from guacamole_user_sync.models import (
+    LDAPGroup,
+    LDAPUser,
+    PermissionRule,
+    PostgreSQLError,
+    SyncPhase,
+)
 from guacamole_user_sync.postgresql import (
+    PostgreSQLAdvisoryLock,
     PostgreSQLBackend,
     PostgreSQLClient,
     PostgreSQLConnectionDetails,
+    PostgreSQLPoolOptions,
+    PostgreSQLRetentionOptions,
+    PostgreSQLWriteOptions,
+    PostgreSQLWriteScheduler,
+    SchemaVersion,
+    WritePlan,
 )
+from guacamole_user_sync.postgresql.merge_join import is_increasing, merge_join
 from guacamole_user_sync.postgresql.orm import (
+    GuacamoleConnection,
+    GuacamoleConnectionGroup,
+    GuacamoleConnectionGroupPermission,
+    GuacamoleConnectionPermission,
     GuacamoleEntity,
     GuacamoleEntityType,
+    GuacamoleObjectPermissionType,
     GuacamoleUser,
+    GuacamoleUserAttribute,
     GuacamoleUserGroup,
+    GuacamoleUserGroupAttribute,
+    GuacamoleUserGroupMember,
 )
-from guacamole_user_sync.postgresql.sql import SchemaVersion
+from guacamole_user_sync.postgresql.postgresql_client import DISABLED_AT_ATTRIBUTE
 
 from .mocks import MockPostgreSQLBackend
 
@@ -30,7 +57,11 @@ from .mocks import MockPostgreSQLBackend
 class TestPostgreSQLBackend:
     """Test PostgreSQLBackend."""
 
-    def mock_backend(self, session: Session | None = None) -> PostgreSQLBackend:
+    def mock_backend(
+        self,
+        session: Session | None = None,
+        write_options: PostgreSQLWriteOptions | None = None,
+    ) -> PostgreSQLBackend:
         return PostgreSQLBackend(
             connection_details=PostgreSQLConnectionDetails(
                 database_name="database_name",
@@ -40,6 +71,7 @@ class TestPostgreSQLBackend:
                 user_password="user_password",  # noqa: S106
             ),
             session=session,
+            write_options=write_options or PostgreSQLWriteOptions(chunk_size=None),
         )
 
     def mock_session(self) -> mock.MagicMock:
@@ -69,10 +101,124 @@ class TestPostgreSQLBackend:
         assert not backend.engine.echo
         assert not backend.engine.hide_parameters
 
+    def test_engine_pool_options(self) -> None:
+        backend = PostgreSQLBackend(
+            connection_details=self.mock_backend().connection_details,
+            pool_options=PostgreSQLPoolOptions(pool_recycle=60, pool_size=3),
+        )
+        assert isinstance(backend.engine.pool, QueuePool)
+        assert backend.engine.pool.size() == 3  # noqa: PLR2004
+        assert backend.engine.pool._pre_ping  # noqa: SLF001
+        recycle = backend.engine.pool._recycle  # noqa: SLF001
+        assert recycle == 60  # noqa: PLR2004
+
+    def test_pool_options_connect_args(self) -> None:
+        connect_args = PostgreSQLPoolOptions(prepare_threshold=None).connect_args
+        assert connect_args["keepalives"] == 1
+        assert connect_args["prepare_threshold"] is None
+
     def test_session(self) -> None:
         backend = self.mock_backend()
         assert isinstance(backend.session(), Session)
 
+    def replica_backend(self, *status: Any) -> PostgreSQLBackend:  # noqa: ANN401
+        backend = PostgreSQLBackend(
+            connection_details=dataclasses.replace(
+                self.mock_backend().connection_details,
+                replica_host_name="replica_host_name",
+            ),
+        )
+        replica_engine = mock.MagicMock()
+        connection = replica_engine.connect.return_value.__enter__.return_value
+        connection.execute.return_value.one.side_effect = status
+        backend._replica_engine = replica_engine  # noqa: SLF001
+        return backend
+
+    def test_replica_url(self) -> None:
+        details = self.mock_backend().connection_details
+        assert details.replica_url is None
+        details.replica_host_name = "replica_host_name"
+        assert details.replica_url is not None
+        assert details.replica_url.host == "replica_host_name"
+        assert details.replica_url.port == 1234  # noqa: PLR2004
+        assert details.replica_url.database == "database_name"
+
+    def test_reader(self) -> None:
+        backend = self.mock_backend()
+        assert backend.reader().bind is backend.engine
+
+    def test_reader_replica(self) -> None:
+        backend = self.replica_backend((True, 0.5))
+        assert backend.reader().bind is backend.replica_engine
+
+    def test_reader_replica_lagging(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        backend = self.replica_backend((True, 30.0), (False, 0))
+        assert backend.reader().bind is backend.engine
+        assert (
+            "PostgreSQL replica is 30.0s behind, reading from primary." in caplog.text
+        )
+        # A replica that has not replayed our own writes is not used either
+        assert backend.reader().bind is backend.engine
+
+    def test_reader_replica_unreachable(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        backend = self.replica_backend(OperationalError("statement", {}, Exception()))
+        assert backend.reader().bind is backend.engine
+        assert (
+            "Unable to reach PostgreSQL replica, reading from primary." in caplog.text
+        )
+
+    def test_reader_replica_after_write(self) -> None:
+        backend = self.replica_backend((True, 0))
+        primary_session = mock.MagicMock()
+        primary_session.__enter__.return_value = primary_session
+        primary_session.execute.return_value.scalar_one.return_value = "0/16B3740"
+        with mock.patch.object(backend, "session", return_value=primary_session):
+            with backend.transaction():
+                pass
+            backend.reader()
+
+        # The replica must have replayed the primary's position after the write
+        replica_engine = cast(mock.MagicMock, backend.replica_engine)
+        connection = replica_engine.connect.return_value.__enter__.return_value
+        assert connection.execute.call_args.args[1] == {"lsn": "0/16B3740"}
+
+    def test_cycle(self) -> None:
+        backend = self.mock_backend()
+        connection = mock.MagicMock()
+        engine = mock.MagicMock()
+        engine.connect.return_value.__enter__.return_value = connection
+        backend._engine = engine  # noqa: SLF001
+        with backend.cycle():
+            assert backend.session().bind is connection
+            # Nested cycles share the same connection
+            with backend.cycle():
+                assert backend.session().bind is connection
+        engine.connect.assert_called_once()
+        assert backend.session().bind is engine
+
+    def test_pipeline(self) -> None:
+        session = self.mock_session()
+        driver_connection = mock.MagicMock(spec=psycopg.Connection)
+        session.connection.return_value.connection.driver_connection = driver_connection
+        backend = self.mock_backend(session=session)
+        backend.execute_commands([text("SELECT 1"), text("SELECT 2")])
+        driver_connection.pipeline.assert_called_once()
+        assert session.execute.call_count == 2  # noqa: PLR2004
+
+    def test_pipeline_disabled(self) -> None:
+        session = self.mock_session()
+        driver_connection = mock.MagicMock(spec=psycopg.Connection)
+        session.connection.return_value.connection.driver_connection = driver_connection
+        backend = PostgreSQLBackend(
+            connection_details=self.mock_backend().connection_details,
+            pool_options=PostgreSQLPoolOptions(pipeline=False),
+            session=session,
+        )
+        backend.execute_commands([text("SELECT 1")])
+        driver_connection.pipeline.assert_not_called()
+
     def test_add_all(
         self,
         postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
@@ -128,6 +274,185 @@ class TestPostgreSQLBackend:
         assert len(filter_args) == 1
         assert isinstance(filter_args[0], BinaryExpression)
 
+    def test_add_all_chunked(
+        self,
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+    ) -> None:
+        session = self.mock_session()
+        backend = self.mock_backend(
+            session=session,
+            write_options=PostgreSQLWriteOptions(
+                chunk_size=2,
+                max_chunk_size=2,
+                min_chunk_size=2,
+            ),
+        )
+        backend.add_all(postgresql_model_guacamoleentity_fixture)
+
+        # Each chunk is committed in its own transaction with a lock timeout
+        n_chunks = (len(postgresql_model_guacamoleentity_fixture) + 1) // 2
+        assert session.add_all.call_count == n_chunks
+        assert session.begin.call_count == n_chunks
+        assert session.execute.call_args.args[1] == {"timeout": "2000ms"}
+
+    def test_delete_chunked(self) -> None:
+        session = self.mock_session()
+        session.order_by.return_value.all.return_value = [
+            (1,),
+            (2,),
+            (3,),
+        ]
+        session.delete.return_value = 1
+        backend = self.mock_backend(
+            session=session,
+            write_options=PostgreSQLWriteOptions(
+                chunk_size=2,
+                lock_timeout=None,
+                max_chunk_size=2,
+                min_chunk_size=2,
+            ),
+        )
+        n_deleted = backend.delete(
+            GuacamoleEntity,
+            GuacamoleEntity.type == GuacamoleEntityType.USER,
+        )
+
+        # Matching keys are read once then deleted in two chunks
+        assert n_deleted == 2  # noqa: PLR2004
+        assert session.delete.call_count == 2  # noqa: PLR2004
+        session.execute.assert_not_called()
+        key_filter = session.filter.call_args.args[-1]
+        assert key_filter.right.value == [3]
+
+    def test_update_chunked(self) -> None:
+        session = self.mock_session()
+        session.order_by.return_value.all.return_value = [
+            (1,),
+            (2,),
+            (3,),
+        ]
+        session.update.return_value = 1
+        backend = self.mock_backend(
+            session=session,
+            write_options=PostgreSQLWriteOptions(
+                chunk_size=1,
+                max_chunk_size=1,
+                min_chunk_size=1,
+            ),
+        )
+        n_updated = backend.update(
+            GuacamoleUser,
+            {GuacamoleUser.disabled: True},
+            GuacamoleUser.disabled.is_(False),
+        )
+        expected = 3
+        assert n_updated == expected
+        assert session.update.call_count == expected
+
+    def test_delete_chunked_composite_key(
+        self,
+        sqlite_session_fixture: Session,
+    ) -> None:
+        sqlite_session_fixture.add_all(
+            [
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=5),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=4),
+            ],
+        )
+        sqlite_session_fixture.commit()
+        backend = self.mock_backend(
+            session=sqlite_session_fixture,
+            write_options=PostgreSQLWriteOptions(
+                chunk_size=1,
+                lock_timeout=None,
+                max_chunk_size=1,
+                min_chunk_size=1,
+            ),
+        )
+
+        # Each chunk deletes exactly one row although the rows share a group
+        assert backend.primary_keys(
+            GuacamoleUserGroupMember,
+            GuacamoleUserGroupMember.user_group_id == 11,  # noqa: PLR2004
+        ) == [(11, 4), (11, 5)]
+        n_deleted = backend.delete(
+            GuacamoleUserGroupMember,
+            GuacamoleUserGroupMember.user_group_id == 11,  # noqa: PLR2004
+        )
+        assert n_deleted == 2  # noqa: PLR2004
+        members = sqlite_session_fixture.query(GuacamoleUserGroupMember).all()
+        assert [(m.user_group_id, m.member_entity_id) for m in members] == [(12, 4)]
+
+    def test_stream_sorted(self) -> None:
+        session = self.mock_session()
+        session.scalars.return_value = iter(["defendants", "plaintiffs"])
+        backend = self.mock_backend(session=session)
+        names = backend.stream_sorted(
+            GuacamoleEntity.name,
+            GuacamoleEntity.type == GuacamoleEntityType.USER_GROUP,
+        )
+        assert list(names) == ["defendants", "plaintiffs"]
+
+        # Names are sorted by code point and read in batches
+        statement = session.scalars.call_args.args[0]
+        assert 'ORDER BY guacamole_entity.name COLLATE "C"' in str(statement)
+        assert statement.get_execution_options()["yield_per"] == 1000  # noqa: PLR2004
+
+    def test_update_many(self) -> None:
+        session = self.mock_session()
+        session.execute.return_value.rowcount = 2
+        backend = self.mock_backend(
+            session=session,
+            write_options=PostgreSQLWriteOptions(lock_timeout=None),
+        )
+        n_updated = backend.update_many(
+            GuacamoleUser,
+            "entity_id",
+            [
+                {"entity_id": 4, "full_name": "Aulus Agerius"},
+                {"entity_id": 5, "full_name": "Numerius Negidius"},
+            ],
+        )
+
+        # Every row is updated by one statement
+        assert n_updated == 2  # noqa: PLR2004
+        session.execute.assert_called_once()
+        statement = str(session.execute.call_args.args[0].compile())
+        assert "UPDATE guacamole_user SET full_name=changes.full_name" in statement
+        assert "FROM (VALUES" in statement
+        assert "guacamole_user.entity_id = changes.entity_id" in statement
+
+    def test_plan(self) -> None:
+        session = self.mock_session()
+        session.all.return_value = [
+            GuacamoleUser(entity_id=4, user_id=2, password_hash=b"", disabled=False),
+        ]
+        backend = self.mock_backend(session=session)
+        backend.plan = WritePlan(backend.write_options)
+        backend.add_all([GuacamoleEntity(name="aulus.agerius", type="USER")])
+        n_removed = backend.delete(GuacamoleUser, GuacamoleUser.disabled.is_(False))
+        n_updated = backend.update(GuacamoleUser, {GuacamoleUser.disabled: True})
+
+        # Writes are recorded but only the matching rows are read
+        assert (n_removed, n_updated) == (1, 1)
+        session.add_all.assert_not_called()
+        session.delete.assert_not_called()
+        session.update.assert_not_called()
+        assert [(write.action, write.table) for write in backend.plan.writes] == [
+            ("add", "guacamole_entity"),
+            ("remove", "guacamole_user"),
+            ("update", "guacamole_user"),
+        ]
+        assert backend.plan.writes[0].row == {"name": "aulus.agerius", "type": "USER"}
+        assert backend.plan.writes[2].row == {"user_id": 2, "disabled": True}
+
+    def test_update_many_empty(self) -> None:
+        session = self.mock_session()
+        backend = self.mock_backend(session=session)
+        assert backend.update_many(GuacamoleUser, "entity_id", []) == 0
+        session.execute.assert_not_called()
+
     def test_execute_commands(self) -> None:
         command = text("SELECT * FROM guacamole_entity;")
         session = self.mock_session()
@@ -187,6 +512,63 @@ class TestPostgreSQLBackend:
         assert filter_by_kwargs["type"] == GuacamoleEntityType.USER
 
 
+class TestPostgreSQLAdvisoryLock:
+    """Test PostgreSQLAdvisoryLock."""
+
+    def mock_engine(self, *, acquired: bool) -> mock.MagicMock:
+        engine = mock.MagicMock()
+        connection = engine.connect.return_value.execution_options.return_value
+        connection.execute.return_value.scalar.return_value = acquired
+        return engine
+
+    def test_key(self) -> None:
+        lock = PostgreSQLAdvisoryLock(mock.MagicMock(), "guacamole-user-sync")
+        assert lock.key == PostgreSQLAdvisoryLock(mock.MagicMock(), lock.name).key
+        assert -(2**63) <= lock.key < 2**63
+
+    def test_acquire(self) -> None:
+        engine = self.mock_engine(acquired=True)
+        lock = PostgreSQLAdvisoryLock(engine, "guacamole-user-sync")
+        assert lock.acquire()
+        assert lock.held
+        connection = engine.connect.return_value.execution_options.return_value
+        statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+        assert statements[0] == "SELECT pg_try_advisory_lock(:key)"
+        assert "SET tcp_keepalives_idle = 10" in statements
+        # Renewing the lock reuses the same connection
+        assert lock.acquire()
+        engine.connect.assert_called_once()
+        lock.release()
+        assert not lock.held
+        connection.close.assert_called_once()
+
+    def test_acquire_held_elsewhere(self) -> None:
+        engine = self.mock_engine(acquired=False)
+        lock = PostgreSQLAdvisoryLock(engine, "guacamole-user-sync")
+        assert not lock.acquire()
+        assert not lock.held
+        connection = engine.connect.return_value.execution_options.return_value
+        connection.close.assert_called_once()
+
+    def test_acquire_after_connection_lost(
+        self,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        engine = self.mock_engine(acquired=True)
+        lock = PostgreSQLAdvisoryLock(engine, "guacamole-user-sync")
+        assert lock.acquire()
+        connection = engine.connect.return_value.execution_options.return_value
+        connection.execute.side_effect = [
+            OperationalError(statement="SELECT 1", params=None, orig=Exception()),
+            mock.DEFAULT,
+            mock.DEFAULT,
+            mock.DEFAULT,
+        ]
+        assert lock.acquire()
+        assert engine.connect.call_count == 2  # noqa: PLR2004
+        assert "Lost connection holding advisory lock" in caplog.text
+
+
 class TestPostgreSQLClient:
     """Test PostgreSQLClient."""
 
@@ -203,6 +585,47 @@ class TestPostgreSQLClient:
         assert isinstance(client, PostgreSQLClient)
         assert isinstance(client.backend, PostgreSQLBackend)
 
+    def test_acquire_leadership(self) -> None:
+        client = PostgreSQLClient(**self.client_kwargs)
+        assert client.leader_lock is None
+        assert client.acquire_leadership()
+
+    def test_acquire_leadership_exception(self) -> None:
+        client = PostgreSQLClient(**self.client_kwargs, leader_lock_name="sync")
+        with (
+            mock.patch.object(
+                PostgreSQLAdvisoryLock,
+                "acquire",
+                side_effect=OperationalError(
+                    statement="",
+                    params=None,
+                    orig=Exception(),
+                ),
+            ),
+            pytest.raises(
+                PostgreSQLError,
+                match="Unable to acquire PostgreSQL leader lock.",
+            ),
+        ):
+            client.acquire_leadership()
+
+    def test_cycle_exception(self) -> None:
+        client = PostgreSQLClient(**self.client_kwargs)
+        with (
+            mock.patch.object(
+                PostgreSQLBackend,
+                "cycle",
+                side_effect=OperationalError(
+                    statement="",
+                    params=None,
+                    orig=Exception(),
+                ),
+            ),
+            pytest.raises(PostgreSQLError, match="Unable to connect to PostgreSQL."),
+            client.cycle(),
+        ):
+            pass
+
     def test_assign_users_to_groups(
         self,
         caplog: pytest.LogCaptureFixture,
@@ -496,8 +919,8 @@ class TestPostgreSQLClient:
                 "... 3 user group entit(y|ies) will be added",
                 "There are 3 valid user group entit(y|ies)",
                 "There are 0 user entit(y|ies) currently registered",
-                "... 2 user entit(y|ies) will be added",
-                "There are 2 valid user entit(y|ies)",
+                "... 2 user entit(y|ies) were added",
+                "... 0 unused user entit(y|ies) were removed",
                 "Ensuring that 2 user(s) are correctly assigned among 3 group(s)",
                 "Working on group 'defendants'",
                 "Group 'defendants' has entity_id: None and user_group_id: None",
@@ -516,6 +939,27 @@ class TestPostgreSQLClient:
             ):
                 assert output_line in caplog.text
 
+    def test_update_phases(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = MockPostgreSQLBackend()
+            client = PostgreSQLClient(**self.client_kwargs)
+            client.update(
+                groups=ldap_model_groups_fixture,
+                users=ldap_model_users_fixture,
+                phases={SyncPhase.USERS},
+            )
+        assert "Ensuring that 2 user(s) are registered" in caplog.text
+        assert "group(s) are registered" not in caplog.text
+        assert "correctly assigned" not in caplog.text
+
     def test_update_group_entities(
         self,
         caplog: pytest.LogCaptureFixture,
@@ -606,11 +1050,357 @@ class TestPostgreSQLClient:
             client.update_user_entities(ldap_model_users_fixture)
             for output_line in (
                 "There are 1 user entit(y|ies) currently registered",
-                "... 1 user entit(y|ies) will be added",
-                "There are 2 valid user entit(y|ies)",
+                "... 1 user entit(y|ies) were added",
+                "... 0 unused user entit(y|ies) were removed",
             ):
                 assert output_line in caplog.text
 
+    def test_update_user_entities_batches(
+        self,
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+    ) -> None:
+        # A user whose entity has been removed is cleaned up
+        orphan = GuacamoleUser(user_id=3, entity_id=99, full_name="Titius")
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            [*postgresql_model_guacamoleuser_fixture, orphan],
+        )
+        mock_backend.query = mock.Mock(  # type: ignore[method-assign]
+            side_effect=AssertionError("whole table read"),
+        )
+        query_filtered = mock.Mock(wraps=mock_backend.query_filtered)
+        mock_backend.query_filtered = query_filtered  # type: ignore[method-assign]
+        with (
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+                return_value=mock_backend,
+            ),
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.LOOKUP_BATCH_SIZE",
+                1,
+            ),
+        ):
+            client = PostgreSQLClient(**self.client_kwargs)
+            assert client.update_user_entities(ldap_model_users_fixture) == 1
+
+        # Entities and users are looked up one batch at a time
+        assert query_filtered.call_count == 4  # noqa: PLR2004
+        assert orphan not in mock_backend.contents[GuacamoleUser]
+
+    def test_update_user_entities_changed_details(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+    ) -> None:
+        # Give one user details in LDAP which differ from PostgreSQL
+        ldap_model_users_fixture[1] = dataclasses.replace(
+            ldap_model_users_fixture[1],
+            display_name="Numerius Negidius Junior",
+            email_address="numerius.negidius@rome.la",
+        )
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+        )
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(**self.client_kwargs)
+            assert client.update_user_entities(ldap_model_users_fixture) == 1
+            assert "... 0 user entit(y|ies) were added" in caplog.text
+            assert "... 1 user entit(y|ies) were updated" in caplog.text
+
+        # Only the changed user is updated
+        unchanged, changed = postgresql_model_guacamoleuser_fixture
+        assert unchanged.full_name == "Aulus Agerius"
+        assert changed.full_name == "Numerius Negidius Junior"
+        assert changed.email_address == "numerius.negidius@rome.la"
+        assert changed.organization is None
+
+    def test_update_user_attributes(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+    ) -> None:
+        ldap_model_users_fixture[0] = dataclasses.replace(
+            ldap_model_users_fixture[0],
+            attributes={"cost-centre": "", "department": "Law"},
+        )
+        ldap_model_users_fixture[1] = dataclasses.replace(
+            ldap_model_users_fixture[1],
+            attributes={"cost-centre": "42", "department": "Law"},
+        )
+        unmanaged = GuacamoleUserAttribute(
+            user_id=1,
+            attribute_name="timezone",
+            attribute_value="Europe/Rome",
+        )
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+            [
+                unmanaged,
+                GuacamoleUserAttribute(
+                    user_id=1,
+                    attribute_name="cost-centre",
+                    attribute_value="7",
+                ),
+                GuacamoleUserAttribute(
+                    user_id=1,
+                    attribute_name="department",
+                    attribute_value="Law",
+                ),
+                GuacamoleUserAttribute(
+                    user_id=2,
+                    attribute_name="department",
+                    attribute_value="History",
+                ),
+            ],
+        )
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(**self.client_kwargs)
+            n_changes = client.update_user_attributes(ldap_model_users_fixture)
+
+        # One stale value, one changed value and one new value
+        assert n_changes == 4  # noqa: PLR2004
+        assert "... 2 attribute(s) will be removed and 2 added" in caplog.text
+        attributes = cast(
+            list[GuacamoleUserAttribute],
+            mock_backend.query(GuacamoleUserAttribute),
+        )
+        assert unmanaged in attributes
+        assert {
+            (item.user_id, item.attribute_name, item.attribute_value)
+            for item in attributes
+        } == {
+            (1, "department", "Law"),
+            (1, "timezone", "Europe/Rome"),
+            (2, "cost-centre", "42"),
+            (2, "department", "Law"),
+        }
+
+    def test_update_user_attributes_unmapped(
+        self,
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend()
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+            client = PostgreSQLClient(**self.client_kwargs)
+            with mock.patch.object(mock_backend, "query") as mock_query:
+                assert client.update_user_attributes(ldap_model_users_fixture) == 0
+            mock_query.assert_not_called()
+
+    def test_update_group_attributes(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+    ) -> None:
+        ldap_model_groups_fixture[0] = dataclasses.replace(
+            ldap_model_groups_fixture[0],
+            attributes={"department": "Law"},
+        )
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            postgresql_model_guacamoleusergroup_fixture,
+        )
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(**self.client_kwargs)
+            assert client.update_group_attributes(ldap_model_groups_fixture) == 1
+        (attribute,) = cast(
+            list[GuacamoleUserGroupAttribute],
+            mock_backend.query(GuacamoleUserGroupAttribute),
+        )
+        assert attribute.user_group_id == 11  # noqa: PLR2004
+        assert attribute.attribute_value == "Law"
+
+    def test_update_permissions(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+    ) -> None:
+        ldap_model_users_fixture[1] = dataclasses.replace(
+            ldap_model_users_fixture[1],
+            attributes={"department": "Law"},
+        )
+        read = GuacamoleObjectPermissionType.READ
+        # Permissions for an administrator and on an unmanaged connection are kept
+        unmanaged = [
+            GuacamoleConnectionPermission(
+                entity_id=99,
+                connection_id=1,
+                permission=read,
+            ),
+            GuacamoleConnectionPermission(
+                entity_id=1,
+                connection_id=3,
+                permission=read,
+            ),
+        ]
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            [
+                GuacamoleConnection(connection_id=1, connection_name="forum"),
+                GuacamoleConnection(connection_id=2, connection_name="forum"),
+                GuacamoleConnection(connection_id=3, connection_name="circus"),
+            ],
+            [
+                GuacamoleConnectionGroup(
+                    connection_group_id=7,
+                    connection_group_name="basilica",
+                ),
+            ],
+            [
+                *unmanaged,
+                GuacamoleConnectionPermission(
+                    entity_id=3,
+                    connection_id=1,
+                    permission=read,
+                ),
+                GuacamoleConnectionPermission(
+                    entity_id=1,
+                    connection_id=1,
+                    permission=read,
+                ),
+            ],
+        )
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(
+                **self.client_kwargs,
+                permission_rules=[
+                    PermissionRule(connection="forum", group="plaintiffs"),
+                    PermissionRule(
+                        attribute="department",
+                        connection_group="basilica",
+                        permissions=("ADMINISTER", "READ"),
+                        value="Law",
+                    ),
+                    PermissionRule(connection="theatre", group="everyone"),
+                ],
+            )
+            n_changes = client.update_permissions(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+
+        # One revoked and three granted permissions
+        assert n_changes == 4  # noqa: PLR2004
+        assert (
+            "... 1 guacamole_connection_permission(s) will be revoked and 1 granted"
+            in caplog.text
+        )
+        assert "Could not find connection 'theatre' for permission rule." in caplog.text
+        connection_permissions = cast(
+            list[GuacamoleConnectionPermission],
+            mock_backend.query(GuacamoleConnectionPermission),
+        )
+        assert all(item in connection_permissions for item in unmanaged)
+        assert {
+            (item.entity_id, item.connection_id) for item in connection_permissions
+        } == {(99, 1), (1, 3), (3, 1), (3, 2)}
+        assert {
+            (item.entity_id, item.connection_group_id, item.permission.value)
+            for item in cast(
+                list[GuacamoleConnectionGroupPermission],
+                mock_backend.query(GuacamoleConnectionGroupPermission),
+            )
+        } == {(5, 7, "ADMINISTER"), (5, 7, "READ")}
+
+    def test_update_permissions_without_rules(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend()
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+            client = PostgreSQLClient(**self.client_kwargs)
+            with mock.patch.object(mock_backend, "query") as mock_query:
+                assert (
+                    client.update_permissions(
+                        ldap_model_groups_fixture,
+                        ldap_model_users_fixture,
+                    )
+                    == 0
+                )
+            mock_query.assert_not_called()
+
+    def test_update_users_sorted(
+        self,
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend()
+        names = sorted(user.name for user in ldap_model_users_fixture)
+        with (
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+                return_value=mock_backend,
+            ),
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.merge_join",
+                wraps=merge_join,
+            ) as mock_merge_join,
+        ):
+            client = PostgreSQLClient(**self.client_kwargs)
+            # Names that are already sorted are merged without being copied
+            assert client.entity_diff(names, GuacamoleEntityType.USER).to_add == names
+            assert mock_merge_join.call_args.args[0] is names
+            # Other names are sorted and de-duplicated first
+            diff = client.entity_diff(
+                [*names[::-1], names[0]],
+                GuacamoleEntityType.USER,
+            )
+            assert diff.to_add == names
+
+    def test_update_users_out_of_order(
+        self,
+        ldap_model_users_fixture: list[LDAPUser],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend()
+        mock_backend.stream_sorted = (  # type: ignore[method-assign]
+            lambda *_: iter(["numerius.negidius@rome.la", "aulus.agerius@rome.la"])
+        )
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+            client = PostgreSQLClient(**self.client_kwargs)
+            with pytest.raises(
+                PostgreSQLError,
+                match="Unable to compare LDAP names with PostgreSQL entities.",
+            ):
+                client.update_users(ldap_model_users_fixture)
+
     def test_update_users(
         self,
         caplog: pytest.LogCaptureFixture,
@@ -647,3 +1437,648 @@ class TestPostgreSQLClient:
                 "... 1 user(s) will be removed",
             ):
                 assert output_line in caplog.text
+
+    def test_update_users_disable_missing(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+        )
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+            client = PostgreSQLClient(
+                **self.client_kwargs,
+                retention_options=PostgreSQLRetentionOptions(
+                    disable_missing_users=True,
+                ),
+            )
+            # Numerius Negidius has left LDAP
+            assert client.update_users(ldap_model_users_fixture[0:1]) == 1
+            assert "... 1 user(s) will be disabled" in caplog.text
+            assert len(mock_backend.query(GuacamoleEntity)) == 2  # noqa: PLR2004
+            users = cast(list[GuacamoleUser], mock_backend.query(GuacamoleUser))
+            assert [user.disabled for user in users] == [None, True]
+            (attribute,) = cast(
+                list[GuacamoleUserAttribute],
+                mock_backend.query(GuacamoleUserAttribute),
+            )
+            assert attribute.user_id == 2  # noqa: PLR2004
+            assert attribute.attribute_name == DISABLED_AT_ATTRIBUTE
+            # Nothing changes while he stays away
+            assert client.update_users(ldap_model_users_fixture[0:1]) == 0
+            # He is re-enabled when he comes back
+            assert client.update_users(ldap_model_users_fixture) == 1
+            assert "... 1 user(s) will be re-enabled" in caplog.text
+            assert not users[1].disabled
+            assert not mock_backend.query(GuacamoleUserAttribute)
+
+    def test_purge_disabled_users(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+    ) -> None:
+        for user in postgresql_model_guacamoleuser_fixture:
+            user.disabled = True
+        now = datetime.now(tz=UTC)
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+            [
+                GuacamoleUserAttribute(
+                    user_id=user_id,
+                    attribute_name=DISABLED_AT_ATTRIBUTE,
+                    attribute_value=(now - timedelta(days=days)).isoformat(),
+                )
+                for user_id, days in ((1, 31), (2, 1))
+            ],
+        )
+        caplog.set_level(logging.DEBUG)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+            client = PostgreSQLClient(
+                **self.client_kwargs,
+                retention_options=PostgreSQLRetentionOptions(
+                    grace_period=timedelta(days=30),
+                ),
+            )
+            assert client.purge_disabled_users() == 1
+        entities = cast(list[GuacamoleEntity], mock_backend.query(GuacamoleEntity))
+        assert [entity.entity_id for entity in entities] == [5]
+        assert "Purging 1 user(s) disabled before" in caplog.text
+
+    def test_purge_disabled_users_batches(
+        self,
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+    ) -> None:
+        for user in postgresql_model_guacamoleuser_fixture:
+            user.disabled = True
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+            [
+                GuacamoleUserAttribute(
+                    user_id=user_id,
+                    attribute_name=DISABLED_AT_ATTRIBUTE,
+                    attribute_value=datetime(2000, 1, 1, tzinfo=UTC).isoformat(),
+                )
+                for user_id in (1, 2)
+            ],
+        )
+        with (
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+                return_value=mock_backend,
+            ),
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.time.sleep",
+            ) as mock_sleep,
+        ):
+            client = PostgreSQLClient(
+                **self.client_kwargs,
+                retention_options=PostgreSQLRetentionOptions(
+                    purge_batch_size=1,
+                    purge_pause=0.5,
+                ),
+            )
+            assert client.purge_disabled_users() == 2  # noqa: PLR2004
+        mock_sleep.assert_called_once_with(0.5)
+        assert not mock_backend.query(GuacamoleEntity)
+
+    def test_purge_disabled_users_invalid_time(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        postgresql_model_guacamoleentity_user_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleuser_fixture: list[GuacamoleUser],
+    ) -> None:
+        for user in postgresql_model_guacamoleuser_fixture:
+            user.disabled = True
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_user_fixture,
+            postgresql_model_guacamoleuser_fixture,
+            [
+                GuacamoleUserAttribute(
+                    user_id=user_id,
+                    attribute_name=DISABLED_AT_ATTRIBUTE,
+                    attribute_value=value,
+                )
+                # A malformed time and a time without a timezone
+                for user_id, value in ((1, "yesterday"), (2, "2000-01-01T00:00:00"))
+            ],
+        )
+        caplog.set_level(logging.WARNING)
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+            return_value=mock_backend,
+        ):
+            client = PostgreSQLClient(**self.client_kwargs)
+            assert client.purge_disabled_users() == 0
+        assert len(mock_backend.query(GuacamoleEntity)) == 2  # noqa: PLR2004
+        assert (
+            "Ignoring invalid disabled-at time 'yesterday' for user "
+            "'aulus.agerius@rome.la'." in caplog.text
+        )
+        assert (
+            "Ignoring invalid disabled-at time '2000-01-01T00:00:00' for user "
+            "'numerius.negidius@rome.la'." in caplog.text
+        )
+
+    def test_plan(self) -> None:
+        mock_backend = MockPostgreSQLBackend()
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+            return_value=mock_backend,
+        ):
+            client = PostgreSQLClient(**self.client_kwargs)
+            with client.plan() as write_plan:
+                assert mock_backend.plan is write_plan
+                assert write_plan.write_options is mock_backend.write_options
+        assert mock_backend.plan is None
+
+    def test_assign_users_to_groups_partial(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+    ) -> None:
+        # Create a mock backend with one missing and one stale assignment
+        unchanged = GuacamoleUserGroupMember(user_group_id=11, member_entity_id=5)
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            postgresql_model_guacamoleusergroup_fixture,
+            [
+                unchanged,
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=5),
+            ],
+        )
+
+        # Capture logs at debug level and above
+        caplog.set_level(logging.DEBUG)
+
+        # Patch PostgreSQLBackend
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(**self.client_kwargs)
+            n_changes = client.assign_users_to_groups(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+            assert n_changes == 2  # noqa: PLR2004
+            assert "... creating 1 user/group assignments." in caplog.text
+            assert "... removing 1 user/group assignments." in caplog.text
+
+        # Assignments that were already correct are left in place
+        members = cast(
+            list[GuacamoleUserGroupMember],
+            mock_backend.query(GuacamoleUserGroupMember),
+        )
+        assert unchanged in members
+        assert {(item.user_group_id, item.member_entity_id) for item in members} == {
+            (11, 5),
+            (12, 4),
+            (12, 5),
+            (13, 4),
+        }
+
+    def test_assign_users_to_groups_lookups(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+    ) -> None:
+        # An assignment to a group that is not being synchronised
+        unrelated = GuacamoleUserGroupMember(user_group_id=99, member_entity_id=4)
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            postgresql_model_guacamoleusergroup_fixture,
+            [unrelated],
+        )
+        with (
+            mock.patch(
+                "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+                return_value=mock_backend,
+            ),
+            mock.patch.object(mock_backend, "query") as mock_query,
+            mock.patch.object(
+                mock_backend,
+                "query_filtered",
+                wraps=mock_backend.query_filtered,
+            ) as mock_query_filtered,
+        ):
+            client = PostgreSQLClient(**self.client_kwargs)
+            n_changes = client.assign_users_to_groups(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+            assert n_changes == 4  # noqa: PLR2004
+        # Groups, user groups, users and assignments are each read with one query
+        mock_query.assert_not_called()
+        assert [call.args[0] for call in mock_query_filtered.call_args_list] == [
+            GuacamoleEntity,
+            GuacamoleUserGroup,
+            GuacamoleEntity,
+            GuacamoleUserGroupMember,
+        ]
+        assert unrelated in mock_backend.query(GuacamoleUserGroupMember)
+
+    def test_assign_users_to_groups_session(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        sqlite_session_fixture: Session,
+    ) -> None:
+        # Groups 11 and 12 start with several members each, one of them stale
+        sqlite_session_fixture.add_all(
+            GuacamoleUserGroupMember(user_group_id=group_id, member_entity_id=entity_id)
+            for group_id, entity_id in [(11, 4), (11, 5), (12, 4), (12, 5)]
+        )
+        sqlite_session_fixture.commit()
+        client = PostgreSQLClient(
+            **self.client_kwargs,
+            write_options=PostgreSQLWriteOptions(lock_timeout=None),
+        ).bind(sqlite_session_fixture)
+
+        # Existing members are not inserted again
+        n_changes = client.assign_users_to_groups(
+            ldap_model_groups_fixture,
+            ldap_model_users_fixture,
+        )
+        assert n_changes == 2  # noqa: PLR2004
+        members = sqlite_session_fixture.query(GuacamoleUserGroupMember).all()
+        assert {(item.user_group_id, item.member_entity_id) for item in members} == {
+            (11, 5),
+            (12, 4),
+            (12, 5),
+            (13, 4),
+        }
+
+    def test_assign_users_to_groups_events(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            postgresql_model_guacamoleusergroup_fixture,
+            [
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=5),
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=5),
+            ],
+        )
+        event_emitter = mock.MagicMock()
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+            return_value=mock_backend,
+        ):
+            client = PostgreSQLClient(
+                **self.client_kwargs,
+                event_emitter=event_emitter,
+                tenant_name="senate",
+            )
+            client.assign_users_to_groups(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+
+        # Each applied change is reported by user and group name
+        added, removed = (
+            list(call.args[0]) for call in event_emitter.emit.call_args_list
+        )
+        assert [(e.action, e.name, e.group, e.tenant) for e in added + removed] == [
+            ("added", "aulus.agerius@rome.la", "plaintiffs", "senate"),
+            ("removed", "aulus.agerius@rome.la", "defendants", "senate"),
+        ]
+        assert {event.entity_type for event in added + removed} == {"membership"}
+
+    def test_update_groups_events(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+    ) -> None:
+        mock_backend = MockPostgreSQLBackend(
+            [
+                GuacamoleEntity(
+                    entity_id=99,
+                    name="to-be-deleted",
+                    type=GuacamoleEntityType.USER_GROUP,
+                ),
+            ],
+        )
+        event_emitter = mock.MagicMock()
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+            return_value=mock_backend,
+        ):
+            client = PostgreSQLClient(**self.client_kwargs, event_emitter=event_emitter)
+            client.update_groups(ldap_model_groups_fixture)
+            # Nothing is reported while only planning
+            with client.plan():
+                client.update_groups([])
+
+        events = [
+            (event.entity_type, event.action, event.name)
+            for call in event_emitter.emit.call_args_list
+            for event in call.args[0]
+        ]
+        assert events == [
+            ("group", "added", "defendants"),
+            ("group", "added", "everyone"),
+            ("group", "added", "plaintiffs"),
+            ("group", "removed", "to-be-deleted"),
+        ]
+
+    def test_assign_users_to_groups_unchanged(
+        self,
+        caplog: pytest.LogCaptureFixture,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        postgresql_model_guacamoleentity_fixture: list[GuacamoleEntity],
+        postgresql_model_guacamoleusergroup_fixture: list[GuacamoleUserGroup],
+    ) -> None:
+        # Create a mock backend with the expected assignments
+        mock_backend = MockPostgreSQLBackend(
+            postgresql_model_guacamoleentity_fixture,
+            postgresql_model_guacamoleusergroup_fixture,
+            [
+                GuacamoleUserGroupMember(user_group_id=11, member_entity_id=5),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=4),
+                GuacamoleUserGroupMember(user_group_id=12, member_entity_id=5),
+                GuacamoleUserGroupMember(user_group_id=13, member_entity_id=4),
+            ],
+        )
+
+        # Capture logs at debug level and above
+        caplog.set_level(logging.DEBUG)
+
+        # Patch PostgreSQLBackend
+        with mock.patch(
+            "guacamole_user_sync.postgresql.postgresql_client.PostgreSQLBackend",
+        ) as mock_postgresql_backend:
+            mock_postgresql_backend.return_value = mock_backend
+
+            client = PostgreSQLClient(**self.client_kwargs)
+            n_changes = client.assign_users_to_groups(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+            assert n_changes == 0
+            assert "... user/group assignments are already up to date." in caplog.text
+
+    def test_assign_users_to_groups_unchanged_session(
+        self,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        sqlite_session_fixture: Session,
+    ) -> None:
+        # Group 12 has several members, all of which are already correct
+        sqlite_session_fixture.add_all(
+            GuacamoleUserGroupMember(user_group_id=group_id, member_entity_id=entity_id)
+            for group_id, entity_id in [(11, 5), (12, 4), (12, 5), (13, 4)]
+        )
+        sqlite_session_fixture.commit()
+        client = PostgreSQLClient(**self.client_kwargs).bind(sqlite_session_fixture)
+        assert (
+            client.assign_users_to_groups(
+                ldap_model_groups_fixture,
+                ldap_model_users_fixture,
+            )
+            == 0
+        )
+
+
+class TestPostgreSQLWriteScheduler:
+    """Test PostgreSQLWriteScheduler."""
+
+    def test_chunks(self) -> None:
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(chunk_size=4, target_commit_latency=1),
+            clock=lambda: 0,
+        )
+        chunks: list[list[int]] = []
+
+        def write(chunk: Any) -> int:  # noqa: ANN401
+            chunks.append(list(chunk))
+            return len(chunk)
+
+        # Commits that take half the target latency leave the size unchanged
+        with mock.patch.object(scheduler, "adapt") as mock_adapt:
+            assert scheduler.run(list(range(10)), write) == 10  # noqa: PLR2004
+        assert chunks == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+        assert mock_adapt.call_count == 3  # noqa: PLR2004
+
+    def test_unchunked(self) -> None:
+        scheduler = PostgreSQLWriteScheduler(PostgreSQLWriteOptions(chunk_size=None))
+        write = mock.Mock(return_value=0)
+        scheduler.run([], write)
+        write.assert_called_once_with([])
+
+    def test_adapt(self) -> None:
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(
+                chunk_size=100,
+                max_chunk_size=300,
+                min_chunk_size=40,
+                target_commit_latency=1,
+            ),
+        )
+        scheduler.adapt(0.75)
+        assert scheduler.chunk_size == 100  # noqa: PLR2004
+        scheduler.adapt(2)
+        assert scheduler.chunk_size == 50  # noqa: PLR2004
+        scheduler.adapt(2)
+        assert scheduler.chunk_size == 40  # noqa: PLR2004
+        for _ in range(4):
+            scheduler.adapt(0.1)
+        assert scheduler.chunk_size == 300  # noqa: PLR2004
+
+    def test_adapt_during_run(self) -> None:
+        # Each commit appears to take two seconds
+        times = iter(range(0, 100, 2))
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(chunk_size=8, min_chunk_size=2),
+            clock=lambda: next(times),
+        )
+        sizes: list[int] = []
+
+        def write(chunk: Any) -> int:  # noqa: ANN401
+            sizes.append(len(chunk))
+            return len(chunk)
+
+        scheduler.run(list(range(16)), write)
+        assert sizes == [8, 4, 2, 2]
+
+    def test_lock_timeout_retry(self, caplog: pytest.LogCaptureFixture) -> None:
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(chunk_size=4, min_chunk_size=1),
+            clock=lambda: 0,
+        )
+        lock_timeout = OperationalError(
+            "UPDATE",
+            {},
+            psycopg.errors.LockNotAvailable(),
+        )
+        write = mock.Mock(side_effect=[lock_timeout, 2, 2])
+        caplog.set_level(logging.WARNING)
+        with mock.patch.object(scheduler, "adapt"):
+            assert scheduler.run([1, 2, 3, 4], write) == 4  # noqa: PLR2004
+        assert [call.args[0] for call in write.call_args_list] == [
+            [1, 2, 3, 4],
+            [1, 2],
+            [3, 4],
+        ]
+        assert "retrying with 2 rows" in caplog.text
+
+    def test_lock_timeout_gives_up(self) -> None:
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(chunk_size=4, max_retries=1),
+            clock=lambda: 0,
+        )
+        lock_timeout = OperationalError(
+            "UPDATE",
+            {},
+            psycopg.errors.LockNotAvailable(),
+        )
+        write = mock.Mock(side_effect=lock_timeout)
+        with pytest.raises(OperationalError):
+            scheduler.run([1, 2, 3, 4], write)
+        assert write.call_count == 2  # noqa: PLR2004
+
+    def test_other_errors_are_not_retried(self) -> None:
+        scheduler = PostgreSQLWriteScheduler(PostgreSQLWriteOptions(chunk_size=4))
+        write = mock.Mock(side_effect=OperationalError("UPDATE", {}, Exception()))
+        with pytest.raises(OperationalError):
+            scheduler.run([1, 2], write)
+        write.assert_called_once()
+
+    def test_throttle(self) -> None:
+        sleep = mock.Mock()
+        scheduler = PostgreSQLWriteScheduler(
+            PostgreSQLWriteOptions(chunk_size=1, min_chunk_interval=5),
+            clock=lambda: 10,
+            sleep=sleep,
+        )
+        scheduler.run([1, 2], mock.Mock(return_value=1))
+        sleep.assert_called_once_with(5)
+
+
+class TestWritePlan:
+    """Test WritePlan."""
+
+    def test_record(self) -> None:
+        write_plan = WritePlan(
+            PostgreSQLWriteOptions(
+                chunk_size=2,
+                lock_timeout=None,
+                min_chunk_interval=1,
+                target_commit_latency=0.5,
+            ),
+        )
+        rows = [{"entity_id": n, "name": "aulus"} for n in range(3)]
+        assert write_plan.record("add", "guacamole_entity", rows) == len(rows)
+        assert write_plan.record("remove", "guacamole_entity", []) == 0
+
+        # Three rows need two chunks, each committed separately
+        assert write_plan.n_transactions == 2  # noqa: PLR2004
+        assert write_plan.n_statements == 2  # noqa: PLR2004
+        assert write_plan.n_bytes == 3 * (24 + 8 + 5)
+        assert write_plan.estimated_seconds == 2  # noqa: PLR2004
+
+    def test_record_with_lock_timeout(self) -> None:
+        write_plan = WritePlan(PostgreSQLWriteOptions(chunk_size=None))
+        write_plan.record(
+            "update",
+            "guacamole_user",
+            [{"user_id": 1}, {"user_id": 2}],
+            statements_per_chunk=2,
+        )
+        assert write_plan.n_transactions == 1
+        assert write_plan.n_statements == 3  # noqa: PLR2004
+
+    def test_write_jsonl(self) -> None:
+        write_plan = WritePlan(PostgreSQLWriteOptions())
+        write_plan.record("add", "guacamole_entity", [{"name": "aulus"}])
+        write_plan.record(
+            "remove",
+            "guacamole_user_group_member",
+            [{"user_group_id": 1}],
+        )
+        write_plan.record(
+            "add",
+            "guacamole_user",
+            [{"entity_id": 1, "password_hash": b"hash", "password_salt": b"salt"}],
+        )
+        output = io.StringIO()
+        write_plan.write_jsonl(output, tenant="default")
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert lines[0] == {
+            "tenant": "default",
+            "action": "add",
+            "table": "guacamole_entity",
+            "row": {"name": "aulus"},
+        }
+        # Random password hashes and salts are not written
+        assert lines[2]["row"] == {"entity_id": 1}
+        assert lines[3]["summary"]["rows"] == {
+            "guacamole_entity.add": 1,
+            "guacamole_user.add": 1,
+            "guacamole_user_group_member.remove": 1,
+        }
+        assert lines[3]["summary"]["transactions"] == 3  # noqa: PLR2004
+
+
+class TestMergeJoin:
+    """Test merge_join."""
+
+    def test_merge_join(self) -> None:
+        diff = merge_join(
+            ["aulus", "gaius", "numerius", "titius"],
+            iter(["gaius", "lucius", "numerius", "sempronius"]),
+        )
+        assert diff.to_add == ["aulus", "titius"]
+        assert diff.to_remove == ["lucius", "sempronius"]
+        assert diff.n_current == 4  # noqa: PLR2004
+
+    def test_merge_join_empty(self) -> None:
+        assert merge_join([], ["aulus"]).to_remove == ["aulus"]
+        assert merge_join(["aulus"], []).to_add == ["aulus"]
+        assert merge_join([], []).n_current == 0
+
+    def test_merge_join_is_code_point_order(self) -> None:
+        # Upper case letters sort before lower case ones, as in the "C" collation
+        diff = merge_join(["Titius", "aulus"], ["Titius", "aulus"])
+        assert not diff.to_add
+        assert not diff.to_remove
+
+    def test_is_increasing(self) -> None:
+        assert is_increasing([])
+        assert is_increasing(["Titius", "aulus", "gaius"])
+        assert not is_increasing(["aulus", "Titius"])
+        assert not is_increasing(["aulus", "aulus"])
+
+    def test_merge_join_out_of_order(self) -> None:
+        with pytest.raises(ValueError, match="Current names are not in increasing"):
+            merge_join(["aulus"], ["titius", "aulus"])
+        with pytest.raises(ValueError, match="Desired names are not in increasing"):
+            merge_join(["aulus", "aulus"], [])
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import pstats
+import signal
+import socket
+import threading
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from guacamole_user_sync.models import SyncPhase
+from guacamole_user_sync.scheduling import (
+    CycleProfiler,
+    SyncOutcome,
+    SyncPhaseTracker,
+    SyncScheduler,
+    SyncTrigger,
+)
+
+
+class MockClock:
+    """Mock monotonic clock which advances only when asked to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class TestCycleProfiler:
+    """Test CycleProfiler."""
+
+    @staticmethod
+    def synchronise(**kwargs: int) -> SyncOutcome:
+        _ = [str(n) for n in range(kwargs["n"])]
+        return SyncOutcome.CHANGED
+
+    def test_armed_cycles(self, tmp_path: Path) -> None:
+        profiler = CycleProfiler(tmp_path, cycles=1, top_allocations=3)
+        synchronise = profiler.wrap(self.synchronise)
+        assert synchronise(n=1000) == SyncOutcome.CHANGED
+        assert synchronise(n=1000) == SyncOutcome.CHANGED
+
+        # Only the armed cycle is profiled
+        (stats_path,) = tmp_path.glob("*.prof")
+        (allocations_path,) = tmp_path.glob("*-allocations.txt")
+        stats = pstats.Stats(str(stats_path))
+        assert any(
+            function == "synchronise"
+            for _, _, function in stats.stats  # type: ignore[attr-defined]
+        )
+        allocations = allocations_path.read_text(encoding="utf-8").splitlines()
+        assert 0 < len(allocations) <= 3  # noqa: PLR2004
+
+    def test_sample_rate(self, tmp_path: Path) -> None:
+        samples = iter([0.5, 0.01])
+        profiler = CycleProfiler(
+            tmp_path,
+            sample_rate=0.1,
+            uniform=lambda: next(samples),
+        )
+        assert not profiler.selected()
+        assert profiler.selected()
+        # Only one synchronisation is profiled at a time
+        profiler.arm(1)
+        assert not profiler.selected()
+
+    def test_coroutine(self, tmp_path: Path) -> None:
+        async def synchronise() -> SyncOutcome:
+            await asyncio.sleep(0)
+            return SyncOutcome.UNCHANGED
+
+        profiler = CycleProfiler(tmp_path, cycles=1)
+        wrapped = profiler.wrap(synchronise)
+        assert asyncio.iscoroutinefunction(wrapped)
+        assert asyncio.run(wrapped()) == SyncOutcome.UNCHANGED
+        assert len(list(tmp_path.glob("*.prof"))) == 1
+
+    def test_handle_signals(self, tmp_path: Path) -> None:
+        profiler = CycleProfiler(tmp_path)
+        previous = signal.getsignal(signal.SIGUSR2)
+        try:
+            profiler.handle_signals(2)
+            os.kill(os.getpid(), signal.SIGUSR2)
+            for _ in range(100):
+                if profiler.remaining:
+                    break
+                threading.Event().wait(0.01)
+            assert profiler.remaining == 2  # noqa: PLR2004
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+    def test_write_failure(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.WARNING)
+        profiler = CycleProfiler(Path("/dev/null/profiles"), cycles=1)
+        assert profiler.wrap(self.synchronise)(n=1) == SyncOutcome.CHANGED
+        assert "Unable to write profile to /dev/null/profiles." in caplog.text
+        # A failed profile does not stop later ones
+        profiler.arm(1)
+        assert profiler.selected()
+
+
+class TestSyncPhaseTracker:
+    """Test SyncPhaseTracker."""
+
+    def test_due(self) -> None:
+        tracker = SyncPhaseTracker(
+            {
+                SyncPhase.GROUPS: 86400,
+                SyncPhase.MEMBERSHIPS: 3600,
+                SyncPhase.USERS: 7200,
+            },
+        )
+        assert tracker.due(0) == {
+            SyncPhase.GROUPS,
+            SyncPhase.MEMBERSHIPS,
+            SyncPhase.USERS,
+        }
+        tracker.completed(tracker.due(0), 0)
+        assert tracker.due(3599) == set()
+        assert tracker.due(3600) == {SyncPhase.MEMBERSHIPS}
+        tracker.completed({SyncPhase.MEMBERSHIPS}, 3600)
+        assert tracker.due(7200) == {SyncPhase.MEMBERSHIPS, SyncPhase.USERS}
+
+    def test_due_tolerance(self) -> None:
+        tracker = SyncPhaseTracker({SyncPhase.USERS: 300}, tolerance=150)
+        tracker.completed({SyncPhase.USERS}, 0)
+        assert tracker.due(149) == set()
+        assert tracker.due(280) == {SyncPhase.USERS}
+
+    def test_due_forced(self) -> None:
+        tracker = SyncPhaseTracker(
+            {SyncPhase.PURGE: 3600, SyncPhase.USERS: 300},
+            tolerance=150,
+        )
+        tracker.completed({SyncPhase.PURGE, SyncPhase.USERS}, 0)
+        assert tracker.due(20) == set()
+        # Purging stays on its own schedule
+        assert tracker.due(20, forced=True) == {SyncPhase.USERS}
+
+
+class TestSyncScheduler:
+    """Test SyncScheduler."""
+
+    def test_next_start_fixed_rate(self) -> None:
+        scheduler = SyncScheduler(100, jitter=0)
+        next_start = scheduler.next_start(SyncOutcome.UNCHANGED, 0, 30)
+        assert next_start == 100  # noqa: PLR2004
+        assert scheduler.missed_deadlines == 0
+
+    def test_next_start_missed_deadlines(
+        self,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        scheduler = SyncScheduler(100, jitter=0)
+        next_start = scheduler.next_start(SyncOutcome.UNCHANGED, 0, 250)
+        assert next_start == 300  # noqa: PLR2004
+        assert scheduler.missed_deadlines == 2  # noqa: PLR2004
+        assert (
+            "Synchronisation took 250.0 seconds, missing 2 deadline(s)." in caplog.text
+        )
+
+    def test_next_start_active_interval(self) -> None:
+        scheduler = SyncScheduler(100, active_interval=20, jitter=0)
+        assert scheduler.next_start(SyncOutcome.CHANGED, 0, 5) == 20  # noqa: PLR2004
+        next_start = scheduler.next_start(SyncOutcome.UNCHANGED, 20, 25)
+        assert next_start == 120  # noqa: PLR2004
+
+    def test_next_start_standby_interval(self) -> None:
+        scheduler = SyncScheduler(100, jitter=0, standby_interval=10)
+        next_start = scheduler.next_start(SyncOutcome.SKIPPED, 0, 1)
+        assert next_start == 10  # noqa: PLR2004
+
+    def test_next_start_backoff(self) -> None:
+        scheduler = SyncScheduler(
+            100,
+            jitter=0,
+            max_retry_interval=100,
+            retry_interval=30,
+        )
+        delays = [
+            scheduler.next_start(SyncOutcome.FAILED, 0, 10) - 10 for _ in range(4)
+        ]
+        assert delays == [30, 60, 100, 100]
+        assert scheduler.failures == 4  # noqa: PLR2004
+        scheduler.next_start(SyncOutcome.UNCHANGED, 0, 10)
+        assert scheduler.failures == 0
+
+    def test_next_start_jitter(self) -> None:
+        scheduler = SyncScheduler(100, jitter=0.1)
+        for _ in range(20):
+            next_start = scheduler.next_start(SyncOutcome.UNCHANGED, 0, 1)
+            assert 90 <= next_start <= 110  # noqa: PLR2004
+
+    def test_run(self) -> None:
+        calls: list[bool] = []
+        clock = MockClock()
+        outcomes = iter(
+            [
+                SyncOutcome.CHANGED,
+                SyncOutcome.UNCHANGED,
+                SyncOutcome.FAILED,
+                SyncOutcome.CHANGED,
+            ],
+        )
+
+        def cycle(*, forced: bool) -> SyncOutcome:
+            clock.now += 10
+            calls.append(forced)
+            return next(outcomes)
+
+        scheduler = SyncScheduler(
+            100,
+            active_interval=50,
+            clock=clock,
+            jitter=0,
+            retry_interval=5,
+            sleep=clock.sleep,
+        )
+        scheduler.run(cycle, max_cycles=4)
+        assert clock.sleeps == [40, 90, 5]
+        # Only the cycle that follows a change sooner than usual is forced
+        assert calls == [False, True, False, False]
+
+
+class TestSyncTrigger:
+    """Test SyncTrigger."""
+
+    def test_wait_timeout(self) -> None:
+        trigger = SyncTrigger(coalesce_window=0)
+        assert not trigger.wait(0.01)
+
+    def test_wait_coalesces_requests(self) -> None:
+        trigger = SyncTrigger(coalesce_window=0.05)
+        trigger.request("test")
+        threading.Timer(0.01, trigger.request, args=("test",)).start()
+        assert trigger.wait(1)
+        assert not trigger.wait(0.01)
+
+    def test_handle_signals(self) -> None:
+        trigger = SyncTrigger(coalesce_window=0)
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            trigger.handle_signals([signal.SIGUSR1])
+            os.kill(os.getpid(), signal.SIGUSR1)
+            assert trigger.wait(1)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+    def test_serve_http(self) -> None:
+        trigger = SyncTrigger(coalesce_window=0)
+        port = trigger.serve_http(0)
+        try:
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/sync",
+                method="POST",
+            )
+            with urllib.request.urlopen(request) as response:  # noqa: S310
+                assert response.status == 202  # noqa: PLR2004
+            assert trigger.wait(1)
+        finally:
+            trigger.close()
+
+    def test_serve_unix_socket(self, tmp_path: Path) -> None:
+        trigger = SyncTrigger(coalesce_window=0)
+        socket_path = tmp_path / "sync.sock"
+        trigger.serve_unix_socket(socket_path)
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(str(socket_path))
+                assert client.recv(3) == b"ok\n"
+            assert trigger.wait(1)
+        finally:
+            trigger.close()
+
+    def test_scheduler_woken_early(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.INFO)
+        trigger = SyncTrigger(coalesce_window=0)
+        trigger.request("test")
+        calls: list[bool] = []
+
+        def cycle(*, forced: bool) -> SyncOutcome:
+            calls.append(forced)
+            return SyncOutcome.UNCHANGED
+
+        scheduler = SyncScheduler(3600, jitter=0, trigger=trigger)
+        scheduler.run(cycle, max_cycles=2)
+        assert "Starting synchronisation early." in caplog.text
+        assert calls == [False, True]
@@ -0,0 +1,278 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+from guacamole_user_sync.models import (
+    InternedArray,
+    InternTable,
+    LDAPError,
+    LDAPGroup,
+    LDAPQuery,
+    LDAPUser,
+)
+from guacamole_user_sync.sources import (
+    LDIFSource,
+    SnapshotRecorder,
+    SnapshotSource,
+    file_source,
+    parse_ldif,
+)
+from guacamole_user_sync.sources.ldap_filter import filter_matcher
+
+LDIF = """\
+version: 1
+
+# Groups
+dn: CN=plaintiffs,OU=groups,DC=rome,DC=la
+objectClass: posixGroup
+cn: plaintiffs
+memberUid: aulus.agerius
+
+dn: CN=defendants, OU=groups, DC=rome, DC=la
+objectclass: posixGroup
+cn: defendants
+memberuid: numerius.negidius
+
+dn: CN=senate,OU=other,DC=rome,DC=la
+objectClass: posixGroup
+cn: senate
+
+dn: CN=aulus.agerius,OU=users,DC=rome,DC=la
+objectClass: posixAccount
+userName: aulus.agerius@rome.la
+displayName:: QXVsdXMgQWdlcml1cw==
+description: A long description that
+  continues on the next line
+memberOf: CN=plaintiffs,OU=groups,DC=rome,DC=la
+uid: aulus.agerius
+
+dn: CN=numerius.negidius,OU=users,DC=rome,DC=la
+changetype: delete
+"""
+
+
+class TestLDIF:
+    """Test parse_ldif and LDIFSource."""
+
+    @pytest.fixture
+    def ldif_path(self, tmp_path: Path) -> Path:
+        path = tmp_path / "directory.ldif"
+        path.write_text(LDIF, encoding="utf-8")
+        return path
+
+    def test_parse_ldif(self) -> None:
+        entries = dict(parse_ldif(LDIF.splitlines(keepends=True)))
+        # Deletions are skipped and attribute names are lower case
+        assert len(entries) == 4  # noqa: PLR2004
+        user = entries["CN=aulus.agerius,OU=users,DC=rome,DC=la"]
+        assert user["displayname"] == [b"Aulus Agerius"]
+        assert user["description"] == [
+            b"A long description that continues on the next line",
+        ]
+
+    def test_parse_ldif_modify(self) -> None:
+        entries = dict(
+            parse_ldif(
+                [
+                    "dn: CN=plaintiffs,OU=groups,DC=rome,DC=la",
+                    "changetype: modify",
+                    "add: memberUid",
+                    "memberUid: titius",
+                    "-",
+                    "",
+                    "dn: CN=senate,OU=other,DC=rome,DC=la",
+                    "changetype: add",
+                    "cn: senate",
+                ],
+            ),
+        )
+        # Modifications are skipped without parsing their separator lines
+        assert entries == {"CN=senate,OU=other,DC=rome,DC=la": {"cn": [b"senate"]}}
+
+    def test_parse_ldif_invalid(self) -> None:
+        with pytest.raises(ValueError, match="Line 2 is not an 'attribute: value'"):
+            list(parse_ldif(["dn: CN=senate,DC=rome,DC=la", "cn senate"]))
+        with pytest.raises(ValueError, match="Line 1 is not part of an entry"):
+            list(parse_ldif(["cn: senate"]))
+        with pytest.raises(ValueError, match="refers to a URL"):
+            list(parse_ldif(["dn: CN=senate,DC=rome,DC=la", "jpegPhoto:< file:///a"]))
+
+    def test_search_groups(
+        self,
+        ldif_path: Path,
+        ldap_query_groups_fixture: LDAPQuery,
+    ) -> None:
+        groups = LDIFSource(ldif_path).search_groups(ldap_query_groups_fixture)
+        # Groups outside the base DN are excluded, ignoring case and spacing
+        assert groups == [
+            LDAPGroup(member_of=[], member_uid=["aulus.agerius"], name="plaintiffs"),
+            LDAPGroup(
+                member_of=[],
+                member_uid=["numerius.negidius"],
+                name="defendants",
+            ),
+        ]
+
+    def test_search_users(
+        self,
+        ldif_path: Path,
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        users = LDIFSource(ldif_path).search_users(ldap_query_users_fixture)
+        assert users == [
+            LDAPUser(
+                display_name="Aulus Agerius",
+                member_of=["CN=plaintiffs,OU=groups,DC=rome,DC=la"],
+                name="aulus.agerius@rome.la",
+                uid="aulus.agerius",
+            ),
+        ]
+
+    def test_search_missing_file(
+        self,
+        tmp_path: Path,
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        source = LDIFSource(tmp_path / "missing.ldif")
+        with pytest.raises(LDAPError, match="Unable to read LDIF file"):
+            source.search_users(ldap_query_users_fixture)
+
+
+class TestLDAPFilter:
+    """Test filter_matcher."""
+
+    @pytest.mark.parametrize(
+        ("search_filter", "expected"),
+        [
+            ("(objectClass=PosixAccount)", True),
+            ("(&(objectClass=posixAccount)(!(uid=aulus.agerius)))", False),
+            ("(|(uid=titius)(uid=aulus.*))", True),
+            ("(uid=*agerius)", True),
+            ("(uid=a*s*g*)", True),
+            ("(uid=a*x*)", False),
+            ("(mail=*)", False),
+            ("(uidNumber>=1000)", True),
+            ("(uidNumber<=999)", False),
+            ("(memberOf:1.2.840.113556.1.4.1941:=cn=plaintiffs)", True),
+            ("(uid=aulus\\2eagerius)", True),
+        ],
+    )
+    def test_filter_matcher(
+        self,
+        search_filter: str,
+        expected: bool,  # noqa: FBT001
+    ) -> None:
+        attributes = {
+            "memberof": [b"CN=plaintiffs"],
+            "objectclass": [b"posixAccount"],
+            "uid": [b"aulus.agerius"],
+            "uidnumber": [b"1000"],
+        }
+        assert filter_matcher(search_filter)(attributes) is expected
+
+    def test_filter_matcher_invalid(self) -> None:
+        with pytest.raises(LDAPError, match="Invalid LDAP filter"):
+            filter_matcher("(uid=aulus")
+
+
+class TestSnapshot:
+    """Test SnapshotRecorder and SnapshotSource."""
+
+    def test_round_trip(
+        self,
+        tmp_path: Path,
+        ldap_model_groups_fixture: list[LDAPGroup],
+        ldap_model_users_fixture: list[LDAPUser],
+        ldap_query_groups_fixture: LDAPQuery,
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        path = tmp_path / "snapshot.jsonl"
+        recorder = SnapshotRecorder(SnapshotSource(path), path)
+        recorder.groups = ldap_model_groups_fixture
+        recorder.users = ldap_model_users_fixture
+        recorder.save()
+
+        replay = file_source(path)
+        assert isinstance(replay, SnapshotSource)
+        assert replay.search_groups(ldap_query_groups_fixture) == (
+            ldap_model_groups_fixture
+        )
+        assert replay.search_users(ldap_query_users_fixture) == (
+            ldap_model_users_fixture
+        )
+        assert not (tmp_path / "snapshot.jsonl.partial").exists()
+
+    def test_record(
+        self,
+        tmp_path: Path,
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        ldif_path = tmp_path / "directory.ldif"
+        ldif_path.write_text(LDIF, encoding="utf-8")
+        source = file_source(ldif_path)
+        assert isinstance(source, LDIFSource)
+        recorder = SnapshotRecorder(source, tmp_path / "snapshot.jsonl")
+        users = recorder.search_users(ldap_query_users_fixture)
+        assert (
+            SnapshotSource(recorder.path).search_users(
+                ldap_query_users_fixture,
+            )
+            == users
+        )
+
+    def test_record_single_phase(
+        self,
+        tmp_path: Path,
+        ldap_model_users_fixture: list[LDAPUser],
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        path = tmp_path / "snapshot.jsonl"
+        recorder = SnapshotRecorder(SnapshotSource(path), path)
+        recorder.users = ldap_model_users_fixture
+        recorder.save()
+        recorder.source = SnapshotSource(path)
+        # Replace the source with one that only returns the requested fields
+        user = ldap_model_users_fixture[0]
+        recorder.source.search_users = lambda *_, **__: [  # type: ignore[method-assign]
+            LDAPUser(
+                display_name="",
+                member_of=["CN=defendants,OU=groups,DC=rome,DC=la"],
+                name=user.name,
+                uid=user.uid,
+            ),
+        ]
+        recorder.search_users(ldap_query_users_fixture, attributes=["uid", "memberOf"])
+
+        # Fields that were not requested keep their recorded values
+        (replayed,) = SnapshotSource(path).search_users(ldap_query_users_fixture)
+        assert replayed == dataclasses.replace(
+            user,
+            member_of=["CN=defendants,OU=groups,DC=rome,DC=la"],
+        )
+
+    def test_intern_table(
+        self,
+        tmp_path: Path,
+        ldap_model_users_fixture: list[LDAPUser],
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        path = tmp_path / "snapshot.jsonl"
+        recorder = SnapshotRecorder(SnapshotSource(path), path)
+        recorder.users = ldap_model_users_fixture
+        recorder.save()
+        users = SnapshotSource(path, intern_table=InternTable()).search_users(
+            ldap_query_users_fixture,
+        )
+        assert isinstance(users[0].member_of, InternedArray)
+        assert users == ldap_model_users_fixture
+
+    def test_invalid_snapshot(
+        self,
+        tmp_path: Path,
+        ldap_query_users_fixture: LDAPQuery,
+    ) -> None:
+        path = tmp_path / "snapshot.jsonl"
+        path.write_text('{"type": "user", "name": "aulus.agerius"}\n', encoding="utf-8")
+        with pytest.raises(LDAPError, match="Unable to read snapshot"):
+            SnapshotSource(path).search_users(ldap_query_users_fixture)
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# Modules that are slow to import and are only needed once synchronisation starts
+HEAVY_MODULES = ("ldap3", "psycopg", "sqlalchemy", "sqlparse")
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """Run a statement in a new interpreter and return each module's import time.
+
+    Times are cumulative, in microseconds, as reported by `python -X importtime`.
+    """
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup:
+    """Test which modules are imported at startup."""
+
+    def test_import_synchronise(self) -> None:
+        modules = import_times("import synchronise")
+        assert "synchronise" in modules
+        assert not [
+            module
+            for module in modules
+            if module.partition(".")[0] in HEAVY_MODULES
+            or module.startswith("guacamole_user_sync.aio")
+        ]
+
+    @pytest.mark.parametrize(
+        ("name", "module"),
+        [
+            ("PostgreSQLClient", "guacamole_user_sync.postgresql.postgresql_client"),
+            ("SchemaVersion", "guacamole_user_sync.postgresql.schema_version"),
+        ],
+    )
+    def test_lazy_attributes(self, name: str, module: str) -> None:
+        modules = import_times(f"from guacamole_user_sync.postgresql import {name}")
+        assert module in modules
+        assert ("sqlalchemy" in modules) is (name == "PostgreSQLClient")
+
+    def test_synchronous_clients(self) -> None:
+        # Synchronous synchronisation does not need the asyncio extensions
+        modules = import_times(
+            "from guacamole_user_sync.tenants import MultiTenantSynchroniser",
+        )
+        assert "sqlalchemy" in modules
+        assert "guacamole_user_sync.aio" not in modules
+        assert "sqlalchemy.ext.asyncio" not in modules
+        assert "sqlparse" not in modules
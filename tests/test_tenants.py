@@ -0,0 +1,394 @@
+import asyncio
+import dataclasses
+import logging
+from collections.abc import Collection
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from guacamole_user_sync.aio import AsyncLDAPClient, AsyncPostgreSQLClient
+from guacamole_user_sync.ldap import LDAPClient
+from guacamole_user_sync.models import (
+    InternTable,
+    LDAPQuery,
+    PermissionRule,
+    SyncPhase,
+)
+from guacamole_user_sync.postgresql import PostgreSQLClient
+from guacamole_user_sync.scheduling import SyncOutcome, SyncScheduler, SyncTrigger
+from guacamole_user_sync.sources import LDIFSource, SnapshotRecorder
+from guacamole_user_sync.tenants import MultiTenantSynchroniser, TenantConfig
+
+from .mocks import MockLDAPConnection, MockLDAPGroupEntry, MockLDAPServer
+
+
+def tenant_config(name: str, **kwargs: Any) -> TenantConfig:  # noqa: ANN401
+    return TenantConfig(
+        name=name,
+        ldap_group_base_dn=kwargs.get("ldap_group_base_dn", "OU=groups,DC=rome,DC=la"),
+        ldap_group_filter="(objectClass=posixGroup)",
+        ldap_host=kwargs.get("ldap_host", "ldap.rome.la"),
+        ldap_user_base_dn="OU=users,DC=rome,DC=la",
+        ldap_user_filter="(objectClass=posixAccount)",
+        postgresql_host_name=f"{name}.rome.la",
+        postgresql_password="password",  # noqa: S106
+        postgresql_user_name="guacamole",
+    )
+
+
+class TestTenantConfig:
+    """Test TenantConfig."""
+
+    def test_from_env(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        for name, value in {
+            "LDAP_GROUP_BASE_DN": "OU=groups,DC=rome,DC=la;OU=legions,DC=rome,DC=la",
+            "LDAP_GROUP_FILTER": "(objectClass=posixGroup)",
+            "LDAP_HOST": "ldap1.rome.la, ldap2.rome.la",
+            "LDAP_PORT": "636",
+            "LDAP_USER_BASE_DN": "OU=users,DC=rome,DC=la",
+            "LDAP_USER_FILTER": "(objectClass=posixAccount)",
+            "POSTGRESQL_HOST": "db.rome.la",
+            "POSTGRESQL_PASSWORD": "password",
+            "POSTGRESQL_USERNAME": "guacamole",
+        }.items():
+            monkeypatch.setenv(name, value)
+        config = TenantConfig.from_env()
+        assert config.ldap_hostnames == ("ldap1.rome.la:636", "ldap2.rome.la:636")
+        assert config.ldap_group_query == LDAPQuery(
+            base_dn="OU=groups,DC=rome,DC=la",
+            filter="(objectClass=posixGroup)",
+            id_attr="cn",
+            extra_base_dns=("OU=legions,DC=rome,DC=la",),
+        )
+        assert config.postgresql_port == 5432  # noqa: PLR2004
+
+    def test_from_env_attribute_map(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        for name, value in {
+            "LDAP_GROUP_BASE_DN": "OU=groups,DC=rome,DC=la",
+            "LDAP_GROUP_FILTER": "(objectClass=posixGroup)",
+            "LDAP_HOST": "ldap.rome.la",
+            "LDAP_USER_ATTRIBUTE_MAP": "department, extensionAttribute1=cost-centre",
+            "LDAP_USER_BASE_DN": "OU=users,DC=rome,DC=la",
+            "LDAP_USER_FILTER": "(objectClass=posixAccount)",
+            "POSTGRESQL_HOST": "db.rome.la",
+            "POSTGRESQL_PASSWORD": "password",
+            "POSTGRESQL_USERNAME": "guacamole",
+        }.items():
+            monkeypatch.setenv(name, value)
+        config = TenantConfig.from_env()
+        assert config.ldap_user_query.attribute_map == (
+            ("department", "department"),
+            ("extensionAttribute1", "cost-centre"),
+        )
+        assert config.ldap_group_query.attribute_map == ()
+
+    def test_from_env_missing(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("LDAP_GROUP_BASE_DN", raising=False)
+        with pytest.raises(ValueError, match="LDAP_GROUP_BASE_DN is not defined"):
+            TenantConfig.from_env()
+
+    def test_load(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        monkeypatch.setenv("TEST_TENANT_PASSWORD", "secret")
+        path = tmp_path / "tenants.toml"
+        path.write_text(
+            """\
+[defaults]
+ldap_host = "ldap.rome.la"
+ldap_user_base_dn = "OU=users,DC=rome,DC=la"
+ldap_user_filter = "(objectClass=posixAccount)"
+postgresql_password_env = "TEST_TENANT_PASSWORD"
+postgresql_user_name = "guacamole"
+[[tenants]]
+name = "senate"
+ldap_group_base_dn = "OU=senate,DC=rome,DC=la"
+ldap_group_filter = "(objectClass=posixGroup)"
+postgresql_host_name = "senate.rome.la"
+ldap_shard_by_initial = true
+[[tenants]]
+name = "legion"
+ldap_group_base_dn = "OU=legion,DC=rome,DC=la"
+ldap_group_filter = "(objectClass=posixGroup)"
+postgresql_host_name = "legion.rome.la"
+[[tenants.permissions]]
+connection = "castra"
+group = "legionaries"
+permissions = ["READ"]
+""",
+        )
+        senate, legion = TenantConfig.load(path)
+        assert senate.postgresql_password == "secret"  # noqa: S105
+        assert senate.ldap_user_query.filter_partitions
+        assert legion.ldap_user_base_dn == "OU=users,DC=rome,DC=la"
+        assert not legion.ldap_user_query.filter_partitions
+        assert not senate.permissions
+        assert legion.permissions == [
+            PermissionRule(connection="castra", group="legionaries"),
+        ]
+
+    def test_load_invalid(self, tmp_path: Path) -> None:
+        path = tmp_path / "tenants.toml"
+        path.write_text('[[tenants]]\nname = "senate"\n')
+        with pytest.raises(ValueError, match="Invalid configuration for tenant senate"):
+            TenantConfig.load(path)
+
+    def test_load_invalid_permission(self, tmp_path: Path) -> None:
+        path = tmp_path / "tenants.toml"
+        path.write_text(
+            """\
+[[tenants]]
+name = "senate"
+[[tenants.permissions]]
+group = "senators"
+""",
+        )
+        with pytest.raises(ValueError, match="Invalid configuration for tenant senate"):
+            TenantConfig.load(path)
+
+    def test_load_empty(self, tmp_path: Path) -> None:
+        path = tmp_path / "tenants.toml"
+        path.write_text("")
+        with pytest.raises(ValueError, match="No tenants are defined"):
+            TenantConfig.load(path)
+
+
+class TestMultiTenantSynchroniser:
+    """Test MultiTenantSynchroniser."""
+
+    def test_shared_ldap_clients(self) -> None:
+        synchroniser = MultiTenantSynchroniser(
+            [
+                tenant_config("senate"),
+                tenant_config("legion"),
+                tenant_config("navy", ldap_host="ldap.ostia.la"),
+            ],
+            lambda **_: SyncOutcome.UNCHANGED,
+        )
+        assert len(synchroniser.tenants) == 3  # noqa: PLR2004
+        assert len(synchroniser.ldap_clients) == 2  # noqa: PLR2004
+        senate, legion, navy = synchroniser.tenants
+        assert senate.ldap_client is legion.ldap_client
+        assert senate.ldap_client is not navy.ldap_client
+        assert senate.postgresql_client is not legion.postgresql_client
+
+    def test_intern_memberships(self) -> None:
+        synchroniser = MultiTenantSynchroniser(
+            [
+                dataclasses.replace(tenant_config(name), ldap_intern_memberships=True)
+                for name in ("senate", "legion")
+            ],
+            lambda **_: SyncOutcome.UNCHANGED,
+        )
+        senate, legion = synchroniser.tenants
+        # Tenants sharing an LDAP client share its intern table too
+        assert isinstance(senate.ldap_client, LDAPClient)
+        assert isinstance(senate.ldap_client.intern_table, InternTable)
+        assert senate.ldap_client is legion.ldap_client
+
+    def test_file_sources(self, tmp_path: Path) -> None:
+        source_file = str(tmp_path / "directory.ldif")
+        synchroniser = MultiTenantSynchroniser(
+            [
+                dataclasses.replace(
+                    tenant_config("senate"),
+                    ldap_source_file=source_file,
+                ),
+                dataclasses.replace(
+                    tenant_config("legion"),
+                    ldap_snapshot_file=str(tmp_path / "legion.jsonl"),
+                    ldap_source_file=source_file,
+                ),
+            ],
+            lambda **_: SyncOutcome.UNCHANGED,
+        )
+        senate, legion = synchroniser.tenants
+        assert isinstance(senate.ldap_client, LDIFSource)
+        assert isinstance(legion.ldap_client, SnapshotRecorder)
+        assert legion.ldap_client.source is senate.ldap_client
+        assert list(synchroniser.ldap_clients.values()) == [senate.ldap_client]
+
+    def test_run_cycle_reuses_ldap_results(
+        self,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        connections: list[MockLDAPConnection] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(
+                MockLDAPConnection(server=MockLDAPServer(ldap_response_groups_fixture)),
+            )
+            return connections[-1]
+
+        def synchronise(
+            *,
+            ldap_client: LDAPClient,
+            ldap_group_query: LDAPQuery,
+            **_: Any,  # noqa: ANN401
+        ) -> SyncOutcome:
+            ldap_client.search_groups(ldap_group_query)
+            return SyncOutcome.UNCHANGED
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        synchroniser = MultiTenantSynchroniser(
+            [tenant_config(name) for name in ("senate", "legion", "navy")],
+            synchronise,
+            max_workers=2,
+        )
+        assert synchroniser.run_cycle() == SyncOutcome.UNCHANGED
+        assert len(connections) == 1
+
+    @pytest.mark.parametrize(
+        ("outcomes", "expected"),
+        [
+            ([SyncOutcome.UNCHANGED, SyncOutcome.CHANGED], SyncOutcome.CHANGED),
+            ([SyncOutcome.FAILED, SyncOutcome.CHANGED], SyncOutcome.CHANGED),
+            ([SyncOutcome.FAILED, SyncOutcome.UNCHANGED], SyncOutcome.FAILED),
+            ([SyncOutcome.SKIPPED, SyncOutcome.UNCHANGED], SyncOutcome.UNCHANGED),
+            ([SyncOutcome.SKIPPED, SyncOutcome.SKIPPED], SyncOutcome.SKIPPED),
+        ],
+    )
+    def test_run_cycle_outcome(
+        self,
+        outcomes: list[SyncOutcome],
+        expected: SyncOutcome,
+    ) -> None:
+        results = dict(zip(["senate", "legion"], outcomes, strict=True))
+        synchroniser = MultiTenantSynchroniser(
+            [tenant_config(name) for name in results],
+            lambda **kwargs: results[
+                (
+                    "senate"
+                    if kwargs["postgresql_client"].backend.connection_details.host_name
+                    == "senate.rome.la"
+                    else "legion"
+                )
+            ],
+        )
+        assert synchroniser.run_cycle() == expected
+
+    def test_run_cycle_phases(self) -> None:
+        calls: list[frozenset[SyncPhase]] = []
+        outcomes = [SyncOutcome.UNCHANGED, SyncOutcome.FAILED, SyncOutcome.UNCHANGED]
+
+        def synchronise(
+            *,
+            phases: frozenset[SyncPhase],
+            **_: Any,  # noqa: ANN401
+        ) -> SyncOutcome:
+            calls.append(phases)
+            return outcomes[len(calls) - 1]
+
+        synchroniser = MultiTenantSynchroniser(
+            [tenant_config("senate")],
+            synchronise,
+            phase_intervals={
+                SyncPhase.GROUPS: 86400,
+                SyncPhase.MEMBERSHIPS: 0,
+                SyncPhase.USERS: 86400,
+            },
+        )
+        synchroniser.run_cycle()
+        synchroniser.run_cycle()
+        # Phases that failed are retried in the next cycle
+        synchroniser.run_cycle()
+        assert calls == [
+            frozenset({SyncPhase.GROUPS, SyncPhase.MEMBERSHIPS, SyncPhase.USERS}),
+            frozenset({SyncPhase.MEMBERSHIPS}),
+            frozenset({SyncPhase.MEMBERSHIPS}),
+        ]
+
+    def test_run_cycle_triggered(
+        self,
+        ldap_response_groups_fixture: list[MockLDAPGroupEntry],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        connections: list[MockLDAPConnection] = []
+        updates: list[Collection[SyncPhase]] = []
+
+        def connect(_: LDAPClient) -> MockLDAPConnection:
+            connections.append(
+                MockLDAPConnection(server=MockLDAPServer(ldap_response_groups_fixture)),
+            )
+            return connections[-1]
+
+        def synchronise(
+            *,
+            ldap_client: LDAPClient,
+            ldap_group_query: LDAPQuery,
+            phases: frozenset[SyncPhase],
+            postgresql_client: PostgreSQLClient,
+            **_: Any,  # noqa: ANN401
+        ) -> SyncOutcome:
+            groups = ldap_client.search_groups(ldap_group_query)
+            postgresql_client.update(groups=groups, users=[], phases=phases)
+            return SyncOutcome.UNCHANGED
+
+        def update(
+            _: PostgreSQLClient,
+            *,
+            phases: Collection[SyncPhase],
+            **__: Any,  # noqa: ANN401
+        ) -> int:
+            updates.append(phases)
+            return 0
+
+        monkeypatch.setattr(LDAPClient, "connect", connect)
+        monkeypatch.setattr(PostgreSQLClient, "update", update)
+        synchroniser = MultiTenantSynchroniser(
+            [tenant_config("senate")],
+            synchronise,
+            phase_intervals=dict.fromkeys(SyncPhase, 300),
+            phase_tolerance=150,
+        )
+        trigger = SyncTrigger(coalesce_window=0)
+        trigger.request("test")
+        scheduler = SyncScheduler(300, jitter=0, trigger=trigger)
+        scheduler.run(synchroniser.run_cycle, max_cycles=2)
+
+        # The triggered cycle starts before any phase is due but still synchronises
+        assert len(connections) == 2  # noqa: PLR2004
+        assert updates == [
+            frozenset(SyncPhase),
+            frozenset({SyncPhase.GROUPS, SyncPhase.MEMBERSHIPS, SyncPhase.USERS}),
+        ]
+
+    def test_run_cycle_async(self) -> None:
+        clients: list[Any] = []
+
+        async def synchronise(
+            *,
+            ldap_client: AsyncLDAPClient,
+            postgresql_client: AsyncPostgreSQLClient,
+            **_: Any,  # noqa: ANN401
+        ) -> SyncOutcome:
+            await asyncio.sleep(0)
+            clients.append((ldap_client, postgresql_client))
+            return SyncOutcome.CHANGED
+
+        synchroniser = MultiTenantSynchroniser(
+            [tenant_config(name) for name in ("senate", "legion")],
+            synchronise,
+        )
+        assert synchroniser.is_async
+        assert synchroniser.run_cycle() == SyncOutcome.CHANGED
+        runner = synchroniser.runner
+        assert synchroniser.run_cycle() == SyncOutcome.CHANGED
+        # The event loop is kept between cycles
+        assert synchroniser.runner is runner
+        assert len(clients) == 4  # noqa: PLR2004
+        assert all(isinstance(client, AsyncLDAPClient) for client, _ in clients)
+        synchroniser.close()
+        assert synchroniser.runner is None
+
+    def test_run_cycle_exception(self, caplog: pytest.LogCaptureFixture) -> None:
+        caplog.set_level(logging.INFO)
+
+        def synchronise(**_: Any) -> SyncOutcome:  # noqa: ANN401
+            msg = "Unexpected"
+            raise RuntimeError(msg)
+
+        synchroniser = MultiTenantSynchroniser([tenant_config("senate")], synchronise)
+        assert synchroniser.run_cycle() == SyncOutcome.FAILED
+        assert "Unexpected error synchronising 'senate'." in caplog.text
+        assert "Finished synchronising 1 tenant(s): 1 failed" in caplog.text